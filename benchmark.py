@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+"""
+End-to-end benchmark of the video pipeline.
+
+Plays a local video file through the VideoService, takes the display
+frames from ServiceManager.get_frame(), draws their annotations and
+encodes them to JPEG in each configured rendition, as the broadcast
+service does for viewers of every rendition.  Logging, monitoring and the web
+server are not started.  Reports the throughput and latency of each
+stage, dropped frames, peak memory and the pipeline's metrics as JSON.
+
+    python benchmark.py traffic.mp4 --detector stub --model 50 --duration 60
+    python benchmark.py traffic.mp4 --detector opencv --model tinyyolo --realtime
+    python benchmark.py traffic.mp4 --set INFERENCE_WORKERS=2 --set BATCH_SIZE=4 --output run.json
+
+Frames are read once the detector is loaded and warmed up.  By default
+they are read and displayed as fast as the pipeline can take them.
+With --realtime the file is read at its own frame rate and the display
+is paced as in the web application.
+"""
+import argparse
+import json
+import logging
+import resource
+import sys
+import threading
+import time
+
+import numpy as np
+import yaml
+
+from modules.services.config_service import ConfigYAML
+from modules.services.frame_pacer import FramePacer
+from modules.services.inference_service import InferenceService
+from modules.services.service_manager import ServiceManager
+from modules.services.metrics import METRICS
+from modules.services.renditions import encode
+
+logger = logging.getLogger('app')
+
+
+class StageStats:
+    """Counts the items passing a stage and keeps their latencies"""
+
+    def __init__(self):
+        self._latencies = []
+        self._failed = 0
+        self._lock = threading.Lock()
+
+    def add(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def fail(self):
+        with self._lock:
+            self._failed += 1
+
+    def summary(self, elapsed: float) -> dict:
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            failed = self._failed
+        summary = {'count': len(latencies),
+                   'per_sec': round(len(latencies) / elapsed, 2) if elapsed else 0.0}
+        if failed:
+            summary['failed'] = failed
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+            summary.update({'p50_ms': round(float(p50), 2),
+                            'p95_ms': round(float(p95), 2),
+                            'p99_ms': round(float(p99), 2),
+                            'max_ms': round(float(latencies.max()), 2)})
+        return summary
+
+
+class BenchmarkInference(InferenceService):
+    """InferenceService that records the latency of every detection"""
+
+    def __init__(self, *args, **kwargs):
+        InferenceService.__init__(self, *args, **kwargs)
+        self.stats = StageStats()
+
+    def _return_results(self, results: list):
+        for _, _, detections, latency in results:
+            if detections is None:
+                self.stats.fail()
+            else:
+                self.stats.add(latency)
+        InferenceService._return_results(self, results)
+
+
+class UnpacedFramePacer(FramePacer):
+    """Lets every frame through at once, to measure the pipeline at full speed"""
+
+    def pace(self, pts: float, droppable: bool = True) -> bool:
+        return True
+
+
+class BenchmarkManager(ServiceManager):
+    """
+    ServiceManager with only the video service.  get_frame() records
+    the capture time of the frame it returns.
+    """
+
+    def __init__(self, config: ConfigYAML, inference: InferenceService, realtime: bool):
+        self._realtime = realtime
+        self.frame_time = None
+        ServiceManager.__init__(self, None, config, inference)
+
+    @property
+    def video_service(self):
+        return self._video_service
+
+    def get_frame(self) -> (bool, np.array):
+        success, image, detections, self.frame_time = self._video_service.get_next_frame()
+        return success, image
+
+    def get_video_service(self, **kwargs):
+        return ServiceManager.get_video_service(self, realtime=self._realtime, **kwargs)
+
+    def get_frame_pacer(self, latency=None, max_lag=None) -> FramePacer:
+        if not self._realtime:
+            return UnpacedFramePacer()
+        return ServiceManager.get_frame_pacer(self, latency, max_lag)
+
+    def get_detection_store(self, *args, **kwargs):
+        return None
+
+    def get_logging_service(self, *args, **kwargs):
+        return None
+
+    def get_monitor_service(self, *args, **kwargs):
+        return None
+
+    def get_broadcast_service(self, *args, **kwargs):
+        return None
+
+
+def _peak_rss_mb() -> dict:
+    """Peak resident memory of this process and of its finished children, e.g. inference processes"""
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS
+    return {'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+            'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)}
+
+
+def get_config(args) -> ConfigYAML:
+    with open(args.config) as fp:
+        params = yaml.load(fp, Loader=yaml.BaseLoader)
+    params.pop('CAM_STREAMS', None)
+    params.update({'NAME': 'benchmark',
+                   'CAM_STREAM': args.video,
+                   'DETECTOR_NAME': args.detector,
+                   'DETECTOR_MODEL': args.model})
+    for setting in args.set:
+        key, _, val = setting.partition('=')
+        params[key.strip()] = yaml.load(val, Loader=yaml.BaseLoader)
+    return ConfigYAML(**params)
+
+
+def run(args) -> dict:
+    config = get_config(args)
+    inference = BenchmarkInference(name="inference-service",
+                                   detector_name=(config.DETECTOR_NAME,),
+                                   detector_model=(config.DETECTOR_MODEL,),
+                                   workers=config.INFERENCE_WORKERS,
+                                   mode=config.INFERENCE_MODE,
+                                   batch_size=config.BATCH_SIZE,
+                                   batch_wait=config.BATCH_WAIT_MS / 1000)
+    sm = BenchmarkManager(config, inference, args.realtime)
+    video = sm.video_service
+
+    display, render, encoding, end_to_end = StageStats(), StageStats(), StageStats(), StageStats()
+    renditions = {r.name: StageStats() for r in config.RENDITIONS}
+    encoded_bytes = dict.fromkeys(renditions, 0)
+
+    inference.start()
+    if not inference.wait(timeout=args.load_timeout):
+        inference.stop()
+        raise SystemExit("detector not ready: {}".format(inference.status))
+    video.start()
+    start = last_frame = time.monotonic()
+    while time.monotonic() - start < args.duration:
+        t0 = time.perf_counter()
+        success, image = sm.get_frame()
+        t1 = time.perf_counter()
+        if not success:
+            # the end of the file, or the pipeline stalled
+            if time.monotonic() - last_frame > args.idle_timeout:
+                break
+            continue
+        display.add(t1 - t0)
+
+        image = video.render_frame()
+        t2 = time.perf_counter()
+        render.add(t2 - t1)
+
+        scaled = {}
+        for rendition in config.RENDITIONS:
+            t3 = time.perf_counter()
+            jpeg = encode(image, rendition, scaled)
+            renditions[rendition.name].add(time.perf_counter() - t3)
+            encoded_bytes[rendition.name] += len(jpeg)
+        encoding.add(time.perf_counter() - t2)
+        end_to_end.add(time.time() - sm.frame_time)
+        last_frame = time.monotonic()
+    elapsed = last_frame - start
+
+    video.stop()
+    inference.stop()
+    video.join(timeout=5)
+
+    frames = display.summary(elapsed)['count']
+    return {'video': args.video,
+            'detector': config.DETECTOR_NAME,
+            'model': config.DETECTOR_MODEL,
+            'mode': 'realtime' if args.realtime else 'max',
+            'inference': {'workers': inference.num_workers,
+                          'load_s': inference.status['load_s'],
+                          'warmup_s': inference.status['warmup_s'],
+                          'mode': inference.mode,
+                          'batch_size': config.BATCH_SIZE,
+                          'batch_wait_ms': config.BATCH_WAIT_MS},
+            'elapsed_s': round(elapsed, 2),
+            'stages': {'capture': {'count': video.frames_captured,
+                                   'per_sec': round(video.frames_captured / elapsed, 2) if elapsed else 0.0,
+                                   'grabbed': video.reader.grabbed,
+                                   'decoded': video.reader.decoded,
+                                   'reconnects': video.reader.reconnects},
+                       'detection': inference.stats.summary(elapsed),
+                       'display': display.summary(elapsed),
+                       'render': render.summary(elapsed),
+                       'encode': dict(encoding.summary(elapsed),
+                                      renditions={name: dict(stats.summary(elapsed),
+                                                             avg_kb=round(encoded_bytes[name] / 1024 / frames, 1)
+                                                             if frames else 0.0)
+                                                  for name, stats in renditions.items()})},
+            'end_to_end': end_to_end.summary(elapsed),
+            'dropped': {'capture': video.capture_dropped,
+                        'display': video.display_dropped},
+            'final_dpm': round(video.dpm, 2),
+            'metrics': METRICS.snapshot(),
+            'peak_rss_mb': _peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the video pipeline with a local video file.")
+    parser.add_argument('video', help="path of a video file")
+    parser.add_argument('--detector', default='stub', help="DETECTOR_NAME: 'stub', 'imageai' or 'opencv'")
+    parser.add_argument('--model', default='50',
+                        help="DETECTOR_MODEL, or the latency in milliseconds of the stub detector")
+    parser.add_argument('--config', default='config/default.yaml', help="YAML configuration to start from")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help="override a configuration parameter, may be repeated")
+    parser.add_argument('--realtime', action='store_true', help="read the file at its own frame rate")
+    parser.add_argument('--duration', type=float, default=30.0, help="longest run time in seconds")
+    parser.add_argument('--idle-timeout', type=float, default=3.0,
+                        help="seconds without a frame after which the run ends")
+    parser.add_argument('--load-timeout', type=float, default=300.0,
+                        help="seconds to wait for the detector to load and warm up")
+    parser.add_argument('--output', help="write the report to this file instead of stdout")
+    parser.add_argument('--verbose', action='store_true', help="show the application log")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
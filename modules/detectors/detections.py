@@ -0,0 +1,181 @@
+"""
+Detections of a frame as a NumPy structured array.
+
+Detectors return one array per frame with a row per detected object:
+its class id, score (0-1) and (x1, y1, x2, y2) box in frame pixels.
+The tracker fills in the track id, 0 for untracked objects, and flags
+the first detection of each track.  Filtering, suppression, merging and
+counting work on whole arrays, and arrays are compact to send between
+processes.  Detections are converted to ImageAI's dictionaries
+('name', 'percentage_probability', 'box_points') only where they leave
+the application as JSON.
+
+Class ids index CLASS_NAMES.  The COCO classes come first, in the order
+of the YOLO models, so the ids of a detector in another process match.
+Detectors with other classes register them when they load.
+"""
+import threading
+
+import numpy as np
+
+DETECTION_DTYPE = np.dtype([('class_id', np.int16),
+                            ('score', np.float32),
+                            ('box', np.int32, (4,)),
+                            ('track_id', np.int32),
+                            ('new_track', np.bool_)])
+
+# COCO classes in the order of the Darknet and ONNX YOLO models
+COCO_NAMES = ['person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat',
+              'traffic light', 'fire hydrant', 'stop sign', 'parking meter', 'bench', 'bird', 'cat', 'dog',
+              'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra', 'giraffe', 'backpack', 'umbrella',
+              'handbag', 'tie', 'suitcase', 'frisbee', 'skis', 'snowboard', 'sports ball', 'kite',
+              'baseball bat', 'baseball glove', 'skateboard', 'surfboard', 'tennis racket', 'bottle',
+              'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple', 'sandwich', 'orange',
+              'broccoli', 'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair', 'couch', 'potted plant', 'bed',
+              'dining table', 'toilet', 'tv', 'laptop', 'mouse', 'remote', 'keyboard', 'cell phone',
+              'microwave', 'oven', 'toaster', 'sink', 'refrigerator', 'book', 'clock', 'vase', 'scissors',
+              'teddy bear', 'hair dryer', 'toothbrush']
+
+CLASS_NAMES = list(COCO_NAMES)
+_class_ids = {name: i for i, name in enumerate(CLASS_NAMES)}
+_lock = threading.Lock()
+
+
+def _normalize(name: str) -> str:
+    """Class names are kept with spaces; trained objects are named with underscores"""
+    return name.replace('_', ' ')
+
+
+def register_classes(names: list) -> np.array:
+    """
+    Add the classes a detector reports to CLASS_NAMES.
+    :return: class id of each name, in the order of 'names'
+    """
+    with _lock:
+        for name in names:
+            name = _normalize(name)
+            if name not in _class_ids:
+                _class_ids[name] = len(CLASS_NAMES)
+                CLASS_NAMES.append(name)
+        return np.array([_class_ids[_normalize(n)] for n in names], dtype=np.int16)
+
+
+def class_ids(names) -> np.array:
+    """Ids of the known classes among 'names'"""
+    return np.array([_class_ids[n] for n in map(_normalize, names) if n in _class_ids], dtype=np.int16)
+
+
+def class_name(class_id: int) -> str:
+    return CLASS_NAMES[class_id]
+
+
+def empty() -> np.array:
+    return np.zeros(0, dtype=DETECTION_DTYPE)
+
+
+def create(class_id: np.array, score: np.array, box: np.array) -> np.array:
+    """Detections from parallel arrays of class ids, scores (0-1) and (x1, y1, x2, y2) boxes"""
+    detections = np.zeros(len(class_id), dtype=DETECTION_DTYPE)
+    detections['class_id'] = class_id
+    detections['score'] = score
+    detections['box'] = np.asarray(box).reshape(-1, 4)
+    return detections
+
+
+def from_dicts(dicts: list) -> np.array:
+    """Detections from ImageAI's list of dictionaries"""
+    if not dicts:
+        return empty()
+    return create(register_classes([d['name'] for d in dicts]),
+                  [d['percentage_probability'] / 100 for d in dicts],
+                  [d['box_points'] for d in dicts])
+
+
+def to_dicts(detections: np.array) -> list:
+    """ImageAI style dictionaries of the detections, with 'track_id' and 'new_track' if they are tracked"""
+    dicts = []
+    for class_id, score, box, track_id, new_track in zip(*(detections[f].tolist() for f in DETECTION_DTYPE.names)):
+        d = {'name': CLASS_NAMES[class_id],
+             'percentage_probability': round(score * 100, 2),
+             'box_points': box}
+        if track_id:
+            d.update(track_id=track_id, new_track=new_track)
+        dicts.append(d)
+    return dicts
+
+
+def select(detections: np.array, min_score: float = None, classes: set = None) -> np.array:
+    """Detections with at least 'min_score' and of one of the class names in 'classes'"""
+    keep = np.ones(len(detections), dtype=bool)
+    if min_score is not None:
+        keep &= detections['score'] >= min_score
+    if classes is not None:
+        keep &= np.isin(detections['class_id'], class_ids(classes))
+    return detections[keep]
+
+
+def contains(detections: np.array, classes: set) -> bool:
+    """Whether any detection is of one of the class names in 'classes'"""
+    return bool(len(detections)) and bool(np.isin(detections['class_id'], class_ids(classes)).any())
+
+
+def clip(detections: np.array, shape: tuple) -> np.array:
+    """Limit the boxes to a frame of 'shape', in place"""
+    h, w = shape[:2]
+    np.clip(detections['box'], 0, (w, h, w, h), out=detections['box'])
+    return detections
+
+
+def offset(detections: np.array, x: int, y: int) -> np.array:
+    """Copy of the detections with their boxes moved by (x, y)"""
+    moved = detections.copy()
+    moved['box'] += (x, y, x, y)
+    return moved
+
+
+def iou(box: np.array, boxes: np.array) -> np.array:
+    """Intersection over union of one (x1, y1, x2, y2) box with each of 'boxes'"""
+    inter = intersection(box, boxes)
+    return inter / (area(box) + area(boxes) - inter + 1e-9)
+
+
+def nms(detections: np.array, iou_threshold: float) -> np.array:
+    """
+    Greedy non-max suppression within each class.  Boxes of different
+    classes are moved apart so that one pass never suppresses across
+    classes.
+    :return: the kept detections, most probable first
+    """
+    if len(detections) < 2:
+        return detections
+    boxes = detections['box'].astype(np.float64)
+    boxes += detections['class_id'][:, np.newaxis] * (boxes.max() - boxes.min() + 1)
+    order = detections['score'].argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        order = order[1:][iou(boxes[i], boxes[order[1:]]) <= iou_threshold]
+    return detections[keep]
+
+
+def count(detections: np.array, new_tracks: bool = False) -> dict:
+    """
+    Number of detections of each class name.
+    :param new_tracks: count only the first detection of each track
+    """
+    class_id = detections['class_id'][detections['new_track']] if new_tracks else detections['class_id']
+    counts = np.bincount(class_id, minlength=len(CLASS_NAMES))
+    return {CLASS_NAMES[i]: int(counts[i]) for i in np.nonzero(counts)[0]}
+
+
+def area(boxes: np.array) -> np.array:
+    """Areas of (x1, y1, x2, y2) boxes"""
+    return (boxes[..., 2] - boxes[..., 0]) * (boxes[..., 3] - boxes[..., 1])
+
+
+def intersection(box: np.array, boxes: np.array) -> np.array:
+    """Area of the intersection of one (x1, y1, x2, y2) box with each of 'boxes'"""
+    w = np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0])
+    h = np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1])
+    return np.maximum(0, w) * np.maximum(0, h)
@@ -1,13 +1,34 @@
 from abc import ABC, abstractmethod
 import numpy as np
+import cv2
+
+from modules.detectors.detections import CLASS_NAMES
+
+
+def draw_detections(frame: np.array, detections: np.array) -> np.array:
+    """Draw detection boxes and labels the way ImageAI annotates frames."""
+    for class_id, score, (x1, y1, x2, y2) in zip(detections['class_id'].tolist(), detections['score'].tolist(),
+                                                 detections['box'].tolist()):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
+        cv2.putText(frame, "{} : {}".format(CLASS_NAMES[class_id], round(score * 100, 1)),
+                    (x1, max(y1 - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 0, 0), 1)
+    return frame
 
 
 class Detector(ABC):
     """
     Abstract class for a detector.
     required methods:
-    > detect(frame_num:int, frame:np.array) -> int, np.array
-        - returns the frame number and frame with detections
+    > detect(frame:np.array, det_objs:set) -> np.array
+        - returns the detections of the frame
+    optional methods:
+    > detect_batch(frames:list, det_objs:set) -> list
+        - returns the detections of each frame
+
+    Detections are structured arrays of DETECTION_DTYPE, see
+    modules.detectors.detections, or None if detection failed.
+    Detectors leave the frames untouched; the annotations are drawn
+    from the detections where frames are displayed or saved.
     """
 
     def __init__(self, detector_name: str, model_name: str):
@@ -26,15 +47,26 @@ class Detector(ABC):
         return self._model_name
 
     @abstractmethod
-    def detect(self, frame: np.array, det_objs: set) -> (int, np.array, list):
+    def detect(self, frame: np.array, det_objs: set) -> np.array:
         """
         Each supported detector must override this method.
         :frame: np.array) - frame from which to detect objects
         :det_objs: set - set of object names which should be detected
-        Returns frame number, frame and detections
+        Returns detections array, or None if detection failed
         """
         ...
 
+    def detect_batch(self, frames: list, det_objs: set = None) -> list:
+        """
+        Detectors that can run inference on several images in one pass
+        should override this method.  The default calls detect() for
+        each frame.
+        :frames: list of np.array frames from which to detect objects
+        :det_objs: set - set of object names which should be detected
+        Returns list of detections arrays, or None, in the order of 'frames'
+        """
+        return [self.detect(frame=frame, det_objs=det_objs) for frame in frames]
+
     @abstractmethod
     def get_trained_objects(self) -> set:
         """
@@ -1,7 +1,6 @@
 import logging
 
 from modules.detectors.detector import Detector
-from modules.detectors.detector_imageai import DetectorImageai
 
 
 class DetectorFactory:
@@ -12,9 +11,18 @@ class DetectorFactory:
         Returns Detector object.
         Update this function to add new detection models.
         New models will require new class that inherits from Detector class.
+        Detector modules are imported here so that only the selected
+        detector's libraries are loaded.
         """
         logger = logging.getLogger('app')
         if detector_name[0] == 'imageai':
+            from modules.detectors.detector_imageai import DetectorImageai
             return DetectorImageai(detector_name[0], model_name[0])
+        elif detector_name[0] == 'opencv':
+            from modules.detectors.detector_opencv import DetectorOpencv
+            return DetectorOpencv(detector_name[0], model_name[0])
+        elif detector_name[0] == 'stub':
+            from modules.detectors.detector_stub import DetectorStub
+            return DetectorStub(detector_name[0], model_name[0])
         else:
             logger.info("Model not supported: {}/{}".format(detector_name[0], model_name[0]))
@@ -1,4 +1,5 @@
 import os
+import logging
 
 import numpy as np
 import cv2
@@ -6,6 +7,72 @@ import cv2
 
 import imageai.Detection
 from modules.detectors.detector import Detector
+from modules.detectors import detections as dets
+
+logger = logging.getLogger('app')
+
+# YOLOv3 anchors and output layer masks as used by ImageAI's keras-yolo3 models
+YOLO_ANCHORS = np.array([[10, 13], [16, 30], [33, 23], [30, 61], [62, 45],
+                         [59, 119], [116, 90], [156, 198], [373, 326]], dtype=np.float32)
+YOLO_MASKS = [[6, 7, 8], [3, 4, 5], [0, 1, 2]]
+TINY_YOLO_ANCHORS = np.array([[10, 14], [23, 27], [37, 58],
+                              [81, 82], [135, 169], [344, 319]], dtype=np.float32)
+TINY_YOLO_MASKS = [[3, 4, 5], [1, 2, 3]]
+YOLO_INPUT_SIZE = 416
+MIN_PROBABILITY = 60
+NMS_IOU = 0.45
+
+
+def _letterbox(frame: np.array, size: int) -> np.array:
+    """
+    Resize frame into a size x size float image keeping its aspect
+    ratio and padding with grey, the same as ImageAI's letterbox_image().
+    """
+    h, w = frame.shape[:2]
+    scale = min(size / w, size / h)
+    nw, nh = int(w * scale), int(h * scale)
+    boxed = np.full((size, size, 3), 128, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    boxed[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_CUBIC)
+    return boxed
+
+
+def _yolo_decode(outputs: list, anchors: np.array, masks: list, input_size: int,
+                 image_shape: tuple, index: int) -> (np.array, np.array, np.array):
+    """
+    Convert the raw YOLO output maps of image 'index' in a batch into
+    boxes in frame coordinates, scores and class ids.
+    """
+    h, w = image_shape[:2]
+    scale = min(input_size / w, input_size / h)
+    new_shape = np.array([h * scale, w * scale])
+    offset = (input_size - new_shape) / 2. / input_size
+    box_scale = input_size / new_shape
+
+    all_boxes, all_scores = [], []
+    for out, mask in zip(outputs, masks):
+        grid_h, grid_w = out.shape[1:3]
+        feats = out[index].reshape(grid_h, grid_w, len(mask), -1)
+
+        grid_y, grid_x = np.meshgrid(np.arange(grid_h), np.arange(grid_w), indexing='ij')
+        grid = np.stack((grid_x, grid_y), axis=-1)[:, :, np.newaxis, :]
+
+        box_xy = (1 / (1 + np.exp(-feats[..., :2])) + grid) / (grid_w, grid_h)
+        box_wh = np.exp(feats[..., 2:4]) * anchors[mask] / input_size
+        conf = 1 / (1 + np.exp(-feats[..., 4:5]))
+        class_probs = 1 / (1 + np.exp(-feats[..., 5:]))
+
+        # undo the letterbox (y, x order) and scale to the frame
+        box_yx = (box_xy[..., ::-1] - offset) * box_scale
+        box_hw = box_wh[..., ::-1] * box_scale
+        mins = (box_yx - box_hw / 2.) * (h, w)
+        maxes = (box_yx + box_hw / 2.) * (h, w)
+        boxes = np.concatenate((mins[..., 1:2], mins[..., 0:1], maxes[..., 1:2], maxes[..., 0:1]), axis=-1)
+
+        all_boxes.append(boxes.reshape(-1, 4))
+        all_scores.append((conf * class_probs).reshape(-1, class_probs.shape[-1]))
+
+    return np.concatenate(all_boxes), np.concatenate(all_scores)
 
 
 class DetectorImageai:
@@ -28,52 +95,111 @@ class DetectorImageai:
             Detector.__init__(self, detector_name, model_name)
             self.detector = self.get_detector(det_type='image')
             # self.detect_objects = self.get_detected_objects()
+            self._class_names = [o.replace(' ', '_') for o in self.detector.CustomObjects().keys()]
+            self._class_ids = dets.register_classes(self._class_names)
+            self._custom_objects = {}  # detected objects -> CustomObjects() marking them valid
 
-        def detect(self, frame: np.array, det_objs: set = None) -> (int, np.array, list):
+        def detect(self, frame: np.array, det_objs: set = None) -> np.array:
             """
             Required method of abstract class Detector.
-            Arguments include frame number and frame.
-            Returns frame_number, detection overlayed frame and detection list
+            YOLO models are run directly, as a batch of one frame, since
+            ImageAI's API always draws its own annotated copy of the frame.
+            Returns detections array, or None if detection failed
             """
+            if self._get_yolo_model() is not None:
+                return self.detect_batch([frame], det_objs)[0]
 
-            # Perform detection on frame
-            det_frame = detections = None
+            # Perform detection on frame; ImageAI's annotated frame is not used
+            detections = None
             try:
                 if det_objs is None:
-                    det_frame, detections = self.detector.detectObjectsFromImage(
+                    _, detections = self.detector.detectObjectsFromImage(
                         input_type="array",
                         minimum_percentage_probability=60,
                         input_image=frame,
                         output_type="array",
                         output_image_path='./logs/images/op_image.jpg')
                 else:
-                    objs = self.detector.CustomObjects()
-                    for o in det_objs:
-                        objs[o] = 'valid'
-
-                    det_frame, detections = self.detector.detectCustomObjectsFromImage(
-                        custom_objects=objs,
+                    _, detections = self.detector.detectCustomObjectsFromImage(
+                        custom_objects=self._get_custom_objects(det_objs),
                         input_type="array",
                         minimum_percentage_probability=60,
                         input_image=frame,
                         output_type="array",
                         output_image_path='./logs/images/op_image.jpg')
 
-                cv2.putText(det_frame,
-                            "{}".format("counting detections.."),
-                            (10, 30),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            0.4,
-                            (0, 0, 200),
-                            1)
+                detections = dets.from_dicts(detections)
 
             except Exception as e:
-                print("frame shape: {}".format(frame.shape))
-                print("detect objects: {}".format(type(det_objs)))
-                print("Detector: {}".format(self.detector))
-                print("{} // detect(): {}".format(self.DETECTOR_NAME, e))
+                logger.error("{} // detect(): {} (frame shape: {}, objects: {})".format(
+                    self.DETECTOR_NAME, e, frame.shape, det_objs))
+
+            return detections
+
+        def _get_custom_objects(self, det_objs: set) -> dict:
+            """ImageAI's CustomObjects() with 'det_objs' valid, built once per set of objects"""
+            key = frozenset(det_objs)
+            objs = self._custom_objects.get(key)
+            if objs is None:
+                objs = self.detector.CustomObjects()
+                for o in det_objs:
+                    objs[o] = 'valid'
+                self._custom_objects[key] = objs
+            return objs
+
+        def detect_batch(self, frames: list, det_objs: set = None) -> list:
+            """
+            Stacks the frames into one tensor and runs a single inference
+            pass of the YOLO model.  The raw outputs are decoded and
+            suppressed per class with the same thresholds as detect().
+            Falls back to detect() per frame when the loaded model does
+            not expose its Keras graph (e.g. RetinaNet).
+            Returns list of detections arrays, or None for each frame if detection failed
+            """
+            model = self._get_yolo_model()
+            if model is None:
+                return Detector.detect_batch(self, frames, det_objs)
+
+            if self.MODEL_NAME == "tinyyolo":
+                anchors, masks = TINY_YOLO_ANCHORS, TINY_YOLO_MASKS
+            else:
+                anchors, masks = YOLO_ANCHORS, YOLO_MASKS
 
-            return det_frame, detections
+            try:
+                batch = np.stack([_letterbox(f, YOLO_INPUT_SIZE) for f in frames]).astype(np.float32)
+                batch /= 255.
+                outputs = model.predict_on_batch(batch)
+            except Exception as e:
+                logger.error("{} // detect_batch(): {}".format(self.DETECTOR_NAME, e))
+                return [None for _ in frames]
+
+            if det_objs is None:
+                class_filter = np.ones(len(self._class_names), dtype=bool)
+            else:
+                class_filter = np.isin(self._class_ids, dets.class_ids(det_objs))
+
+            results = []
+            for i, frame in enumerate(frames):
+                boxes, scores = _yolo_decode(outputs, anchors, masks, YOLO_INPUT_SIZE, frame.shape, i)
+                scores[:, ~class_filter] = 0
+                # a box may pass the threshold for several classes, as in ImageAI
+                rows, classes = np.nonzero(scores >= MIN_PROBABILITY / 100)
+                detections = dets.create(self._class_ids[classes], scores[rows, classes], boxes[rows])
+                results.append(dets.clip(dets.nms(detections, NMS_IOU), frame.shape))
+
+            return results
+
+        def _get_yolo_model(self):
+            """
+            Returns the Keras model behind ImageAI's YOLO detector,
+            or None if it is not available.
+            """
+            if self.MODEL_NAME not in ("yolo", "tinyyolo"):
+                return None
+            models = getattr(self.detector, '_ObjectDetection__model_collection', None)
+            if not models:
+                return None
+            return models[0]
 
         def get_trained_objects(self) -> set:
             model_objects = self.detector.CustomObjects()
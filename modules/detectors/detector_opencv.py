@@ -0,0 +1,174 @@
+import os
+import logging
+import threading
+
+import numpy as np
+import cv2
+
+from modules.detectors.detector import Detector
+from modules.detectors import detections as dets
+
+logger = logging.getLogger('app')
+
+# model name -> (weights, config) in the backbones directory
+MODEL_FILES = {'yolo': ('yolov3.weights', 'yolov3.cfg'),
+               'tinyyolo': ('yolov3-tiny.weights', 'yolov3-tiny.cfg')}
+YOLO_INPUT_SIZE = 416
+ONNX_INPUT_SIZE = 640
+MIN_PROBABILITY = 60
+NMS_IOU = 0.45
+
+
+def _input_size(cfg_path: str, default: int) -> int:
+    """Network width from the [net] section of a Darknet .cfg file"""
+    try:
+        with open(cfg_path) as f:
+            for line in f:
+                key, _, val = line.partition('=')
+                if key.strip() == 'width':
+                    return int(val)
+    except (OSError, ValueError):
+        pass
+    return default
+
+
+class DetectorOpencv:
+    """
+    Implements Detector abstract class.
+
+    Runs YOLO models with OpenCV's DNN module, without TensorFlow or Keras.
+    Darknet models ('yolo', 'tinyyolo') are loaded from .cfg and .weights
+    files and ONNX models from any other model name, e.g. 'yolov5s.onnx'.
+    Model files are read from the 'backbones' directory.
+    ref: https://docs.opencv.org/master/d6/d0f/group__dnn.html
+    """
+
+    singleton = None
+
+    def __new__(cls, detector_name, model_name):
+        if cls.singleton is None:
+            cls.singleton = cls.__Singleton(detector_name, model_name)
+        return cls.singleton
+
+    class __Singleton(Detector):
+        def __init__(self, detector_name, model_name):
+            Detector.__init__(self, detector_name, model_name)
+            self.net, self._input_size, self._onnx = self.get_detector()
+            self._out_names = self.net.getUnconnectedOutLayersNames()
+            self._class_names = [o.replace(' ', '_') for o in self.get_class_names()]
+            self._class_ids = dets.register_classes(self._class_names)
+            self._class_filters = {}  # detected objects -> mask of the model's classes
+            self._net_lock = threading.Lock()  # the net holds one input; thread workers share it
+
+        def detect(self, frame: np.array, det_objs: set = None) -> np.array:
+            """
+            Required method of abstract class Detector.
+            Returns detections array, or None if detection failed
+            """
+            return self.detect_batch([frame], det_objs)[0]
+
+        def detect_batch(self, frames: list, det_objs: set = None) -> list:
+            """
+            Resizes the frames into one blob and runs a single forward
+            pass.  Boxes of each frame are filtered by probability and
+            suppressed per class in one NMS call, with the same thresholds
+            as the ImageAI detector.  Thread workers share the net, so
+            forward passes run one at a time; decoding runs in parallel.
+            Returns list of detections arrays, or None for each frame if detection failed
+            """
+            try:
+                blob = cv2.dnn.blobFromImages(frames, 1 / 255., (self._input_size, self._input_size),
+                                              swapRB=True, crop=False)
+                with self._net_lock:
+                    self.net.setInput(blob)
+                    outputs = self.net.forward(self._out_names)
+                    # rows of (cx, cy, w, h, objectness, class scores...) per frame, copied
+                    # before the next forward pass may reuse the net's output buffers
+                    outputs = np.concatenate([o.reshape(len(frames), -1, o.shape[-1]) for o in outputs], axis=1)
+            except Exception as e:
+                logger.error("{} // detect_batch(): {}".format(self.DETECTOR_NAME, e))
+                return [None for _ in frames]
+
+            class_filter = self._class_filter(det_objs)
+
+            return [self._decode(rows, frame.shape, class_filter) for frame, rows in zip(frames, outputs)]
+
+        def _class_filter(self, det_objs: set) -> np.array:
+            """Mask of the model's classes in 'det_objs', or of all classes if None"""
+            key = None if det_objs is None else frozenset(det_objs)
+            class_filter = self._class_filters.get(key)
+            if class_filter is None:
+                if det_objs is None:
+                    class_filter = np.ones(len(self._class_names), dtype=bool)
+                else:
+                    class_filter = np.isin(self._class_ids, dets.class_ids(det_objs))
+                self._class_filters[key] = class_filter
+            return class_filter
+
+        def _decode(self, rows: np.array, shape: tuple, class_filter: np.array) -> np.array:
+            """Convert the output rows of one frame into a detections array"""
+            h, w = shape[:2]
+            scores = rows[:, 5:5 + len(class_filter)]
+            if self._onnx:
+                # ONNX exports give class probabilities and boxes in input pixels
+                scores = scores * rows[:, 4:5]
+            class_ids = scores.argmax(axis=1)
+            confidences = scores[np.arange(len(rows)), class_ids]
+            keep = (confidences >= MIN_PROBABILITY / 100) & class_filter[class_ids]
+            if not keep.any():
+                return dets.empty()
+
+            rows, class_ids, confidences = rows[keep], class_ids[keep], confidences[keep]
+            xywh = rows[:, :4] / self._input_size if self._onnx else rows[:, :4]
+            boxes = np.empty((len(rows), 4))
+            boxes[:, 0] = (xywh[:, 0] - xywh[:, 2] / 2) * w
+            boxes[:, 1] = (xywh[:, 1] - xywh[:, 3] / 2) * h
+            boxes[:, 2] = xywh[:, 2] * w
+            boxes[:, 3] = xywh[:, 3] * h
+
+            # offset each class so one NMS pass never suppresses across classes
+            offset = class_ids[:, np.newaxis] * (max(w, h) + 1)
+            nms_boxes = boxes.copy()
+            nms_boxes[:, :2] += offset
+            idx = np.array(cv2.dnn.NMSBoxes(nms_boxes.tolist(), confidences.tolist(),
+                                            MIN_PROBABILITY / 100, NMS_IOU), dtype=np.int64).reshape(-1)
+
+            boxes = boxes[idx]
+            boxes[:, 2:] += boxes[:, :2]
+            return dets.clip(dets.create(self._class_ids[class_ids[idx]], confidences[idx], boxes), shape)
+
+        def get_trained_objects(self) -> set:
+            return set(self._class_names)
+
+        def get_class_names(self) -> list:
+            """
+            Class names of the model, from a '<model>.names' file in the
+            backbones directory if there is one, else the COCO classes.
+            """
+            path = os.path.join(os.getcwd(), "backbones", "{}.names".format(os.path.splitext(self.MODEL_NAME)[0]))
+            if os.path.exists(path):
+                with open(path) as f:
+                    return [line.strip() for line in f if line.strip()]
+            return dets.COCO_NAMES
+
+        def get_detector(self):
+            """
+            Loads the model files and returns (net, input size, is ONNX).
+            """
+            logger.info("{}: initializing '{}' model ...".format(self.DETECTOR_NAME, self.MODEL_NAME))
+
+            backbones = os.path.join(os.getcwd(), "backbones")
+            if self.MODEL_NAME in MODEL_FILES:
+                weights, cfg = (os.path.join(backbones, f) for f in MODEL_FILES[self.MODEL_NAME])
+                net = cv2.dnn.readNet(weights, cfg)
+                input_size, onnx = _input_size(cfg, YOLO_INPUT_SIZE), False
+            else:
+                model = self.MODEL_NAME if self.MODEL_NAME.endswith('.onnx') else self.MODEL_NAME + '.onnx'
+                net = cv2.dnn.readNet(os.path.join(backbones, model))
+                input_size, onnx = ONNX_INPUT_SIZE, True
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+            logger.info("{}: '{}' model initialized!".format(self.DETECTOR_NAME, self.MODEL_NAME))
+
+            return net, input_size, onnx
@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+
+from modules.detectors.detector import Detector
+from modules.detectors import detections as dets
+
+# objects the stub reports, with boxes as fractions of the frame
+STUB_DETECTIONS = [('car', 92.5, (0.40, 0.55, 0.55, 0.70)),
+                   ('person', 81.0, (0.15, 0.45, 0.20, 0.65))]
+
+
+class DetectorStub(Detector):
+    """
+    Implements Detector abstract class.
+
+    Detector for benchmarks and tests that loads no model.  Each call
+    sleeps for a fake inference latency and reports the same objects at
+    fixed positions, so the rest of the pipeline does its usual work.
+    The model name is the latency in milliseconds of one detect() call,
+    e.g. '50'.  A batch takes the latency once plus 'batch_cost' of it
+    for every further frame.
+    """
+
+    def __init__(self, detector_name: str, model_name: str, batch_cost: float = 0.25):
+        Detector.__init__(self, detector_name, model_name)
+        try:
+            self._latency = float(model_name) / 1000
+        except ValueError:
+            self._latency = 0.05
+        self._batch_cost = batch_cost
+        self._class_ids = dets.register_classes([name for name, _, _ in STUB_DETECTIONS])
+        self._scores = np.array([probability / 100 for _, probability, _ in STUB_DETECTIONS])
+        self._boxes = np.array([box for _, _, box in STUB_DETECTIONS])
+
+    def detect(self, frame: np.array, det_objs: set = None) -> np.array:
+        return self.detect_batch([frame], det_objs)[0]
+
+    def detect_batch(self, frames: list, det_objs: set = None) -> list:
+        time.sleep(self._latency * (1 + self._batch_cost * (len(frames) - 1)))
+
+        results = []
+        for frame in frames:
+            h, w = frame.shape[:2]
+            detections = dets.create(self._class_ids, self._scores, self._boxes * (w, h, w, h))
+            if det_objs is not None:
+                detections = dets.select(detections, classes=det_objs)
+            results.append(detections)
+        return results
+
+    def get_trained_objects(self) -> set:
+        return {name.replace(' ', '_') for name, _, _ in STUB_DETECTIONS}
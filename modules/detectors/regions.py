@@ -0,0 +1,130 @@
+"""
+Regions of interest and tiles for cropped inference.
+
+A camera can limit detection to polygons of the frame and split each
+polygon's bounding box, or the whole frame, into overlapping tiles.
+Each tile is detected as a separate image, so small, distant objects
+are seen at a larger scale, and pixels outside the polygons are masked
+out.  Detections are mapped back to frame coordinates and merged where
+tiles overlap.
+"""
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from modules.detectors import detections as dets
+
+# a tile of the frame: box in frame pixels and the polygon mask to apply,
+# in tile pixels, or None if the whole tile is inside the region
+Crop = namedtuple("Crop", ['x1', 'y1', 'x2', 'y2', 'polygon'])
+
+
+def parse_polygons(polygons: list) -> list:
+    """
+    Convert polygons read from the configuration into lists of
+    (x, y) float points.  Points are fractions of the frame width and
+    height if all are at most 1, otherwise pixels.
+    """
+    return [[(float(x), float(y)) for x, y in polygon] for polygon in polygons or []]
+
+
+def parse_tiles(tiles: str) -> (int, int):
+    """Convert a 'COLSxROWS' string, e.g. '2x1', into (cols, rows)."""
+    cols, rows = str(tiles).lower().split('x')
+    return max(1, int(cols)), max(1, int(rows))
+
+
+def get_crops(shape: tuple, polygons: list = None, tiles: tuple = (1, 1), overlap: float = 0.15) -> list:
+    """
+    Compute the tiles of a frame of 'shape'.
+    :param polygons: regions of interest as returned by parse_polygons(), or None for the whole frame
+    :param tiles: (cols, rows) tiles per region
+    :param overlap: fraction of a tile shared with its neighbour
+    :return: list of Crops, without tiles that lie outside all regions
+    """
+    h, w = shape[:2]
+    areas = []
+    for polygon in polygons or []:
+        points = np.array(polygon, dtype=np.float64)
+        if points.max() <= 1:
+            points *= (w, h)
+        points = points.round().astype(np.int32)
+        mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(mask, [points], 1)
+        x, y, bw, bh = cv2.boundingRect(points)
+        areas.append((max(0, x), max(0, y), min(w, x + bw), min(h, y + bh), points, mask))
+    if not areas:
+        areas.append((0, 0, w, h, None, None))
+
+    cols, rows = tiles
+    crops = []
+    for ax1, ay1, ax2, ay2, points, mask in areas:
+        tile_w = (ax2 - ax1) / (cols - (cols - 1) * overlap)
+        tile_h = (ay2 - ay1) / (rows - (rows - 1) * overlap)
+        for r in range(rows):
+            for c in range(cols):
+                x1 = int(round(ax1 + c * tile_w * (1 - overlap)))
+                y1 = int(round(ay1 + r * tile_h * (1 - overlap)))
+                x2 = min(ax2, int(round(x1 + tile_w)))
+                y2 = min(ay2, int(round(y1 + tile_h)))
+                if x2 <= x1 or y2 <= y1:
+                    continue
+                polygon = None
+                if mask is not None:
+                    inside = mask[y1:y2, x1:x2]
+                    if not inside.any():
+                        continue
+                    if not inside.all():
+                        polygon = points - (x1, y1)
+                crops.append(Crop(x1, y1, x2, y2, polygon))
+    return crops
+
+
+def crop_frame(frame: np.array, crop: Crop) -> np.array:
+    """Copy of the tile of 'frame' with pixels outside the region set to black"""
+    image = frame[crop.y1:crop.y2, crop.x1:crop.x2].copy()
+    if crop.polygon is not None:
+        mask = np.zeros(image.shape[:2], dtype=np.uint8)
+        cv2.fillPoly(mask, [crop.polygon], 1)
+        image[mask == 0] = 0
+    return image
+
+
+def merge_detections(tile_detections: list, crops: list, iou: float = 0.5, containment: float = 0.7) -> np.array:
+    """
+    Map the detections of each tile to frame coordinates and merge the
+    duplicates found in overlapping tiles.  Of two boxes of the same
+    object that overlap by more than 'iou', or where more than
+    'containment' of the smaller box is inside the larger, the more
+    probable is kept, grown to cover both, since an object cut by a tile
+    border is found whole in the neighbouring tile.
+    :param tile_detections: list of detections arrays in the order of 'crops'
+    :return: detections array in frame coordinates
+    """
+    tiles = [dets.offset(d, crop.x1, crop.y1) for crop, d in zip(crops, tile_detections) if d is not None]
+    if not tiles:
+        return dets.empty()
+    detections = np.concatenate(tiles)
+    detections = detections[detections['score'].argsort(kind='stable')[::-1]]
+
+    boxes = detections['box']
+    areas = dets.area(boxes)
+    kept = []
+    for i in range(len(detections)):
+        if kept:
+            k = np.array(kept)
+            k = k[detections['class_id'][k] == detections['class_id'][i]]
+            if len(k):
+                inter = dets.intersection(boxes[i], boxes[k])
+                merge = (inter / (areas[i] + areas[k] - inter) > iou) | \
+                        (inter / np.maximum(1, np.minimum(areas[i], areas[k])) > containment)
+                merge &= inter > 0
+                if merge.any():
+                    j = k[merge.argmax()]
+                    boxes[j, :2] = np.minimum(boxes[j, :2], boxes[i, :2])
+                    boxes[j, 2:] = np.maximum(boxes[j, 2:], boxes[i, 2:])
+                    areas[j] = dets.area(boxes[j])
+                    continue
+        kept.append(i)
+    return detections[kept]
@@ -0,0 +1,224 @@
+import threading
+import time
+import logging
+
+import cv2
+
+from modules.services.service import Service
+from modules.services.metrics import METRICS
+from modules.services.renditions import DEFAULT_RENDITIONS, Rendition, RenditionSelector, encode
+from modules.services.video_subscribers import VideoSubscribers
+
+logger = logging.getLogger('app')
+
+
+class _Channel:
+    """Ring buffer of the encoded frames of one rendition"""
+
+    def __init__(self, rendition: Rendition, size: int):
+        self.rendition = rendition
+        self.ring = [None] * size  # (seq, jpeg bytes)
+        self.seq = 0
+        self.last_request = 0.0
+
+
+class BroadcastService(Service, threading.Thread):
+    """
+    Encodes every display frame to JPEG exactly once per rendition and
+    shares the encoded bytes with all viewers of that rendition.
+
+    This thread is the only consumer of the display frames.  Encoded
+    frames are kept in a small ring buffer per rendition with a sequence
+    number.  A rendition is encoded only while a viewer watches it.
+    Viewers read from the ring without consuming it, so any number of
+    viewers can watch the same stream.  A viewer that has fallen more
+    than one frame behind skips ahead to the newest frame instead of
+    working through a backlog.
+
+    Viewers of the MJPEG feed get the frames with their annotations
+    drawn in.  Socket video clients get the raw frame, encoded once more,
+    with its detections as metadata to draw themselves; each client is
+    sent frames only as fast as it acknowledges them.
+
+    A rendition is watched while a viewer asked for one of its frames
+    within 'idle_timeout' seconds.  While no rendition is watched and
+    no socket client is subscribed the thread stops taking display
+    frames, so nothing is encoded when nobody is watching.  The video
+    service drops display frames that are not taken.
+    """
+
+    def __init__(self,
+                 name: str,
+                 frame_source,
+                 render=None,
+                 meta_source=None,
+                 subscribers: VideoSubscribers = None,
+                 renditions: list = None,
+                 ring_size: int = 8,
+                 idle_timeout: float = 5.0,
+                 camera: str = None):
+        """
+        :param frame_source: callable returning (success, frame) of the next raw display
+        frame, waiting until the frame is due
+        :param render: callable returning the annotated copy of the last frame, or None
+        to show the raw frames
+        :param meta_source: callable returning the JSON-safe metadata of the last frame
+        :param subscribers: socket clients the raw frames are pushed to, or None
+        :param renditions: ladder of Renditions, largest first; the first is the default
+        :param ring_size: number of encoded frames kept in the ring buffer of each rendition
+        :param idle_timeout: seconds without a viewer request after which encoding pauses
+        :param camera: name of the camera, used to label the metrics
+        """
+        Service.__init__(self, name)
+        threading.Thread.__init__(self, daemon=True)
+        self.setName(name)
+        self._frame_source = frame_source
+        self._render = render
+        self._meta_source = meta_source
+        self._subscribers = subscribers
+        self._socket_seq = 0
+        self._renditions = list(renditions or DEFAULT_RENDITIONS)
+        self._channels = {r.name: _Channel(r, ring_size) for r in self._renditions}
+        self._default = self._channels[self._renditions[0].name]
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._skipped = 0
+        self._idle_timeout = idle_timeout
+        self._encode_time = METRICS.histogram("broadcast_encode_seconds",
+                                              "Time to JPEG encode a display frame in all watched renditions",
+                                              camera=camera)
+        METRICS.counter("broadcast_frames_total", "Display frames encoded", fn=lambda: self._seq, camera=camera)
+        METRICS.counter("broadcast_skipped_total", "Encoded frames skipped by slow viewers",
+                        fn=lambda: self._skipped, camera=camera)
+        for name, channel in self._channels.items():
+            METRICS.counter("broadcast_rendition_frames_total", "Display frames encoded per rendition",
+                            fn=lambda c=channel: c.seq, camera=camera, rendition=name)
+        self._downgrades = METRICS.counter("broadcast_downgrades_total",
+                                           "Viewers switched to a smaller rendition because they fell behind",
+                                           camera=camera)
+        METRICS.gauge("broadcast_watched", "1 while a viewer is watching", fn=lambda: int(self.watched),
+                      camera=camera)
+        if subscribers is not None:
+            self._socket_encode_time = METRICS.histogram("broadcast_socket_encode_seconds",
+                                                         "Time to JPEG encode a raw frame for socket clients",
+                                                         camera=camera)
+            METRICS.gauge("broadcast_socket_clients", "Socket clients subscribed to the video",
+                          fn=lambda: subscribers.count, camera=camera)
+            METRICS.counter("broadcast_socket_frames_total", "Frames sent to socket clients",
+                            fn=lambda: subscribers.sent, camera=camera)
+            METRICS.counter("broadcast_socket_dropped_total", "Frames dropped for socket clients that fell behind",
+                            fn=lambda: subscribers.dropped, camera=camera)
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    @property
+    def skipped(self) -> int:
+        """Total number of frames skipped by slow viewers"""
+        return self._skipped
+
+    @property
+    def renditions(self) -> list:
+        return list(self._renditions)
+
+    @property
+    def watched(self) -> bool:
+        """Whether a viewer asked for a frame of any rendition within the idle timeout"""
+        now = time.monotonic()
+        return any(now - c.last_request < self._idle_timeout for c in self._channels.values())
+
+    def selector(self, rendition: str = None) -> RenditionSelector:
+        """Rendition selector of a new viewer that asked for 'rendition'"""
+        return RenditionSelector(self._renditions, rendition, on_downgrade=self._downgrades.inc)
+
+    @property
+    def subscribed(self) -> bool:
+        """Whether a socket client is subscribed to the frames"""
+        return self._subscribers is not None and self._subscribers.count > 0
+
+    def wake(self):
+        """Wake the encoder if it is idle, e.g. because a socket client subscribed"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def start(self):
+        self._running = True
+        threading.Thread.start(self)
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+
+    def publish(self, jpeg: bytes, rendition: str = None):
+        """Add an encoded frame to the ring of 'rendition' and wake all waiting viewers."""
+        channel = self._channels.get(rendition, self._default)
+        with self._cond:
+            channel.seq += 1
+            channel.ring[channel.seq % len(channel.ring)] = (channel.seq, jpeg)
+            self._cond.notify_all()
+
+    def get_frame(self, last_seq: int, timeout: float = 1.0, rendition: str = None) -> (int, bytes):
+        """
+        Return the frame of 'rendition' that follows 'last_seq'.  Waits
+        for a new frame if the viewer is up to date.  A viewer more than
+        one frame behind gets the newest frame.  A viewer without a frame
+        yet waits for the next one encoded, since the ring of a rendition
+        nobody watched holds the frames of when it was last watched.
+        :param last_seq: sequence number of the last frame the viewer received, or 0 for none
+        :param rendition: name of the rendition, or None for the default
+        :return: sequence number and encoded frame, or (last_seq, None) on timeout
+        """
+        channel = self._channels.get(rendition, self._default)
+        with self._cond:
+            channel.last_request = time.monotonic()
+            self._cond.notify_all()  # wake the encoder if it was idle
+            if not last_seq:
+                last_seq = channel.seq
+            if not self._cond.wait_for(lambda: channel.seq > last_seq or not self._running, timeout=timeout):
+                return last_seq, None
+            if channel.seq <= last_seq:
+                return last_seq, None
+
+            next_seq = last_seq + 1
+            if next_seq < channel.seq:
+                self._skipped += channel.seq - next_seq
+                next_seq = channel.seq
+            return channel.ring[next_seq % len(channel.ring)]
+
+    def run(self):
+        logger.info("Started broadcast loop!")
+
+        while self._running:
+
+            # no viewers; leave the display frames to be dropped
+            if not self.watched and not self.subscribed:
+                with self._cond:
+                    self._cond.wait_for(lambda: self.watched or self.subscribed or not self._running, timeout=1)
+                continue
+
+            success, frame = self._frame_source()
+
+            # if queue was empty, skip
+            if not success:
+                continue
+
+            now = time.monotonic()
+            watched = [c for c in self._channels.values() if now - c.last_request < self._idle_timeout]
+            if watched:
+                image = self._render() if self._render else frame
+                start = time.perf_counter()
+                scaled = {}
+                for channel in watched:
+                    self.publish(encode(frame if image is None else image, channel.rendition, scaled),
+                                 channel.rendition.name)
+                self._encode_time.observe(time.perf_counter() - start)
+                self._seq += 1
+
+            if self.subscribed:
+                start = time.perf_counter()
+                jpeg = cv2.imencode('.jpg', frame)[1].tobytes()
+                self._socket_encode_time.observe(time.perf_counter() - start)
+                self._socket_seq += 1
+                self._subscribers.send(self._socket_seq, jpeg, self._meta_source() if self._meta_source else {})
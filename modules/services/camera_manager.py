@@ -0,0 +1,136 @@
+import os
+import logging
+from collections import OrderedDict
+
+import yaml
+from flask_socketio import SocketIO
+
+from modules.services.config_service import ConfigYAML, DEFAULT_PATHS
+from modules.services.inference_service import InferenceService
+from modules.services.service_manager import ServiceManager
+
+logger = logging.getLogger('app')
+
+# keys that get a camera specific default when a configuration has several cameras
+PER_CAMERA_PATHS = tuple(DEFAULT_PATHS)
+
+
+def _camera_configs(yaml_data: dict) -> list:
+    """
+    Split a YAML configuration into one set of parameters per camera.
+
+    Cameras are listed under CAM_STREAMS, each with a NAME and CAM_STREAM
+    and optionally any other parameter to override the top level value.
+    A configuration without CAM_STREAMS is a single camera named 'default'.
+    Log and snapshot paths that a camera does not set, whether taken
+    from the top level or the defaults, are made unique by adding the
+    camera name, except for the first camera, so that cameras never
+    share a detection history or a snapshot directory.
+    """
+    cameras = yaml_data.pop('CAM_STREAMS', None)
+    if not cameras:
+        return [dict(yaml_data)]
+
+    configs = []
+    for i, cam in enumerate(cameras):
+        params = dict(yaml_data)
+        params.update(cam)
+        if 'NAME' not in params:
+            params['NAME'] = 'cam{}'.format(i)
+
+        if i > 0:
+            for key in PER_CAMERA_PATHS:
+                if key not in cam:
+                    root, ext = os.path.splitext(params.get(key, DEFAULT_PATHS[key]))
+                    params[key] = "{}_{}{}".format(root, params['NAME'], ext)
+
+        configs.append(params)
+
+    return configs
+
+
+class CameraManager(object):
+    """
+    Runs the services of every configured camera in one process.
+    Each camera has its own ServiceManager with its own capture, logging
+    and monitoring services.  All cameras share one InferenceService, so
+    the detection model is loaded once.  Inference settings are taken
+    from the first camera's configuration.
+    """
+    def __init__(self, socketio: SocketIO, config_file: os.path = None):
+
+        with open(config_file) as fp:
+            yaml_data = yaml.load(fp, Loader=yaml.BaseLoader)
+
+        configs = [ConfigYAML(**params) for params in _camera_configs(yaml_data)]
+
+        self._inference = self.get_inference_service(configs[0])
+        self._managers = OrderedDict()
+        for config in configs:
+            if config.NAME in self._managers:
+                raise Exception("camera_manager: camera name '{}' is used twice!".format(config.NAME))
+            self._managers[config.NAME] = ServiceManager(socketio, config, self._inference)
+
+        # load and warm up the detector in the background, while the streams are resolved
+        self._inference.start()
+
+    @staticmethod
+    def get_inference_service(config: ConfigYAML) -> InferenceService:
+        return InferenceService(name="inference-service",
+                                detector_name=(config.DETECTOR_NAME,),
+                                detector_model=(config.DETECTOR_MODEL,),
+                                workers=config.INFERENCE_WORKERS,
+                                mode=config.INFERENCE_MODE,
+                                batch_size=config.BATCH_SIZE,
+                                batch_wait=config.BATCH_WAIT_MS / 1000)
+
+    @property
+    def cameras(self) -> list:
+        return list(self._managers.keys())
+
+    @property
+    def default(self) -> ServiceManager:
+        """ServiceManager of the first camera"""
+        return next(iter(self._managers.values()))
+
+    @property
+    def all_running(self) -> bool:
+        return all(sm.all_running for sm in self._managers.values())
+
+    @property
+    def inference(self) -> InferenceService:
+        return self._inference
+
+    @property
+    def status(self) -> dict:
+        """Readiness of each camera, by camera name"""
+        return {name: sm.status for name, sm in self._managers.items()}
+
+    def get(self, camera: str = None) -> ServiceManager:
+        """
+        Returns the ServiceManager of a camera, or of the first
+        camera if no camera name is given.
+        """
+        if not camera:
+            return self.default
+        return self._managers.get(camera)
+
+    def start_all_services(self):
+        self._inference.start()
+        for sm in self._managers.values():
+            if not sm.all_running:
+                sm.start_all_services()
+
+    def stop_all_services(self):
+        for sm in self._managers.values():
+            sm.stop_all_services()
+
+    def add_all_services(self):
+        for sm in self._managers.values():
+            sm.add_all_services()
+
+    def close(self):
+        """Stop the services of every camera and shut down their processes and the detector's."""
+        for sm in self._managers.values():
+            sm.close()
+        self._inference.stop()
@@ -11,89 +11,39 @@ import os
 import logging
 import yaml
 
-import pafy
-import cv2
-import numpy as np
+from modules.detectors.regions import parse_polygons, parse_tiles
+from modules.services.renditions import parse_renditions
+from modules.services.stream_resolver import StreamCache, StreamResolver
 
 logger = logging.getLogger('app')
 
 
 # CAMERA FUNCTIONS
-def get_cam_name(cam: str) -> str:
-    """
-    Determine the true name of the camera.
-    Use YouTube url if not a local webcam.
-    """
-
-    if type(cam) is str and cam.isdigit():
-        cam = int(cam)
-
-    # test video feed
-    read_pass = _test_cam(cam)
-
-    # if capture fails, try as YouTube Stream
-    # https://pypi.org/project/pafy/
-    if not read_pass:
-        if '/' in cam and 'youtube' in cam:  # a full video path was given
-            cam = cam.split('/')[-1]
-        try:
-            video_pafy = pafy.new(cam)
-        except Exception:
-            raise Exception("No video stream found: {}".format(cam))
-        # get most reasonable stream h x w < 350k
-        res_limit = 350000
-        stream_num = 0
-
-        # use pafy to get the url of the stream
-        # find stream with resolution within res_limit
-        for i, stream in enumerate(video_pafy.streams):
-            x, y = np.array(stream.resolution.split('x'), dtype=int)
-            if x * y < res_limit:
-                stream_num = i
-            else:
-                break
-        stream = video_pafy.streams[stream_num]
-
-        # test stream
-        read_pass = _test_cam(stream.url)
-
-        if read_pass:
-            cam = stream.url
-            logger.info("YouTube Video Stream Detected!")
-            logger.info("Video Resolution : {}".format(stream.resolution))
-
-    logger.info("Video Test       : {}".format("OK" if read_pass else "FAIL - check that streamer is publishing"))
-
-    if not read_pass:
-        raise Exception("Can't acquire video source: {}".format(cam))
+_stream_caches = {}  # cache file path -> StreamCache
 
-    return cam
 
-
-def _test_cam(cam: str) -> bool:
-    cap = cv2.VideoCapture(cam)
-    read_pass = cap.grab()
-    cap.release()
-
-    if not read_pass:
-        return False
-
-    return True
-
-
-def get_camfps(cam: str) -> float:
+def get_stream_resolver(cam: str, cache_path: str, cache_ttl: float) -> StreamResolver:
     """
-    Return the camera's published FPS.
+    Return a resolver for the camera source that has started resolving
+    it in the background.  Cameras with the same cache file share one
+    StreamCache.
     """
-    cap = cv2.VideoCapture(cam)
-    cam_fps = cap.get(cv2.CAP_PROP_FPS)
-    cap.release()
-
-    return cam_fps
+    cache = _stream_caches.get(cache_path)
+    if cache is None:
+        cache = _stream_caches[cache_path] = StreamCache(cache_path, cache_ttl)
+    resolver = StreamResolver(cam, cache)
+    resolver.start()
+    return resolver
 
 # END CAMERA FUNCTIONS ##########################
 
 
+# paths of the files each camera writes, unless configured
+DEFAULT_PATHS = {'LOG_FILEPATH': os.path.join('.', 'logs', 'files', 'camlogs.txt'),
+                 'LOG_DB_PATH': os.path.join('.', 'logs', 'files', 'camlogs.db'),
+                 'MON_DIR': os.path.join('.', 'logs', 'images')}
+
+
 # YAML CONFIGURATION
 class ConfigYAML(yaml.YAMLObject):
     """
@@ -108,11 +58,32 @@ class ConfigYAML(yaml.YAMLObject):
     yaml_tag = u"!StreamYAML"
 
     def __init__(self, **kwargs):
+        if 'NAME' in kwargs:
+            self._NAME = kwargs['NAME']
+        else:
+            self._NAME = 'default'
         if 'CAM_STREAM' in kwargs:
-            self._CAM_STREAM = get_cam_name(kwargs['CAM_STREAM'])
+            self._CAM_STREAM = kwargs['CAM_STREAM']
+        else:
+            self._CAM_STREAM = '1EiC9bvVGnk'
+        if 'STREAM_CACHE_PATH' in kwargs:
+            self._STREAM_CACHE_PATH = kwargs['STREAM_CACHE_PATH']
         else:
-            self._CAM_STREAM = get_cam_name('1EiC9bvVGnk')
-        self._CAM_FPS: float = get_camfps(self._CAM_STREAM)
+            self._STREAM_CACHE_PATH = os.path.join('.', 'logs', 'files', 'streams.json')
+        if 'STREAM_CACHE_TTL' in kwargs:
+            self._STREAM_CACHE_TTL = float(kwargs['STREAM_CACHE_TTL'])
+        else:
+            self._STREAM_CACHE_TTL = 10800.0
+        self._STREAM = get_stream_resolver(self._CAM_STREAM, self._STREAM_CACHE_PATH, self._STREAM_CACHE_TTL)
+        if 'STALL_TIMEOUT' in kwargs:
+            self._STALL_TIMEOUT = float(kwargs['STALL_TIMEOUT'])
+        else:
+            self._STALL_TIMEOUT = 10.0
+        if 'RECONNECT_MAX_DELAY' in kwargs:
+            self._RECONNECT_MAX_DELAY = float(kwargs['RECONNECT_MAX_DELAY'])
+        else:
+            self._RECONNECT_MAX_DELAY = 60.0
+        self._CAM_FPS: float = None  # the stream's published rate unless set
 
         if 'LOGGING' in kwargs and kwargs['LOGGING'] == 'true':
             self._LOGGING = True
@@ -121,7 +92,15 @@ class ConfigYAML(yaml.YAMLObject):
         if 'LOG_FILEPATH' in kwargs:
             self._LOG_FILEPATH = kwargs['LOG_FILEPATH']
         else:
-            self._LOG_FILEPATH = os.path.join('.', 'logs', 'files', 'camlogs.txt')
+            self._LOG_FILEPATH = DEFAULT_PATHS['LOG_FILEPATH']
+        if 'LOG_DB_PATH' in kwargs:
+            self._LOG_DB_PATH = kwargs['LOG_DB_PATH']
+        else:
+            self._LOG_DB_PATH = DEFAULT_PATHS['LOG_DB_PATH']
+        if 'LOG_RETENTION_DAYS' in kwargs:
+            self._LOG_RETENTION_DAYS = int(kwargs['LOG_RETENTION_DAYS'])
+        else:
+            self._LOG_RETENTION_DAYS = 90
         if 'DETECTION' in kwargs and kwargs['DETECTION'] == 'true':
             self._DETECTION = True
         else:
@@ -136,11 +115,101 @@ class ConfigYAML(yaml.YAMLObject):
         else:
             self._DETECTOR_MODEL = 'yolo'
 
+        if 'INFERENCE_WORKERS' in kwargs:
+            self._INFERENCE_WORKERS = int(kwargs['INFERENCE_WORKERS'])
+        else:
+            self._INFERENCE_WORKERS = 1
+
+        if 'INFERENCE_MODE' in kwargs and kwargs['INFERENCE_MODE'] == 'process':
+            self._INFERENCE_MODE = 'process'
+        else:
+            self._INFERENCE_MODE = 'thread'
+
+        if 'BATCH_SIZE' in kwargs:
+            self._BATCH_SIZE = max(1, int(kwargs['BATCH_SIZE']))
+        else:
+            self._BATCH_SIZE = 1
+
+        if 'BATCH_WAIT_MS' in kwargs:
+            self._BATCH_WAIT_MS = float(kwargs['BATCH_WAIT_MS'])
+        else:
+            self._BATCH_WAIT_MS = 0.0
+
         if 'DPM' in kwargs:
             self._DPM = float(kwargs['DPM'])
         else:
             self._DPM = 20.0
 
+        if 'DPM_MIN' in kwargs:
+            self._DPM_MIN = float(kwargs['DPM_MIN'])
+        else:
+            self._DPM_MIN = 1.0
+
+        if 'DPM_MAX' in kwargs:
+            self._DPM_MAX = float(kwargs['DPM_MAX'])
+        else:
+            self._DPM_MAX = 120.0
+
+        if 'DET_BUDGET' in kwargs:
+            self._DET_BUDGET = float(kwargs['DET_BUDGET'])
+        else:
+            self._DET_BUDGET = 0.5
+
+        if 'DET_FRESHNESS' in kwargs:
+            self._DET_FRESHNESS = float(kwargs['DET_FRESHNESS'])
+        else:
+            self._DET_FRESHNESS = 0.0
+
+        if 'ROI' in kwargs:
+            self._ROI = parse_polygons(kwargs['ROI'])
+        else:
+            self._ROI = []
+
+        if 'TILES' in kwargs:
+            self._TILES = parse_tiles(kwargs['TILES'])
+        else:
+            self._TILES = (1, 1)
+
+        if 'TILE_OVERLAP' in kwargs:
+            self._TILE_OVERLAP = float(kwargs['TILE_OVERLAP'])
+        else:
+            self._TILE_OVERLAP = 0.15
+
+        if 'MOTION_GATE' in kwargs and kwargs['MOTION_GATE'] == 'true':
+            self._MOTION_GATE = True
+        else:
+            self._MOTION_GATE = False
+
+        if 'MOTION_THRESHOLD' in kwargs:
+            self._MOTION_THRESHOLD = float(kwargs['MOTION_THRESHOLD'])
+        else:
+            self._MOTION_THRESHOLD = 25.0
+
+        if 'MOTION_AREA' in kwargs:
+            self._MOTION_AREA = float(kwargs['MOTION_AREA'])
+        else:
+            self._MOTION_AREA = 0.002
+
+        if 'MOTION_MAX_IDLE' in kwargs:
+            self._MOTION_MAX_IDLE = float(kwargs['MOTION_MAX_IDLE'])
+        else:
+            self._MOTION_MAX_IDLE = 30.0
+
+        if 'TRACKING' in kwargs and kwargs['TRACKING'] == 'true':
+            self._TRACKING = True
+        else:
+            self._TRACKING = False
+
+        if 'TRACK_IOU' in kwargs:
+            self._TRACK_IOU = float(kwargs['TRACK_IOU'])
+        else:
+            self._TRACK_IOU = 0.3
+
+        if 'TRACK_MAX_AGE' in kwargs:
+            self._TRACK_MAX_AGE = float(kwargs['TRACK_MAX_AGE'])
+        else:
+            self._TRACK_MAX_AGE = 2.0
+
         if 'DISPLAY_FPS' in kwargs:
             self._DISPLAY_FPS = float(kwargs['DISPLAY_FPS'])
         else:
@@ -154,7 +223,17 @@ class ConfigYAML(yaml.YAMLObject):
         if 'MON_DIR' in kwargs:
             self._MON_DIR = kwargs['MON_DIR']
         else:
-            self._MON_DIR = os.path.join('.', 'logs', 'images')
+            self._MON_DIR = DEFAULT_PATHS['MON_DIR']
+
+        if 'SNAPSHOT_WORKERS' in kwargs:
+            self._SNAPSHOT_WORKERS = max(1, int(kwargs['SNAPSHOT_WORKERS']))
+        else:
+            self._SNAPSHOT_WORKERS = 1
+
+        if 'SNAPSHOT_QUEUE' in kwargs:
+            self._SNAPSHOT_QUEUE = max(1, int(kwargs['SNAPSHOT_QUEUE']))
+        else:
+            self._SNAPSHOT_QUEUE = 8
 
         if 'MON_OBJS' in kwargs:
             self._MON_OBJS = set(kwargs['MON_OBJS'])
@@ -166,26 +245,74 @@ class ConfigYAML(yaml.YAMLObject):
         else:
             self._DET_OBJS = set()
 
-        if 'BASE_DELAY' in kwargs:
-            self._BASE_DELAY = float(kwargs['BASE_DELAY'])
+        if 'PACE_LATENCY' in kwargs:
+            self._PACE_LATENCY = float(kwargs['PACE_LATENCY'])
         else:
-            self._BASE_DELAY = 0.045
+            self._PACE_LATENCY = 0.1
+
+        if 'PACE_MAX_LAG' in kwargs:
+            self._PACE_MAX_LAG = float(kwargs['PACE_MAX_LAG'])
+        else:
+            self._PACE_MAX_LAG = 1.0
+
+        if 'VIDEO_MAX_IN_FLIGHT' in kwargs:
+            self._VIDEO_MAX_IN_FLIGHT = max(1, int(kwargs['VIDEO_MAX_IN_FLIGHT']))
+        else:
+            self._VIDEO_MAX_IN_FLIGHT = 2
+
+        if 'RENDITIONS' in kwargs:
+            self._RENDITIONS = parse_renditions(kwargs['RENDITIONS'])
+        else:
+            self._RENDITIONS = parse_renditions(None)
 
         logger.info(self)
 
     # PARAMETER GETTERS AND SETTERS ##################################
+    @property
+    def NAME(self) -> str:
+        """Camera name, used in routes and to label logs"""
+        return self._NAME
+
     @property
     def CAM_STREAM(self):
+        """Configured camera source: webcam number, file, stream URL or YouTube video"""
         return self._CAM_STREAM
 
     @CAM_STREAM.setter
     def CAM_STREAM(self, val):
-        self._CAM_STREAM = get_cam_name(val)
+        self._CAM_STREAM = val
+        self._STREAM = get_stream_resolver(val, self._STREAM_CACHE_PATH, self._STREAM_CACHE_TTL)
+
+    @property
+    def STREAM(self) -> StreamResolver:
+        """Resolver of CAM_STREAM, holding the stream URL once resolved"""
+        return self._STREAM
+
+    @property
+    def STREAM_CACHE_PATH(self) -> str:
+        return self._STREAM_CACHE_PATH
+
+    @property
+    def STREAM_CACHE_TTL(self) -> float:
+        """Seconds a resolved YouTube stream is reused"""
+        return self._STREAM_CACHE_TTL
+
+    @property
+    def STALL_TIMEOUT(self) -> float:
+        """Seconds without a frame after which the stream is reconnected"""
+        return self._STALL_TIMEOUT
+
+    @property
+    def RECONNECT_MAX_DELAY(self) -> float:
+        """Longest time in seconds between attempts to reconnect a lost stream"""
+        return self._RECONNECT_MAX_DELAY
 
     @property
     def CAM_FPS(self):
-        """Get cam's local program set FPS"""
-        return self._CAM_FPS
+        """Get cam's local program set FPS, or the published FPS once the stream is resolved"""
+        if self._CAM_FPS is not None:
+            return self._CAM_FPS
+        return self._STREAM.fps
 
     @CAM_FPS.setter
     def CAM_FPS(self, val):
@@ -211,6 +338,22 @@ class ConfigYAML(yaml.YAMLObject):
     def LOG_FILEPATH(self, val: str) -> None:
         self._LOG_FILEPATH = val
 
+    @property
+    def LOG_DB_PATH(self) -> str:
+        return self._LOG_DB_PATH
+
+    @LOG_DB_PATH.setter
+    def LOG_DB_PATH(self, val: str) -> None:
+        self._LOG_DB_PATH = val
+
+    @property
+    def LOG_RETENTION_DAYS(self) -> int:
+        return self._LOG_RETENTION_DAYS
+
+    @LOG_RETENTION_DAYS.setter
+    def LOG_RETENTION_DAYS(self, val: int) -> None:
+        self._LOG_RETENTION_DAYS = val
+
     @property
     def DETECTION(self) -> bool:
         return self._DETECTION
@@ -235,17 +378,167 @@ class ConfigYAML(yaml.YAMLObject):
     def DETECTOR_MODEL(self, val: str) -> None:
         self._DETECTOR_MODEL = val
 
+    @property
+    def INFERENCE_WORKERS(self) -> int:
+        return self._INFERENCE_WORKERS
+
+    @INFERENCE_WORKERS.setter
+    def INFERENCE_WORKERS(self, val: int) -> None:
+        self._INFERENCE_WORKERS = max(1, val)
+
+    @property
+    def INFERENCE_MODE(self) -> str:
+        return self._INFERENCE_MODE
+
+    @INFERENCE_MODE.setter
+    def INFERENCE_MODE(self, val: str) -> None:
+        self._INFERENCE_MODE = val
+
+    @property
+    def BATCH_SIZE(self) -> int:
+        return self._BATCH_SIZE
+
+    @BATCH_SIZE.setter
+    def BATCH_SIZE(self, val: int) -> None:
+        self._BATCH_SIZE = max(1, val)
+
+    @property
+    def BATCH_WAIT_MS(self) -> float:
+        return self._BATCH_WAIT_MS
+
+    @BATCH_WAIT_MS.setter
+    def BATCH_WAIT_MS(self, val: float) -> None:
+        self._BATCH_WAIT_MS = max(0.0, val)
+
     @property
     def DPM(self) -> float:
         return self._DPM
 
     @DPM.setter
     def DPM(self, val: float):
-        """ Throttle up or down. Never go below 10 DPM."""
-        if self._DPM > val and self._DPM > 10:
-            self._DPM = val + int((self._DPM - val) / 2)
-        else:  # throttle up
-            self._DPM = val + 1
+        """Starting detection rate.  The running rate is set by the detection rate controller."""
+        self._DPM = min(max(val, self._DPM_MIN), self._DPM_MAX)
+
+    @property
+    def DPM_MIN(self) -> float:
+        return self._DPM_MIN
+
+    @DPM_MIN.setter
+    def DPM_MIN(self, val: float) -> None:
+        self._DPM_MIN = max(0.1, val)
+
+    @property
+    def DPM_MAX(self) -> float:
+        return self._DPM_MAX
+
+    @DPM_MAX.setter
+    def DPM_MAX(self, val: float) -> None:
+        self._DPM_MAX = max(self._DPM_MIN, val)
+
+    @property
+    def DET_BUDGET(self) -> float:
+        """Fraction of one inference worker's time a camera's detections may use"""
+        return self._DET_BUDGET
+
+    @DET_BUDGET.setter
+    def DET_BUDGET(self, val: float) -> None:
+        self._DET_BUDGET = min(max(0.01, val), 1.0)
+
+    @property
+    def DET_FRESHNESS(self) -> float:
+        """Longest age, in seconds, of the latest detection.  0 uses DET_BUDGET instead."""
+        return self._DET_FRESHNESS
+
+    @DET_FRESHNESS.setter
+    def DET_FRESHNESS(self, val: float) -> None:
+        self._DET_FRESHNESS = max(0.0, val)
+
+    @property
+    def ROI(self) -> list:
+        """Polygons of the frame to detect in; empty for the whole frame"""
+        return self._ROI
+
+    @ROI.setter
+    def ROI(self, val: list) -> None:
+        self._ROI = parse_polygons(val)
+
+    @property
+    def TILES(self) -> tuple:
+        """(cols, rows) tiles each region is split into for detection"""
+        return self._TILES
+
+    @TILES.setter
+    def TILES(self, val: str) -> None:
+        self._TILES = parse_tiles(val)
+
+    @property
+    def TILE_OVERLAP(self) -> float:
+        return self._TILE_OVERLAP
+
+    @TILE_OVERLAP.setter
+    def TILE_OVERLAP(self, val: float) -> None:
+        self._TILE_OVERLAP = min(max(0.0, val), 0.5)
+
+    @property
+    def MOTION_GATE(self) -> bool:
+        return self._MOTION_GATE
+
+    @MOTION_GATE.setter
+    def MOTION_GATE(self, val: bool) -> None:
+        self._MOTION_GATE = val
+
+    @property
+    def MOTION_THRESHOLD(self) -> float:
+        """Gray level difference from the background at which a pixel counts as changed"""
+        return self._MOTION_THRESHOLD
+
+    @MOTION_THRESHOLD.setter
+    def MOTION_THRESHOLD(self, val: float) -> None:
+        self._MOTION_THRESHOLD = min(max(0.0, val), 255.0)
+
+    @property
+    def MOTION_AREA(self) -> float:
+        """Fraction of changed pixels at which the scene is moving"""
+        return self._MOTION_AREA
+
+    @MOTION_AREA.setter
+    def MOTION_AREA(self, val: float) -> None:
+        self._MOTION_AREA = min(max(0.0, val), 1.0)
+
+    @property
+    def MOTION_MAX_IDLE(self) -> float:
+        """Longest time in seconds without a detection while the scene is still"""
+        return self._MOTION_MAX_IDLE
+
+    @MOTION_MAX_IDLE.setter
+    def MOTION_MAX_IDLE(self, val: float) -> None:
+        self._MOTION_MAX_IDLE = max(0.0, val)
+
+    @property
+    def TRACKING(self) -> bool:
+        return self._TRACKING
+
+    @TRACKING.setter
+    def TRACKING(self, val: bool) -> None:
+        self._TRACKING = val
+
+    @property
+    def TRACK_IOU(self) -> float:
+        """Smallest overlap of a detection with a track's box to continue the track"""
+        return self._TRACK_IOU
+
+    @TRACK_IOU.setter
+    def TRACK_IOU(self, val: float) -> None:
+        self._TRACK_IOU = min(max(0.0, val), 1.0)
+
+    @property
+    def TRACK_MAX_AGE(self) -> float:
+        """Seconds a track is kept without a matching detection"""
+        return self._TRACK_MAX_AGE
+
+    @TRACK_MAX_AGE.setter
+    def TRACK_MAX_AGE(self, val: float) -> None:
+        self._TRACK_MAX_AGE = max(0.0, val)
 
     @property
     def DISPLAY_FPS(self) -> float:
@@ -254,8 +547,8 @@ class ConfigYAML(yaml.YAMLObject):
     @DISPLAY_FPS.setter
     def DISPLAY_FPS(self, val: float) -> None:
         """Ensures that the display rate is not higher than cam rate"""
-        if val > self._CAM_FPS:
-            self._DISPLAY_FPS = self._CAM_FPS
+        if self.CAM_FPS and val > self.CAM_FPS:
+            self._DISPLAY_FPS = self.CAM_FPS
         else:
             self._DISPLAY_FPS = val
 
@@ -275,6 +568,22 @@ class ConfigYAML(yaml.YAMLObject):
     def MON_DIR(self, val: str) -> None:
         self._MON_DIR = val
 
+    @property
+    def SNAPSHOT_WORKERS(self) -> int:
+        return self._SNAPSHOT_WORKERS
+
+    @SNAPSHOT_WORKERS.setter
+    def SNAPSHOT_WORKERS(self, val: int) -> None:
+        self._SNAPSHOT_WORKERS = max(1, val)
+
+    @property
+    def SNAPSHOT_QUEUE(self) -> int:
+        return self._SNAPSHOT_QUEUE
+
+    @SNAPSHOT_QUEUE.setter
+    def SNAPSHOT_QUEUE(self, val: int) -> None:
+        self._SNAPSHOT_QUEUE = max(1, val)
+
     @property
     def MON_OBJS(self) -> set:
         return self._MON_OBJS
@@ -316,38 +625,122 @@ class ConfigYAML(yaml.YAMLObject):
             return False
 
     @property
-    def BASE_DELAY(self) -> float:
-        return self._BASE_DELAY
+    def PACE_LATENCY(self) -> float:
+        """Seconds of display buffering used to absorb capture jitter"""
+        return self._PACE_LATENCY
+
+    @PACE_LATENCY.setter
+    def PACE_LATENCY(self, val: float):
+        self._PACE_LATENCY = max(0.0, val)
+
+    @property
+    def PACE_MAX_LAG(self) -> float:
+        """Seconds the display may fall behind the source before it skips ahead"""
+        return self._PACE_MAX_LAG
+
+    @PACE_MAX_LAG.setter
+    def PACE_MAX_LAG(self, val: float):
+        self._PACE_MAX_LAG = max(0.0, val)
+
+    @property
+    def VIDEO_MAX_IN_FLIGHT(self) -> int:
+        """Frames sent to a socket video client that it may not have acknowledged yet"""
+        return self._VIDEO_MAX_IN_FLIGHT
+
+    @property
+    def RENDITIONS(self) -> list:
+        """Renditions of the video feed, largest first; the first is the default"""
+        return self._RENDITIONS
 
-    @BASE_DELAY.setter
-    def BASE_DELAY(self, val: float):
-        self._BASE_DELAY = max(0.0, val)
+    @RENDITIONS.setter
+    def RENDITIONS(self, val: dict) -> None:
+        self._RENDITIONS = parse_renditions(val)
     # END GETTERS AND SETTERS ##################################
 
     def __repr__(self):
-        return "%s(\n\tCAM_STREAM=%r, " \
+        return "%s(\n\tNAME=%r, " \
+               "\n\tCAM_STREAM=%r, " \
+               "\n\tSTREAM_CACHE_PATH=%r, " \
+               "\n\tSTREAM_CACHE_TTL=%r, " \
+               "\n\tSTALL_TIMEOUT=%r, " \
+               "\n\tRECONNECT_MAX_DELAY=%r, " \
                "\n\tLOGGING=%r, " \
                "\n\tLOG_FILEPATH=%r, " \
+               "\n\tLOG_DB_PATH=%r, " \
+               "\n\tLOG_RETENTION_DAYS=%r, " \
                "\n\tDETECTION=%r, " \
                "\n\tDETECTOR_NAME=%r, " \
                "\n\tDETECTOR_MODEL=%r, " \
+               "\n\tINFERENCE_WORKERS=%r, " \
+               "\n\tINFERENCE_MODE=%r, " \
+               "\n\tBATCH_SIZE=%r, " \
+               "\n\tBATCH_WAIT_MS=%r, " \
                "\n\tDPM=%r, " \
+               "\n\tDPM_MIN=%r, " \
+               "\n\tDPM_MAX=%r, " \
+               "\n\tDET_BUDGET=%r, " \
+               "\n\tDET_FRESHNESS=%r, " \
+               "\n\tROI=%r, " \
+               "\n\tTILES=%r, " \
+               "\n\tTILE_OVERLAP=%r, " \
+               "\n\tMOTION_GATE=%r, " \
+               "\n\tMOTION_THRESHOLD=%r, " \
+               "\n\tMOTION_AREA=%r, " \
+               "\n\tMOTION_MAX_IDLE=%r, " \
+               "\n\tTRACKING=%r, " \
+               "\n\tTRACK_IOU=%r, " \
+               "\n\tTRACK_MAX_AGE=%r, " \
                "\n\tDISPLAY_FPS=%r, " \
                "\n\tMONITORING=%r, " \
                "\n\tMON_DIR=%r, " \
+               "\n\tSNAPSHOT_WORKERS=%r, " \
+               "\n\tSNAPSHOT_QUEUE=%r, " \
                "\n\tMON_OBJS=%r, " \
                "\n\tDET_OBJS=%r, " \
-               "\n\tBASE_DELAY=%r)" % (self.__class__.__name__,
-                                       self.CAM_STREAM,
-                                       self.LOGGING,
-                                       self.LOG_FILEPATH,
-                                       self.DETECTION,
-                                       self.DETECTOR_NAME,
-                                       self.DETECTOR_MODEL,
-                                       self.DPM,
-                                       self.DISPLAY_FPS,
-                                       self.MONITORING,
-                                       self.MON_DIR,
-                                       self.MON_OBJS,
-                                       self.DET_OBJS,
-                                       self.BASE_DELAY)
+               "\n\tPACE_LATENCY=%r, " \
+               "\n\tPACE_MAX_LAG=%r, " \
+               "\n\tVIDEO_MAX_IN_FLIGHT=%r, " \
+               "\n\tRENDITIONS=%r)" % (self.__class__.__name__,
+                                         self.NAME,
+                                         self.CAM_STREAM,
+                                         self.STREAM_CACHE_PATH,
+                                         self.STREAM_CACHE_TTL,
+                                         self.STALL_TIMEOUT,
+                                         self.RECONNECT_MAX_DELAY,
+                                         self.LOGGING,
+                                         self.LOG_FILEPATH,
+                                         self.LOG_DB_PATH,
+                                         self.LOG_RETENTION_DAYS,
+                                         self.DETECTION,
+                                         self.DETECTOR_NAME,
+                                         self.DETECTOR_MODEL,
+                                         self.INFERENCE_WORKERS,
+                                         self.INFERENCE_MODE,
+                                         self.BATCH_SIZE,
+                                         self.BATCH_WAIT_MS,
+                                         self.DPM,
+                                         self.DPM_MIN,
+                                         self.DPM_MAX,
+                                         self.DET_BUDGET,
+                                         self.DET_FRESHNESS,
+                                         self.ROI,
+                                         self.TILES,
+                                         self.TILE_OVERLAP,
+                                         self.MOTION_GATE,
+                                         self.MOTION_THRESHOLD,
+                                         self.MOTION_AREA,
+                                         self.MOTION_MAX_IDLE,
+                                         self.TRACKING,
+                                         self.TRACK_IOU,
+                                         self.TRACK_MAX_AGE,
+                                         self.DISPLAY_FPS,
+                                         self.MONITORING,
+                                         self.MON_DIR,
+                                         self.SNAPSHOT_WORKERS,
+                                         self.SNAPSHOT_QUEUE,
+                                         self.MON_OBJS,
+                                         self.DET_OBJS,
+                                         self.PACE_LATENCY,
+                                         self.PACE_MAX_LAG,
+                                         self.VIDEO_MAX_IN_FLIGHT,
+                                         self.RENDITIONS)
@@ -0,0 +1,150 @@
+"""
+Counts of detected objects per wall clock minute, aggregated as the
+detections arrive.
+
+Each frame's detections are added to running sums of the current
+minute at once: the number of frames, and per class the number of
+detections and of newly tracked objects.  Nothing else is kept of a
+frame, so memory depends on the number of classes and not on the
+detection rate.  A minute is closed when the first detection of a
+later minute arrives or when it is flushed after the minute ended.
+The last closed minutes are kept for the sliding windows, e.g. of the
+last 1, 5 and 15 minutes.
+"""
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+from modules.detectors.detections import CLASS_NAMES
+
+# 'time' is the start of the minute in seconds since the epoch
+# 'averages' maps object names to their average count per detection frame
+# 'uniques' maps object names to the number of objects first tracked in the minute, or is None if untracked
+MinuteCounts = namedtuple("MinuteCounts", ['time', 'frames', 'averages', 'uniques'])
+
+
+def minute_start(t: float) -> float:
+    """Start of the wall clock minute holding time 't', in seconds since the epoch"""
+    return t - t % 60
+
+
+def _names(counts: np.array) -> dict:
+    return {CLASS_NAMES[i]: int(counts[i]) for i in np.nonzero(counts)[0]}
+
+
+class CountAggregator:
+    """
+    Thread-safe running counts of one camera's detections.  add() may be
+    called from any thread; flush() returns the minutes that ended, in
+    order, each once.
+    """
+
+    def __init__(self, windows: tuple = (1, 5, 15)):
+        """
+        :param windows: lengths in minutes of the sliding windows
+        """
+        self._windows = tuple(sorted(windows))
+        self._lock = threading.Lock()
+        self._minute = None  # start of the current minute, or None before the first detection
+        self._frames = 0
+        self._counts = np.zeros(len(CLASS_NAMES), dtype=np.int64)  # detections per class id
+        self._new = np.zeros(len(CLASS_NAMES), dtype=np.int64)  # new tracks per class id
+        self._tracked = False
+        self._recent = deque(maxlen=max(self._windows))  # closed minutes as (time, frames, counts, new, tracked)
+        self._ended = deque()  # closed minutes not flushed yet
+
+    @property
+    def windows(self) -> tuple:
+        return self._windows
+
+    def add(self, detections: np.array, frame_time: float = None):
+        """
+        Add the detections of one frame to the counts of the minute of
+        'frame_time', the wall clock time the frame was captured.
+        Detections of a minute that was already closed are counted in
+        the current minute.
+        """
+        minute = minute_start(time.time() if frame_time is None else frame_time)
+        class_id = detections['class_id']
+        counts = np.bincount(class_id, minlength=len(self._counts))
+        new = np.bincount(class_id[detections['new_track']], minlength=len(counts))
+        tracked = bool(detections['track_id'].any())
+
+        with self._lock:
+            if self._minute is None:
+                self._minute = minute
+            elif minute > self._minute:
+                self._close(minute)
+            if len(counts) > len(self._counts):
+                # a class registered since the minute started
+                self._counts = np.pad(self._counts, (0, len(counts) - len(self._counts)))
+                self._new = np.pad(self._new, (0, len(counts) - len(self._new)))
+            self._frames += 1
+            self._counts[:len(counts)] += counts
+            self._new[:len(new)] += new
+            self._tracked |= tracked
+
+    def flush(self, now: float = None, final: bool = False) -> list:
+        """
+        Close the current minute if it ended before 'now'.
+        :param final: close the current minute even if it has not ended, e.g. when logging stops
+        :return: list of MinuteCounts of the minutes closed since the last flush, oldest first
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._minute is not None and (final or minute_start(now) > self._minute):
+                self._close(minute_start(now) if minute_start(now) > self._minute else self._minute + 60)
+            ended = list(self._ended)
+            self._ended.clear()
+        return [self._summarize(m, frames, counts, new, tracked) for m, frames, counts, new, tracked in ended]
+
+    def window(self, minutes: int, now: float = None) -> MinuteCounts:
+        """
+        Counts of the closed minutes among the last 'minutes' whole
+        minutes before 'now'.  Averages are per detection frame over the
+        window; minutes without detections count no frames.
+        :return: MinuteCounts with the window's start as its 'time'
+        """
+        start = minute_start(time.time() if now is None else now) - minutes * 60
+        with self._lock:
+            recent = [m for m in self._recent if m[0] >= start]
+        frames = sum(m[1] for m in recent)
+        size = max((len(m[2]) for m in recent), default=0)
+        counts, new = np.zeros(size, dtype=np.int64), np.zeros(size, dtype=np.int64)
+        for _, _, c, n, _ in recent:
+            counts[:len(c)] += c
+            new[:len(n)] += n
+        return self._summarize(start, frames, counts, new, any(m[4] for m in recent))
+
+    def windows_summary(self, now: float = None) -> dict:
+        """
+        Counts of each sliding window, keyed by its length, e.g. '5m'.
+        :return: dictionary of dictionaries with 'start', 'frames', 'averages' and 'uniques'
+        """
+        summary = {}
+        for minutes in self._windows:
+            window = self.window(minutes, now)
+            summary["{}m".format(minutes)] = {'start': window.time,
+                                              'frames': window.frames,
+                                              'averages': window.averages,
+                                              'uniques': window.uniques}
+        return summary
+
+    def _close(self, next_minute: float):
+        """Close the current minute and start 'next_minute'.  Must be called with the lock held."""
+        if self._frames:
+            closed = (self._minute, self._frames, self._counts, self._new, self._tracked)
+            self._recent.append(closed)
+            self._ended.append(closed)
+        self._minute = next_minute
+        self._frames = 0
+        self._counts = np.zeros(len(self._counts), dtype=np.int64)
+        self._new = np.zeros(len(self._new), dtype=np.int64)
+        self._tracked = False
+
+    @staticmethod
+    def _summarize(minute: float, frames: int, counts: np.array, new: np.array, tracked: bool) -> MinuteCounts:
+        averages = {k: v / frames for k, v in _names(counts).items()} if frames else {}
+        return MinuteCounts(minute, frames, averages, _names(new) if tracked else None)
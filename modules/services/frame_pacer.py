@@ -0,0 +1,132 @@
+import time
+import threading
+
+
+class FramePacer:
+    """
+    Plays frames out at the cadence of the source.
+
+    Each frame's presentation time is its capture timestamp plus a
+    playout offset that is set on the first frame, so frames leave at
+    the same intervals at which they were captured and the display
+    buffer neither grows nor drains.  'latency' seconds are added to the
+    offset to absorb capture jitter, e.g. from streams that deliver
+    frames in bursts.
+
+    A frame that is more than one frame interval late is dropped, if the
+    caller allows it, so the output catches up instead of falling
+    further behind.  When the output is more than 'max_lag' seconds
+    behind, or the timestamps jump (a new stream or a seek), the offset
+    is reset to the current frame.
+
+    Jitter is the smoothed difference between the output and the capture
+    interval of consecutive frames, as in RFC 3550.  Lag is the smoothed
+    time by which frames were shown after their presentation time.
+    """
+
+    def __init__(self, latency: float = 0.1, max_lag: float = 1.0, max_gap: float = 2.0):
+        """
+        :param latency: seconds of buffering added to the playout offset
+        :param max_lag: seconds behind the source after which the offset is reset
+        :param max_gap: largest step in capture timestamps that is not a discontinuity
+        """
+        self._latency = latency
+        self._max_lag = max_lag
+        self._max_gap = max_gap
+        self._offset = None
+        self._last_pts = None
+        self._last_out = None
+        self._interval = 0.0  # smoothed capture interval
+        self._jitter = 0.0
+        self._lag = 0.0
+        self._shown = 0
+        self._dropped = 0
+        self._resyncs = 0
+        self._lock = threading.Lock()
+
+    @property
+    def jitter(self) -> float:
+        return self._jitter
+
+    @property
+    def lag(self) -> float:
+        return self._lag
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    @property
+    def resyncs(self) -> int:
+        return self._resyncs
+
+    @property
+    def fps(self) -> float:
+        """Frame rate of the source from its capture timestamps"""
+        return 1 / self._interval if self._interval else 0.0
+
+    @property
+    def stats(self) -> dict:
+        return {'fps': round(self.fps, 1),
+                'jitter_ms': round(self._jitter * 1000, 1),
+                'lag_ms': round(self._lag * 1000, 1),
+                'shown': self._shown,
+                'dropped': self._dropped,
+                'resyncs': self._resyncs}
+
+    def reset(self):
+        """Start again with the next frame, e.g. after the source changed"""
+        with self._lock:
+            self._offset = None
+            self._last_pts = None
+            self._last_out = None
+
+    def pace(self, pts: float, droppable: bool = True) -> bool:
+        """
+        Wait until the frame captured at 'pts' is due.
+        :param pts: capture timestamp of the frame in seconds
+        :param droppable: whether the frame may be dropped when late
+        :return: True if the frame should be shown, False if it was dropped
+        """
+        with self._lock:
+            now = time.monotonic()
+
+            if self._offset is None or pts <= self._last_pts or pts - self._last_pts > self._max_gap:
+                self._resync(pts, now + self._latency)
+            elif not self._interval:
+                self._interval = pts - self._last_pts
+            else:
+                self._interval += (pts - self._last_pts - self._interval) / 16
+
+            due = pts + self._offset
+            late = now - due
+            if late > self._max_lag:
+                self._resync(pts, now)
+                due, late = now, 0.0
+            elif droppable and self._interval and late > self._interval:
+                self._last_pts = pts
+                self._dropped += 1
+                return False
+
+            last_pts, self._last_pts = self._last_pts, pts
+
+        if due > now:
+            time.sleep(due - now)
+
+        with self._lock:
+            out = time.monotonic()
+            if self._last_out is not None and last_pts is not None:
+                d = abs((out - self._last_out) - (pts - last_pts))
+                self._jitter += (d - self._jitter) / 16
+            self._lag += (max(late, 0.0) - self._lag) / 16
+            self._last_out = out
+            self._shown += 1
+        return True
+
+    def _resync(self, pts: float, due: float):
+        """Make 'pts' due at 'due'.  Must be called with the lock held."""
+        if self._offset is not None:
+            self._resyncs += 1
+        self._offset = due - pts
+        self._last_pts = None
+        self._last_out = None
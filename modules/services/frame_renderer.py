@@ -0,0 +1,135 @@
+"""
+Draws the annotations of display frames and snapshots.
+
+Frames in the FrameRing stay as they were decoded.  Detectors return
+only detections and the overlay stage attaches the detections and the
+tracks predicted between detections to the frame's slot.  The raw frame
+is shared without copying by detection, monitoring and the video feed,
+and the boxes are drawn from the detection data onto a copy only where
+a frame leaves the application: the display frame while someone
+watches, and a snapshot in the snapshot writer's slot.
+
+Text that is the same on every frame, e.g. the camera name, is rendered
+once into a cached layer that is copied onto the text's own pixels
+only.  The statistics are shown in the Video Controls section of the
+page instead of on the frame.
+"""
+import cv2
+import numpy as np
+
+from modules.detectors.detector import draw_detections
+from modules.detectors.detections import CLASS_NAMES
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.4
+LINE_HEIGHT = 15
+MARGIN = 10
+
+
+def add_tracks(frame: np.array, tracks: np.array, boxes: bool = True) -> np.array:
+    """
+    Labels tracked objects in 'frame' with their track ids.  Draws
+    the boxes too if 'boxes', for tracks predicted between detections.
+    """
+    for class_id, track_id, (x1, y1, x2, y2) in zip(tracks['class_id'].tolist(), tracks['track_id'].tolist(),
+                                                    tracks['box'].tolist()):
+        if boxes:
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 1)
+            label = "{} #{}".format(CLASS_NAMES[class_id], track_id)
+        else:
+            label = "#{}".format(track_id)
+        cv2.putText(frame, label,
+                    (x1, min(y2 + 12, frame.shape[0] - 2)),
+                    fontFace=FONT,
+                    fontScale=FONT_SCALE,
+                    color=(255, 0, 0),
+                    thickness=1)
+
+    return frame
+
+
+def draw_annotations(frame: np.array, detections: np.array = None, tracks: np.array = None) -> np.array:
+    """
+    Draw into 'frame' the boxes and scores of 'detections', labelled
+    with their track ids if they are tracked, and the boxes of the
+    'tracks' predicted for a frame between detections.
+    """
+    if detections is not None and len(detections):
+        draw_detections(frame, detections)
+        add_tracks(frame, detections[detections['track_id'] > 0], boxes=False)
+    if tracks is not None and len(tracks):
+        add_tracks(frame, tracks)
+    return frame
+
+
+def render_text(lines: list, shape: tuple, color: tuple = (200, 0, 0)) -> (int, int, np.array, np.array):
+    """
+    Render lines of text, the first at the bottom left corner of a frame
+    of 'shape' and the others above it, into a patch just large enough
+    to hold them.
+    :return: top and left position of the patch in the frame, the patch and
+    the mask of its text pixels
+    """
+    h, w = shape[:2]
+    sizes = [cv2.getTextSize(line, FONT, FONT_SCALE, 1) for line in lines]
+    text_h = max(size[1] for size, _ in sizes)
+    baseline = max(base for _, base in sizes)
+    bottom = min(h, h - MARGIN + baseline + 1)
+    top = max(0, h - MARGIN - (len(lines) - 1) * LINE_HEIGHT - text_h - 1)
+    left = min(MARGIN, w - 1)
+    right = min(w, left + max(size[0] for size, _ in sizes) + 1)
+
+    patch = np.zeros((bottom - top, right - left) + tuple(shape[2:]), dtype=np.uint8)
+    for i, line in enumerate(lines):
+        cv2.putText(patch, line, (0, h - MARGIN - i * LINE_HEIGHT - top),
+                    fontFace=FONT,
+                    fontScale=FONT_SCALE,
+                    color=color,
+                    thickness=1)
+    mask = patch.any(axis=-1, keepdims=True) if patch.ndim == 3 else patch > 0
+    return top, left, patch, mask
+
+
+class FrameRenderer:
+    """
+    Renders the display frames of a camera.  Each frame is copied into a
+    buffer that is reused for every frame, its annotations are drawn and
+    the text layer is composited onto it.  The text layer is rendered
+    again only when its text or the frame size changes.
+    """
+
+    def __init__(self, text: list = None):
+        """
+        :param text: lines of text shown on every frame, the first at the bottom
+        """
+        self._text = list(text or ())
+        self._layer = None  # (frame shape, text, top, left, patch, mask)
+        self._buffer = None
+
+    @property
+    def text(self) -> list:
+        return list(self._text)
+
+    @text.setter
+    def text(self, lines: list):
+        self._text = list(lines or ())
+
+    def render(self, frame: np.array, detections: np.array = None, tracks: np.array = None) -> np.array:
+        """
+        Annotated copy of 'frame'; 'frame' is not changed.
+        :return: the renderer's buffer, valid until the next call
+        """
+        if self._buffer is None or self._buffer.shape != frame.shape:
+            self._buffer = np.empty_like(frame)
+        np.copyto(self._buffer, frame)
+        draw_annotations(self._buffer, detections, tracks)
+        if self._text:
+            top, left, patch, mask = self._get_layer(frame.shape)
+            np.copyto(self._buffer[top:top + patch.shape[0], left:left + patch.shape[1]], patch, where=mask)
+        return self._buffer
+
+    def _get_layer(self, shape: tuple) -> tuple:
+        text = tuple(self._text)
+        if self._layer is None or self._layer[:2] != (shape, text):
+            self._layer = (shape, text) + render_text(self._text, shape)
+        return self._layer[2:]
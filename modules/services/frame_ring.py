@@ -0,0 +1,206 @@
+import os
+import mmap
+import tempfile
+import threading
+import weakref
+from collections import deque
+
+import numpy as np
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _shm_dir() -> str:
+    """Directory for shared memory files; RAM backed where available"""
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+class FrameRing:
+    """
+    Fixed-size ring of preallocated frame slots in one shared memory file.
+
+    Each slot holds a frame image and its metadata (frame number, capture
+    time, presentation timestamp, detections and predicted tracks).  The
+    image stays as it was decoded; annotations are drawn from the metadata
+    onto a copy.  The capture loop decodes straight into a free
+    slot and the pipeline stages pass slot numbers instead of images.
+    Readers get zero-copy views of a slot.  A slot goes back to the free
+    list only when its reader releases it, so a view stays valid until
+    then.  A stage that reads a slot alongside the reader, e.g. an
+    inference worker, retains it and releases it when done; the slot is
+    freed by the last release.
+
+    At most 'max_ready' published slots wait for a reader.  Publishing
+    beyond that returns the oldest waiting slot to the free list, so a
+    slow or absent reader never holds up the writer.
+
+    The images are held in a memory mapped file so that any process can
+    map the same frames with attach() using the ring's descriptor, also
+    processes that were started before the ring was created.
+    """
+
+    def __init__(self, num_slots: int, shape: tuple, max_ready: int = None):
+        self._num_slots = num_slots
+        self._max_ready = max_ready or num_slots
+        self._shape = tuple(shape)
+
+        size = num_slots * int(np.prod(shape))
+        fd, self._path = tempfile.mkstemp(prefix='frame_ring_', dir=_shm_dir())
+        os.ftruncate(fd, size)
+        self._mmap = mmap.mmap(fd, size)
+        os.close(fd)
+        self._finalizer = weakref.finalize(self, _remove, self._path)  # also removes the file at exit
+        self._frames = np.frombuffer(self._mmap, dtype=np.uint8).reshape((num_slots,) + self._shape)
+        self._nums = np.zeros(num_slots, dtype=np.int64)
+        self._times = np.zeros(num_slots, dtype=np.float64)
+        self._pts = np.zeros(num_slots, dtype=np.float64)
+        self._detections = [None] * num_slots
+        self._tracks = [None] * num_slots
+        self._refs = [0] * num_slots  # holders of each slot; free slots have none
+
+        self._cond = threading.Condition()
+        self._free = deque(range(num_slots))
+        self._ready = deque()
+        self._dropped = 0
+
+    @staticmethod
+    def attach(descriptor: tuple) -> np.array:
+        """Map the frames of a ring in another process from its descriptor."""
+        path, num_slots, shape = descriptor
+        with open(path, 'r+b') as fp:
+            mm = mmap.mmap(fp.fileno(), num_slots * int(np.prod(shape)))
+        return np.frombuffer(mm, dtype=np.uint8).reshape((num_slots,) + tuple(shape))
+
+    @property
+    def descriptor(self) -> tuple:
+        """(path, num_slots, shape) used by other processes to attach() the ring"""
+        return self._path, self._num_slots, self._shape
+
+    @property
+    def num_slots(self) -> int:
+        return self._num_slots
+
+    @property
+    def shape(self) -> tuple:
+        return self._shape
+
+    @property
+    def ready_count(self) -> int:
+        """Number of frames waiting to be read"""
+        return len(self._ready)
+
+    @property
+    def free_count(self) -> int:
+        return len(self._free)
+
+    @property
+    def dropped(self) -> int:
+        """Number of published slots dropped before a reader took them"""
+        return self._dropped
+
+    def frame(self, slot: int) -> np.array:
+        """Zero-copy view of the image in 'slot'"""
+        return self._frames[slot]
+
+    def num(self, slot: int) -> int:
+        return int(self._nums[slot])
+
+    def time(self, slot: int) -> float:
+        return float(self._times[slot])
+
+    def pts(self, slot: int) -> float:
+        return float(self._pts[slot])
+
+    def detections(self, slot: int) -> np.array:
+        return self._detections[slot]
+
+    def tracks(self, slot: int) -> np.array:
+        """Tracks predicted for a frame between detections, or None"""
+        return self._tracks[slot]
+
+    def acquire(self, timeout: float = None):
+        """
+        Take a free slot to write a frame into.
+        :return: slot number or None if no slot was freed in time
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._free, timeout=timeout):
+                return None
+            slot = self._free.popleft()
+            self._refs[slot] = 1
+        self._clear_meta(slot)
+        return slot
+
+    def set_meta(self, slot: int, frame_num: int, frame_time: float, pts: float = 0.0):
+        """
+        :param frame_time: wall clock time the frame was captured
+        :param pts: timestamp of the frame in the stream, in seconds, used to pace the display
+        """
+        self._nums[slot] = frame_num
+        self._times[slot] = frame_time
+        self._pts[slot] = pts
+
+    def set_detections(self, slot: int, detections: np.array):
+        self._detections[slot] = detections
+
+    def set_tracks(self, slot: int, tracks: np.array):
+        self._tracks[slot] = tracks
+
+    def _clear_meta(self, slot: int):
+        self._detections[slot] = None
+        self._tracks[slot] = None
+
+    def publish(self, slot: int):
+        """
+        Mark a written slot as ready for readers, in publish order.
+        Drops the oldest ready slot if more than 'max_ready' are waiting.
+        """
+        with self._cond:
+            self._ready.append(slot)
+            if len(self._ready) > self._max_ready:
+                self._release(self._ready.popleft())
+                self._dropped += 1
+            self._cond.notify_all()
+
+    def next_ready(self, timeout: float = None):
+        """
+        Take the oldest ready slot.  The caller must release() it.
+        :return: slot number or None on timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._ready, timeout=timeout):
+                return None
+            return self._ready.popleft()
+
+    def retain(self, slot: int):
+        """Keep a slot out of the free list until release() is called once more."""
+        with self._cond:
+            self._refs[slot] += 1
+
+    def release(self, slot: int):
+        """Return a slot to the free list once all its holders released it."""
+        with self._cond:
+            self._release(slot)
+            self._cond.notify_all()
+
+    def _release(self, slot: int):
+        """Must be called with the lock held."""
+        self._refs[slot] -= 1
+        if self._refs[slot] <= 0:
+            self._refs[slot] = 0
+            self._clear_meta(slot)
+            self._free.append(slot)
+
+    def close(self):
+        """
+        Remove the shared memory file.  Existing mappings stay valid
+        until they are released.
+        """
+        self._finalizer()
@@ -0,0 +1,531 @@
+import os
+import threading
+import time
+import logging
+import multiprocessing as mp
+from collections import namedtuple, deque, OrderedDict
+
+import numpy as np
+
+from modules.detectors.detector_factory import DetectorFactory
+from modules.detectors.detector import Detector
+from modules.detectors.regions import crop_frame, merge_detections
+from modules.detectors.detections import CLASS_NAMES, register_classes
+from modules.services.service import Service
+from modules.services.frame_ring import FrameRing
+from modules.services.metrics import METRICS, SIZE_BUCKETS
+
+logger = logging.getLogger('app')
+
+# 'ring' is the descriptor of the FrameRing holding the image in 'slot', or None
+# 'regions' is the list of Crops of the frame to detect, or None for the whole frame
+InferenceRequest = namedtuple("InferenceRequest", ['source', 'frame_num', 'image', 'det_objs', 'slot', 'ring',
+                                                   'regions'])
+
+
+class FrameBatcher:
+    """
+    Bounded hand-off between the capture loops of one or more sources
+    (cameras) and the inference workers.
+
+    Holds at most 'batch_size' of the most recent frames of each source.
+    A put() never blocks: when a source's queue is full its oldest frame
+    is displaced, so inference always works on the freshest images and
+    capture never waits on the detector.
+
+    A worker's get_batch() returns as soon as 'batch_size' frames are
+    waiting or 'max_wait' seconds after the first frame of the batch
+    arrived, whichever comes first.  Batches are filled round-robin
+    across sources, starting with a different source each time, so a
+    busy camera can not starve the others.  With one source and a batch
+    size of 1 this is a latest-frame slot.
+    """
+
+    def __init__(self, batch_size: int = 1, max_wait: float = 0.0):
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # source -> deque of items
+        self._pending = 0
+        self._first_time = None
+        self._batch_size = max(1, int(batch_size))
+        self._max_wait = max_wait
+        self._closed = False
+
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size
+
+    @property
+    def pending(self) -> int:
+        """Number of items waiting for a worker"""
+        return self._pending
+
+    def put(self, source: str, item):
+        """
+        Add a source's item to the pending batch.
+        :return: the item that was displaced, or None
+        """
+        with self._cond:
+            q = self._queues.setdefault(source, deque())
+            displaced = None
+            if len(q) >= self._batch_size:
+                displaced = q.popleft()
+                self._pending -= 1
+            if not self._pending:
+                self._first_time = time.monotonic()
+            q.append(item)
+            self._pending += 1
+            self._cond.notify()
+        return displaced
+
+    def get_batch(self, timeout: float = None) -> list:
+        """
+        Take up to 'batch_size' pending items, waiting for the batch to fill or time out.
+        :return: list of items, empty if the batcher was closed or nothing arrived
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._pending or self._closed, timeout=timeout):
+                return []
+
+            # wait for the batch to fill until max_wait after the first item
+            while not self._closed and self._pending < self._batch_size:
+                remaining = self._first_time + self._max_wait - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = []
+            while self._pending and len(batch) < self._batch_size:
+                for source in list(self._queues):
+                    q = self._queues[source]
+                    if q and len(batch) < self._batch_size:
+                        batch.append(q.popleft())
+                        self._pending -= 1
+                # next batch starts with the next source
+                if self._queues:
+                    self._queues.move_to_end(next(iter(self._queues)))
+
+            if self._pending:
+                self._first_time = time.monotonic()
+        return batch
+
+    def discard(self, source: str) -> list:
+        """Remove and return all pending items of a source"""
+        with self._cond:
+            items = list(self._queues.pop(source, ()))
+            self._pending -= len(items)
+        return items
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+# shape of the blank frames the detector is warmed up with
+WARMUP_SHAPE = (480, 640, 3)
+
+
+def _load_detector(detector_name: str, detector_model: str, batch_size: int) -> (Detector, float, float):
+    """
+    Load the detector and run it on blank frames, alone and as a full
+    batch, so that the first real frames do not pay for building the
+    model's graph and allocating its buffers.
+    :return: detector, seconds loading took, seconds warm-up took
+    """
+    start = time.perf_counter()
+    detector = DetectorFactory.get(detector_name, detector_model)
+    if detector is None:
+        raise Exception("detector not supported: {}/{}".format(detector_name[0], detector_model[0]))
+    loaded = time.perf_counter()
+
+    frames = [np.zeros(WARMUP_SHAPE, dtype=np.uint8) for _ in range(max(1, batch_size))]
+    detector.detect(frame=frames[0], det_objs=None)
+    if len(frames) > 1:
+        detector.detect_batch(frames=frames, det_objs=None)
+
+    return detector, loaded - start, time.perf_counter() - loaded
+
+
+def _process_worker(conn, detector_name, detector_model, batch_size):
+    """
+    Entry point of a process worker.  Each process loads and warms up
+    its own copy of the detector, reports ('ready', load time, warm-up
+    time, trained objects, class names) or ('failed', error) and then
+    serves detection
+    requests from 'conn' until it receives None.  Requests for frames
+    held in a FrameRing carry the ring's descriptor and a slot number
+    instead of the image.  Each ring is mapped once and unmapped when
+    its source moves to a new ring or the ring is closed.
+    """
+    try:
+        detector, load_time, warmup_time = _load_detector(detector_name, detector_model, batch_size)
+    except Exception as e:
+        conn.send(('failed', str(e)))
+        conn.close()
+        return
+    conn.send(('ready', load_time, warmup_time, detector.get_trained_objects(), list(CLASS_NAMES)))
+    rings = {}  # ring path -> mapped frames
+    source_rings = {}  # source -> path of its current ring
+
+    while True:
+        batch = conn.recv()
+        if batch is None:
+            break
+
+        conn.send(_detect_batch(detector, _map_frames(batch, rings, source_rings)))
+
+    conn.close()
+
+
+def _map_frames(batch: list, rings: dict, source_rings: dict) -> list:
+    """
+    Requests of 'batch' with the images of frames held in a FrameRing
+    filled in from the ring's mapping, mapping new rings first.
+    :param rings: ring path -> mapped frames
+    :param source_rings: source -> path of its current ring
+    """
+    source_rings.update((r.source, r.ring[0]) for r in batch if r.ring is not None)
+    _unmap_rings(rings, source_rings)
+
+    requests = []
+    for r in batch:
+        if r.ring is not None:
+            try:
+                if r.ring[0] not in rings:
+                    rings[r.ring[0]] = FrameRing.attach(r.ring)
+                r = r._replace(image=rings[r.ring[0]][r.slot])
+            except OSError as e:
+                logger.error("inference process // ring {}: {}".format(r.ring[0], e))
+        requests.append(r)
+    return requests
+
+
+def _unmap_rings(rings: dict, source_rings: dict):
+    """
+    Drop the mappings of rings that no source uses any more, e.g. of a
+    video service that restarted with a new ring, and of rings whose
+    file was removed because their source stopped, so that their shared
+    memory is freed.
+    """
+    for source, path in list(source_rings.items()):
+        if not os.path.exists(path):
+            del source_rings[source]
+    for path in set(rings) - set(source_rings.values()):
+        del rings[path]
+
+
+def _detect_batch(detector: Detector, batch: list) -> list:
+    """
+    Run detection on a batch of InferenceRequests.  Requests are grouped
+    by their set of detected objects since each source may detect
+    different objects.  A set of None detects every object the detector
+    knows; an empty set detects none.  Requests with regions are cut
+    into their tiles, which are detected in the same pass as the whole
+    frames of the group, and the tiles' detections are merged back into
+    one frame.
+    :return: list of (source, frame_num, detections, latency) where
+    latency is the time in seconds detection of the frame's group took
+    """
+    groups = OrderedDict()
+    for r in batch:
+        if r.image is not None:
+            groups.setdefault(None if r.det_objs is None else frozenset(r.det_objs), []).append(r)
+
+    results = {}
+    for det_objs, requests in groups.items():
+        det_objs = None if det_objs is None else set(det_objs)
+        start = time.perf_counter()
+
+        images = []
+        for r in requests:
+            if r.regions:
+                images.extend(crop_frame(r.image, crop) for crop in r.regions)
+            else:
+                images.append(r.image)
+
+        try:
+            if len(images) == 1:
+                detected = [detector.detect(frame=images[0], det_objs=det_objs)]
+            else:
+                detected = detector.detect_batch(frames=images, det_objs=det_objs)
+        except Exception as e:
+            logger.error("inference // DETECTION: {}".format(e))
+            detected = [None] * len(images)
+        latency = time.perf_counter() - start
+
+        i = 0
+        for r in requests:
+            if r.regions:
+                tiles = detected[i:i + len(r.regions)]
+                i += len(r.regions)
+                if all(d is None for d in tiles):
+                    detections = None
+                else:
+                    detections = merge_detections(tiles, r.regions)
+            else:
+                detections = detected[i]
+                i += 1
+            results[(r.source, r.frame_num)] = (detections, latency if detections is not None else None)
+
+    return [(r.source, r.frame_num) + results.get((r.source, r.frame_num), (None, None)) for r in batch]
+
+
+class InferenceService(Service):
+    """
+    Inference engine shared by all cameras.  Runs object detection off
+    the capture threads.
+
+    Each camera registers as a source with a result callback.  Frames are
+    submitted to a FrameBatcher and picked up in batches by a pool of
+    inference workers, taking frames from all sources in turn.  Each
+    worker is a thread; in 'process' mode each thread is a proxy for a
+    child process holding its own copy of the detector.  Frames that live
+    in a FrameRing are sent to process workers as a slot number.  Results
+    are returned through the source's callback as (frame_num, detections,
+    latency) so that callers can attach them to the frame with the same
+    number.  Only the detections are returned, never an image, so process
+    workers send back a few bytes per frame.  'latency' is the time
+    detection took, without the time the frame waited for a worker, or
+    None if detection failed, in which case the detections are None.
+
+    The detector is loaded and warmed up in the background when the
+    service starts, in each process in 'process' mode, so nothing waits
+    for the model.  The service is 'loading' until the first worker is
+    ready, then 'ready', or 'failed' if no worker could load the model.
+    Sources should not submit frames until the service is ready.
+    """
+
+    def __init__(self,
+                 name: str,
+                 detector_name: str,
+                 detector_model: str,
+                 workers: int = 1,
+                 mode: str = 'thread',
+                 batch_size: int = 1,
+                 batch_wait: float = 0.0):
+        Service.__init__(self, name)
+        self._detector_name = detector_name
+        self._detector_model = detector_model
+        self._detector = None  # loaded by start(); only in this process in 'thread' mode
+        self._state = 'stopped'
+        self._state_lock = threading.Lock()
+        self._workers_ready = 0
+        self._workers_failed = 0
+        self._trained_objects = set()
+        self._load_time = None
+        self._warmup_time = None
+        self._error = None
+        self._loaded = threading.Event()
+        self._num_workers = max(1, int(workers))
+        self._mode = mode
+        self._batcher = FrameBatcher(batch_size=batch_size, max_wait=batch_wait)
+        self._sources = {}  # source -> (on_result, ring, regions)
+        self._workers = []
+        self._processes = []
+        self._detection_time = {}  # source -> histogram of detection latencies
+        self._failures = {}  # source -> counter of failed detections
+        self._batch_sizes = METRICS.histogram("inference_batch_size", "Frames per inference batch",
+                                              buckets=SIZE_BUCKETS)
+        METRICS.gauge("inference_pending", "Frames waiting for an inference worker", fn=lambda: self._batcher.pending)
+
+    @property
+    def detector(self) -> Detector:
+        """The detector of the thread workers, or None in 'process' mode or while loading"""
+        return self._detector
+
+    @property
+    def ready(self) -> bool:
+        """Whether a worker has loaded and warmed up the detector"""
+        return self._state == 'ready'
+
+    @property
+    def status(self) -> dict:
+        return {'state': self._state,
+                'detector': self._detector_name[0],
+                'model': self._detector_model[0],
+                'workers': self._num_workers,
+                'workers_ready': self._workers_ready,
+                'load_s': round(self._load_time, 2) if self._load_time is not None else None,
+                'warmup_s': round(self._warmup_time, 2) if self._warmup_time is not None else None,
+                'error': self._error}
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait until the detector is loaded or failed to load.
+        :return: True if the service is ready
+        """
+        self._loaded.wait(timeout)
+        return self.ready
+
+    def get_trained_objects(self) -> set:
+        """Objects the detector can detect, empty until the detector is loaded"""
+        return self._trained_objects
+
+    @property
+    def num_workers(self) -> int:
+        return self._num_workers
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    def register(self, source: str, on_result, ring: FrameRing = None, regions: list = None):
+        """
+        Register a source (camera) and the callback that receives its
+        results.  Registering again replaces the callback, ring and regions.
+        :param regions: list of Crops to detect instead of the whole frame, or None
+        """
+        self._sources[source] = (on_result, ring, regions)
+        self._detection_time[source] = METRICS.histogram("inference_seconds", "Time to detect the objects of a frame",
+                                                         camera=source)
+        self._failures[source] = METRICS.counter("inference_failures_total", "Detections that failed",
+                                                 camera=source)
+
+    def unregister(self, source: str):
+        self._sources.pop(source, None)
+        self._batcher.discard(source)
+
+    def submit(self, source: str, frame_num: int, image: np.array, det_objs: set, slot: int = None):
+        """
+        Offer a frame for detection.  Never blocks.
+        :param slot: slot of the source's ring holding 'image', if the frame is in the ring
+        :return: frame number of a frame of the same source that was dropped
+        from the batcher before a worker picked it up, or None
+        """
+        _, ring, regions = self._sources.get(source, (None, None, None))
+        request = InferenceRequest(source, frame_num, image, det_objs, slot,
+                                   ring.descriptor if ring is not None and slot is not None else None,
+                                   regions)
+        displaced = self._batcher.put(source, request)
+        if displaced is None:
+            return None
+        return displaced.frame_num
+
+    def start(self):
+        """Start loading the detector and the workers.  Returns at once."""
+        if self._running:
+            return
+        self._running = True
+        self._state = 'loading'
+
+        if self._mode == 'process':
+            for i in range(self._num_workers):
+                parent_conn, child_conn = mp.Pipe()
+                p = mp.Process(target=_process_worker,
+                               args=(child_conn, self._detector_name, self._detector_model,
+                                     self._batcher.batch_size),
+                               daemon=True)
+                p.start()
+                self._processes.append((p, parent_conn))
+                self._start_worker(i, self._run_process_proxy, parent_conn)
+        else:
+            threading.Thread(target=self._load_thread_workers, daemon=True,
+                             name="{}-loader".format(self.getName())).start()
+
+        logger.info("{}: loading {} {} worker(s)".format(self.getName(), self._num_workers, self._mode))
+
+    def _start_worker(self, i: int, target, *args):
+        t = threading.Thread(target=target, args=args, daemon=True,
+                             name="{}-{}".format(self.getName(), i))
+        t.start()
+        self._workers.append(t)
+
+    def _load_thread_workers(self):
+        """Load the detector shared by the thread workers, then start them"""
+        try:
+            detector, load_time, warmup_time = _load_detector(self._detector_name, self._detector_model,
+                                                              self._batcher.batch_size)
+        except Exception as e:
+            self._set_failed(str(e))
+            return
+
+        self._detector = detector
+        for i in range(self._num_workers):
+            self._start_worker(i, self._run_thread_worker)
+            self._set_ready(load_time, warmup_time, detector.get_trained_objects(), CLASS_NAMES)
+
+    def _set_ready(self, load_time: float, warmup_time: float, trained_objects: set, class_names: list):
+        # class ids of detections from a process index its class names
+        register_classes(class_names)
+        with self._state_lock:
+            self._workers_ready += 1
+            if self._state == 'ready':
+                return
+            self._load_time, self._warmup_time = load_time, warmup_time
+            self._trained_objects = trained_objects
+            self._error = None
+            self._state = 'ready'
+        self._loaded.set()
+        logger.info("{}: {} ready - loaded in {:.1f}s, warmed up in {:.1f}s".format(
+            self.getName(), self._detector_model[0], load_time, warmup_time))
+
+    def _set_failed(self, error: str):
+        logger.error("{}: detector failed to load: {}".format(self.getName(), error))
+        with self._state_lock:
+            self._workers_failed += 1
+            self._error = error
+            if self._state != 'ready':
+                self._state = 'failed'
+        # in 'process' mode another worker may still load the model
+        if self._mode != 'process' or self._workers_ready + self._workers_failed >= self._num_workers:
+            self._loaded.set()
+
+    def stop(self):
+        self._running = False
+        self._batcher.close()
+        for p, conn in self._processes:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            p.join(timeout=5)
+        self._processes = []
+
+    def _return_results(self, results: list):
+        for source, frame_num, detections, latency in results:
+            if source in self._detection_time:
+                if latency is None:
+                    self._failures[source].inc()
+                else:
+                    self._detection_time[source].observe(latency)
+            on_result = self._sources.get(source, (None, None, None))[0]
+            if on_result:
+                on_result(frame_num, detections, latency)
+
+    def _run_thread_worker(self):
+        while self._running:
+            batch = self._batcher.get_batch(timeout=1)
+            if not batch:
+                continue
+            self._batch_sizes.observe(len(batch))
+            self._return_results(_detect_batch(self._detector, batch))
+
+    def _run_process_proxy(self, conn):
+        # wait for the process to load and warm up its detector
+        try:
+            while self._running and not conn.poll(1):
+                continue
+            if not self._running:
+                return
+            message = conn.recv()
+        except (EOFError, OSError) as e:
+            message = ('failed', "inference process lost: {}".format(e))
+        if message[0] != 'ready':
+            self._set_failed(message[1])
+            return
+        self._set_ready(*message[1:])
+
+        while self._running:
+            batch = self._batcher.get_batch(timeout=1)
+            if not batch:
+                continue
+            self._batch_sizes.observe(len(batch))
+            request = [r._replace(image=None) if r.ring is not None else r for r in batch]
+            try:
+                conn.send(request)
+                results = conn.recv()
+            except (EOFError, BrokenPipeError, OSError) as e:
+                logger.error("{} // inference process lost: {}".format(self.getName(), e))
+                self._return_results([(r.source, r.frame_num, None, None) for r in batch])
+                break
+            self._return_results(results)
@@ -1,46 +1,50 @@
 import time
 import datetime
-import os
 import threading
-from collections import Counter
 import json
 import logging
 
+import numpy as np
 from flask_socketio import SocketIO
 
 from modules.services.service import Service
-from modules.timers.elapsed_time import ElapsedTime
+from modules.services.count_aggregator import CountAggregator, MinuteCounts
+from modules.storage.detection_store import DetectionStore
 
 logger = logging.getLogger('app')
 
 
 class LoggingService(Service, threading.Thread):
     """
-    Log detections to file.
-    After each detection, the detected items are logged.  After the
-    logging interval has expired, a summary of the items logged
-    is calculated and the averages over the time period are stored.
+    Log detections to the detection history store.
+    After each detection, the detected items are added to the running
+    counts of the minute the frame was captured in by a CountAggregator.
+    At each wall clock minute the averages of the minutes that ended are
+    stored and sent to the log listing.
 
-    This thread will convert that list into the averages for the
-    logging period (usu. 1 minute).
+    The averages are per detection frame.  When objects are tracked, the
+    number of new objects in the minute is stored as well, which counts
+    each object once however many frames it was detected in.  The counts
+    of the last 1, 5 and 15 minutes are kept as sliding windows.
 
     Since this process must count detection statistics on a fixed interval,
     this process is run as a thread to ensure that it calculates summaries
-    after the specified logging period and not only after a detection has
-    been made.
+    at each minute and not only after a detection has been made.
     """
 
     def __init__(self,
                  name: str,
-                 file_path: str,
+                 camera: str,
+                 store: DetectionStore,
                  detection_rate: float,
                  socketio: SocketIO):
         Service.__init__(self, name)
         threading.Thread.__init__(self)
         self.name = name
-        self._elapsed_time = None
-        self._detections = None
-        self._log_filepath = file_path
+        self._camera = camera
+        self._counts = CountAggregator()
+        self._stopped = threading.Event()
+        self._store = store
         self._dpm = detection_rate
         self._socketio = socketio
 
@@ -54,128 +58,87 @@ class LoggingService(Service, threading.Thread):
         self._dpm = val
 
     @property
-    def log_filepath(self):
-        return self._log_filepath
+    def store(self) -> DetectionStore:
+        return self._store
 
-    @log_filepath.setter
-    def log_filepath(self, val):
-        self._log_filepath = val
+    @property
+    def counts(self) -> CountAggregator:
+        return self._counts
     # END GETTERS AND SETTERS
 
     def start(self):
         self._running = True
+        self._stopped.clear()
         threading.Thread.start(self)
 
-    def log_detections(self, detections: list):
+    def stop(self):
+        """Stop the thread; it logs the current minute and flushes the store as it exits"""
+        self._running = False
+        self._stopped.set()
+
+    def log_detections(self, detections: np.array, frame_time: float = None):
         """
-        Adds a list of detections that will be summarized when an
-        interval period has expired.
-        :return:
+        Adds the detections of a frame to the counts of the minute it
+        was captured in.  Safe to call from any thread.
+        :param frame_time: wall clock time the frame was captured, or None for now
         """
-        if not self._detections:
-            self._detections = []
-        self._detections.append(detections)
+        self._counts.add(detections, frame_time)
+
+    def get_windows(self) -> dict:
+        """Average and new object counts of the sliding windows, e.g. of the last 5 minutes"""
+        return self._counts.windows_summary()
 
     def run(self):
         """
-        go through detections list
-        add detected items to dictionary
+        Wake at each wall clock minute and log the minutes that ended.
         """
-        # clear any existing logging activity
-        self._detections = None
-
-        # start timer
-        self._elapsed_time = ElapsedTime()
-        minute_counter = 0
-
-        self._running = True
-
         logger.info("Started logging loop!")
 
         while self._running:
 
-            # loop till minute has elapsed
-            # while self._elapsed_time.get() - minute_counter < 60 and self._running:
-            time.sleep(60)
-            # minute_counter = self._elapsed_time.get()
+            # wait for the next minute boundary, or until stopped
+            self._stopped.wait(60 - time.time() % 60 + 0.01)
+            if not self._running:
+                break
 
-            if not self._detections:
+            minutes = self._counts.flush()
+            if not minutes:
                 logger.info("No detections")
-                continue
-
-            logger.info("Counting detections")
-            # record time of count
-            count_time = datetime.datetime.now()
-
-            # get all detections from list and clear list
-            det_list = self._detections.copy()
-            self._detections = None
-
-            # auto-throttle detection rate
-            self.dpm = len(det_list)
-
-            # convert detections to avg counts
-            minute_averages = _calc_avg_counts(det_list)
-
-            # Log data to file
-            if len(minute_averages) > 0:
-                _log_counts(count_time, minute_averages, self.log_filepath)
-
-            # log to console
-            logger.info("Detections: {}".format(len(det_list)))
-            output = "--> Avg/Min: "
-            for k, v in minute_averages.items():
-                output += "{}:{}  ".format(k, round(v, 2))
-            logger.info("{}".format(output))
-
-            # emit
-            minute_averages['time_stamp'] = '{:04}-{:02}-{:02} {:02}:{:02}:{:02}'.format(count_time.year,
-                                                                                         count_time.month,
-                                                                                         count_time.day,
-                                                                                         count_time.hour,
-                                                                                         count_time.minute,
-                                                                                         count_time.second)
-
+            for minute in minutes:
+                self._log_minute(minute)
+
+        # log the detections of the minute that was cut short
+        for minute in self._counts.flush(final=True):
+            self._log_minute(minute)
+        self._store.flush()
+
+    def _log_minute(self, minute: MinuteCounts):
+        """Store the counts of a minute and send them to the log listing"""
+        count_time = datetime.datetime.fromtimestamp(minute.time)
+        minute_averages = dict(minute.averages)
+
+        # Log data to history store
+        if len(minute_averages) > 0:
+            self._store.add(count_time, minute_averages, minute.uniques)
+
+        # log to console
+        logger.info("Detections: {}".format(minute.frames))
+        output = "--> Avg/Min: "
+        for k, v in minute_averages.items():
+            output += "{}:{}  ".format(k, round(v, 2))
+        logger.info("{}".format(output))
+
+        # emit
+        minute_averages['time_stamp'] = '{:04}-{:02}-{:02} {:02}:{:02}:{:02}'.format(count_time.year,
+                                                                                     count_time.month,
+                                                                                     count_time.day,
+                                                                                     count_time.hour,
+                                                                                     count_time.minute,
+                                                                                     count_time.second)
+
+        minute_averages['camera'] = self._camera
+        if minute.uniques is not None:
+            minute_averages['unique'] = minute.uniques
+
+        if self._socketio:
             self._socketio.emit("update_log", json.dumps(minute_averages), broadcast=True)
-
-
-def _calc_avg_counts(minute_detections: list) -> dict:
-    """
-    Converts a minute of detections into a dictionary
-    of items and their average counts.
-    """
-    counts = Counter()
-    num_detections = len(minute_detections)
-
-    # first convert each frame detection into counts
-    for frame_detections in minute_detections:
-        counts.update([d.get('name') for d in frame_detections])
-
-    # then calculate the average
-    counts = {k: v / num_detections for k, v in counts.items()}
-
-    return counts
-
-
-def _log_counts(cap_time, counts, filepath):
-    save_time = datetime.datetime(year=cap_time.year,
-                                  month=cap_time.month,
-                                  day=cap_time.day,
-                                  hour=cap_time.hour,
-                                  minute=cap_time.minute)
-
-    # insert header for first record
-    if not os.path.isfile(filepath):
-        with open(filepath, 'w') as fp:
-            fp.write("date_time|day_minute|object|count\n")
-
-    with open(filepath, 'a') as fp:
-        for k, v in counts.items():
-            fp.write(str(save_time))
-            fp.write('|')
-            fp.write("{}".format(cap_time.hour * 60 + cap_time.minute))  # day_minute
-            fp.write('|')
-            fp.write(k)
-            fp.write('|')
-            fp.write("{}".format(round(v, 6)))
-            fp.write('\n')
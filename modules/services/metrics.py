@@ -0,0 +1,209 @@
+"""
+Counters, gauges and histograms of the pipeline stages.
+
+Services register their metrics in the module's METRICS registry,
+labelled with the camera they belong to.  Metrics are cheap to update
+from the frame loops: a counter or gauge update is an addition under a
+lock and a histogram observation also finds a bucket by bisection.
+Values that a service already keeps, e.g. its dropped frames, are
+registered with a callable that is only read when the metrics are.
+
+The registry renders all metrics in the Prometheus text format for the
+/metrics endpoint and as a dictionary for the 'metrics' socket event.
+"""
+import bisect
+import threading
+
+# seconds, for stage times from a fraction of a millisecond to a slow detection
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _format_labels(labels: tuple, extra: str = None) -> str:
+    parts = ['{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Monotonic count, e.g. of frames.  'fn' returns the count instead of inc()."""
+    kind = 'counter'
+
+    def __init__(self, name: str, labels: tuple, fn=None):
+        self.name = name
+        self.labels = labels
+        self._fn = fn
+        self._value = 0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> float:
+        return self._fn() if self._fn else self._value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def render(self) -> list:
+        return ["{}{} {}".format(self.name, _format_labels(self.labels), self.value)]
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. a queue depth.  'fn' returns the value instead of set()."""
+    kind = 'gauge'
+
+    def set(self, value: float):
+        self._value = value
+
+
+class Histogram:
+    """
+    Distribution of observed values, e.g. of stage times, in fixed
+    buckets.  Quantiles are estimated by linear interpolation within
+    the bucket they fall in, limited to the smallest and largest value
+    observed.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, labels: tuple, buckets: tuple = TIME_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self._bounds = tuple(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)  # the last bucket is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._min = float('inf')
+        self._max = float('-inf')
+        self._lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+            if value < self._min:
+                self._min = value
+            if value > self._max:
+                self._max = value
+
+    def quantile(self, q: float) -> float:
+        with self._lock:
+            counts, total, low, high = list(self._counts), self._count, self._min, self._max
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                lower = self._bounds[i - 1] if i > 0 else 0.0
+                upper = self._bounds[i] if i < len(self._bounds) else self._bounds[-1]
+                return min(max(lower + (upper - lower) * (rank - seen) / n, low), high)
+            seen += n
+        return high
+
+    def render(self) -> list:
+        with self._lock:
+            counts, total, total_sum = list(self._counts), self._count, self._sum
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self._bounds + ('+Inf',), counts):
+            cumulative += n
+            lines.append("{}_bucket{} {}".format(self.name, _format_labels(self.labels, 'le="{}"'.format(bound)),
+                                                 cumulative))
+        lines.append("{}_sum{} {}".format(self.name, _format_labels(self.labels), total_sum))
+        lines.append("{}_count{} {}".format(self.name, _format_labels(self.labels), total))
+        return lines
+
+    def snapshot(self) -> dict:
+        return {'count': self._count,
+                'mean': self._sum / self._count if self._count else 0.0,
+                'p50': self.quantile(0.5),
+                'p95': self.quantile(0.95)}
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics of all services.  Asking for a metric with the
+    name and labels of an existing one returns the existing metric, or
+    replaces it if a new 'fn' is given, e.g. by a restarted service.
+    """
+
+    def __init__(self):
+        self._metrics = {}  # (name, labels) -> metric
+        self._help = {}  # name -> (kind, help text)
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, fn=None, **labels) -> Counter:
+        return self._get(Counter, name, help_text, labels, fn=fn)
+
+    def gauge(self, name: str, help_text: str, fn=None, **labels) -> Gauge:
+        return self._get(Gauge, name, help_text, labels, fn=fn)
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = TIME_BUCKETS, **labels) -> Histogram:
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def remove(self, **labels):
+        """Remove all metrics with the given labels, e.g. of a removed camera"""
+        items = set(labels.items())
+        with self._lock:
+            for key in [k for k in self._metrics if items <= set(k[1])]:
+                del self._metrics[key]
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.items(), key=lambda item: item[0])
+        lines = []
+        last_name = None
+        for (name, _), metric in metrics:
+            if name != last_name:
+                kind, help_text = self._help[name]
+                lines.append("# HELP {} {}".format(name, help_text))
+                lines.append("# TYPE {} {}".format(name, kind))
+                last_name = name
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self, **labels) -> dict:
+        """
+        Current values of the metrics with the given labels, or of all
+        metrics.  Histograms give their count, mean, p50 and p95.
+        :return: dictionary of name -> value, or name -> {label value -> value}
+        for metrics that differ in other labels
+        """
+        items = set(labels.items())
+        with self._lock:
+            metrics = [(k, m) for k, m in self._metrics.items() if items <= set(k[1])]
+        snapshot = {}
+        for (name, metric_labels), metric in sorted(metrics, key=lambda item: item[0]):
+            other = [str(v) for k, v in metric_labels if k not in labels]
+            if other:
+                snapshot.setdefault(name, {})[",".join(other)] = metric.snapshot()
+            else:
+                snapshot[name] = metric.snapshot()
+        return snapshot
+
+    def _get(self, cls, name: str, help_text: str, labels: dict, **kwargs):
+        key = (name, tuple(sorted((k, v) for k, v in labels.items() if v is not None)))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None or kwargs.get('fn') is not None:
+                metric = self._metrics[key] = cls(name, key[1], **kwargs)
+                self._help[name] = (cls.kind, help_text)
+            return metric
+
+
+METRICS = MetricsRegistry()
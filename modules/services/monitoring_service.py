@@ -2,9 +2,9 @@ import os
 import numpy as np
 import time
 
-import cv2
-
 from modules.services.service import Service
+from modules.services.snapshot_writer import SnapshotWriter
+from modules.detectors import detections as dets
 
 
 class MonitorService(Service):
@@ -18,12 +18,19 @@ class MonitorService(Service):
     The objects monitored and stored location can be changed using attribute
     setters.
 
+    Images are written by the camera's SnapshotWriter pool so that
+    evaluate() returns without waiting on disk writes.  The pool is
+    created once by the ServiceManager and outlives the service:
+    start() and stop() only switch evaluation on and off.
+
     """
-    def __init__(self, name, detection_rate: float, objects: set, dir_path: str):
+    def __init__(self, name, detection_rate: float, objects: set, dir_path: str, writer: SnapshotWriter):
         Service.__init__(self, name)
         self._dpm = detection_rate
         self._mon_objs = objects
         self._mon_dir = dir_path
+        os.makedirs(dir_path, exist_ok=True)
+        self._writer = writer
 
     # GETTERS AND SETTERS ####################
     @property
@@ -50,25 +57,33 @@ class MonitorService(Service):
     def mon_dir(self, val):
         self._mon_dir = val
 
+    @property
+    def writer(self) -> SnapshotWriter:
+        return self._writer
+
     # END GETTERS AND SETTERS ####################
 
     def start(self):
         self._running = True
 
+    def stop(self):
+        self._running = False
+
     def evaluate(self, image: np.array, detections: list, frame_time: time):
         """
-        Evaluates the list of detected items and saves the image if the
-        image includes detections that should  be monitored.
-        :param image: image that includes the detected items in 'detections' list
-        :param detections: list of detections in corresponding image
+        Evaluates the list of detected items and saves the image, with the
+        detections drawn on the saved copy, if the image includes
+        detections that should  be monitored.
+        :param image: raw image that includes the detected items in 'detections' list
+        :param detections: detections array of the corresponding image
         :param frame_time: time that corresponding image was captured
         :return: None
         """
-        time_stamp = time.strftime("%Y_%m_%d_%H_%M_%S", time.localtime(frame_time))
+        if not self._running:
+            return
 
-        # get unique name values of detected items
-        d_items = {d.get('name') for d in detections}
+        time_stamp = time.strftime("%Y_%m_%d_%H_%M_%S", time.localtime(frame_time))
 
         # if any detected items are in the monitored objects, save image
-        if d_items & self.mon_objs:
-            cv2.imwrite(os.path.join(self.mon_dir, "{}.png".format(time_stamp)), image)
+        if dets.contains(detections, self.mon_objs):
+            self._writer.submit(image, os.path.join(self.mon_dir, "{}.png".format(time_stamp)), detections)
@@ -0,0 +1,62 @@
+import cv2
+import numpy as np
+
+
+class MotionDetector:
+    """
+    Cheap scene change detector used to gate inference.
+
+    Each frame is downscaled to 'width' pixels wide, converted to gray
+    and blurred, then compared with a running average of the earlier
+    frames.  The scene is moving when more than 'min_area' of the pixels
+    differ from the background by more than 'threshold' gray levels.
+    The background follows slow changes, such as light, at
+    'learning_rate'.
+    """
+
+    def __init__(self, width: int = 160, threshold: float = 25, min_area: float = 0.002,
+                 learning_rate: float = 0.05):
+        self._width = width
+        self._threshold = threshold
+        self._min_area = min_area
+        self._learning_rate = learning_rate
+        self._background = None
+        self._motion = 0.0
+        self._moving = False
+
+    @property
+    def motion(self) -> float:
+        """Fraction of the last frame that changed"""
+        return self._motion
+
+    @property
+    def moving(self) -> bool:
+        return self._moving
+
+    def reset(self):
+        self._background = None
+        self._motion = 0.0
+        self._moving = False
+
+    def update(self, frame: np.array) -> bool:
+        """
+        Compare 'frame' with the background and add it to the background.
+        :return: True if the scene is moving
+        """
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self._width, max(1, h * self._width // w)), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(small, (5, 5), 0).astype(np.float32)
+
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray
+            self._moving = False
+            return False
+
+        diff = cv2.absdiff(gray, self._background)
+        self._motion = float(np.count_nonzero(diff > self._threshold)) / diff.size
+        cv2.accumulateWeighted(gray, self._background, self._learning_rate)
+
+        self._moving = bool(self._motion >= self._min_area)
+        return self._moving
@@ -0,0 +1,124 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class DetectionRateController:
+    """
+    Feedback controller for a camera's detection interval.
+
+    Each inference result reports how long detect() took, and the
+    camera reports how many of its frames are waiting for inference.
+    The controller keeps a rolling window of latencies and moves the
+    interval between detections towards a target after each result:
+
+      budget mode    - the target interval is p50 / 'budget', so
+                       detection uses about 'budget' of one inference
+                       worker's time, e.g. 0.5 is half.
+      freshness mode - when 'freshness' seconds is set, the target is
+                       the longest interval for which a detection is
+                       never older than 'freshness' when the next one
+                       arrives (interval + p95 <= freshness), but never
+                       shorter than p95, which the detector can not keep
+                       up with.
+
+    While more than one frame is waiting the interval is backed off
+    multiplicatively, since the detector is falling behind.  The interval
+    is kept between 60 / 'max_dpm' and 60 / 'min_dpm' seconds.
+    """
+
+    def __init__(self,
+                 dpm: float,
+                 min_dpm: float = 1.0,
+                 max_dpm: float = 120.0,
+                 budget: float = 0.5,
+                 freshness: float = 0.0,
+                 window: int = 50,
+                 gain: float = 0.3):
+        self._min_interval = 60 / max_dpm
+        self._max_interval = 60 / min_dpm
+        self._budget = budget
+        self._freshness = freshness
+        self._gain = gain
+        self._interval = self._clamp(60 / dpm)
+        self._latencies = deque(maxlen=window)
+        self._queue_depth = 0
+        self._p50 = 0.0
+        self._p95 = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def interval(self) -> float:
+        """Seconds between detections"""
+        return self._interval
+
+    @property
+    def min_interval(self) -> float:
+        """Shortest time between detections, at the highest rate"""
+        return self._min_interval
+
+    @property
+    def dpm(self) -> float:
+        return 60 / self._interval
+
+    @dpm.setter
+    def dpm(self, val: float):
+        """Restart the controller from 'val' detections per minute"""
+        with self._lock:
+            self._interval = self._clamp(60 / val)
+
+    @property
+    def mode(self) -> str:
+        return 'freshness' if self._freshness else 'budget'
+
+    @property
+    def p50(self) -> float:
+        return self._p50
+
+    @property
+    def p95(self) -> float:
+        return self._p95
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue_depth
+
+    @property
+    def state(self) -> dict:
+        return {'dpm': round(self.dpm, 2),
+                'interval': round(self._interval, 3),
+                'p50': round(self._p50, 3),
+                'p95': round(self._p95, 3),
+                'queue': self._queue_depth,
+                'mode': self.mode,
+                'budget': self._budget,
+                'freshness': self._freshness}
+
+    def update(self, latency: float, queue_depth: int):
+        """
+        Add the latency of a detection and adjust the interval.
+        :param latency: seconds detect() took, or None if the detection failed
+        :param queue_depth: number of the camera's frames waiting for inference
+        """
+        with self._lock:
+            self._queue_depth = queue_depth
+            if latency is not None:
+                self._latencies.append(latency)
+            if not self._latencies:
+                return
+
+            self._p50, self._p95 = (float(p) for p in np.percentile(self._latencies, (50, 95)))
+
+            if self._freshness:
+                target = max(self._freshness - self._p95, self._p95)
+            else:
+                target = self._p50 / self._budget
+
+            if queue_depth > 1:
+                target = max(target, self._interval * (1 + 0.25 * (queue_depth - 1)))
+
+            self._interval = self._clamp(self._interval + self._gain * (target - self._interval))
+
+    def _clamp(self, interval: float) -> float:
+        return min(max(interval, self._min_interval), self._max_interval)
@@ -0,0 +1,136 @@
+"""
+Renditions of the video feed: the sizes and JPEG qualities the display
+frames are encoded at.
+
+A rendition is named and given a width, 0 for the frame's own width,
+and a JPEG quality.  Each one is encoded only while a viewer watches
+it, so a wall of thumbnails costs a few small encodes rather than full
+frames, and the full frame is not encoded when nobody asks for it.
+Frames are only scaled down; a rendition wider than the frame is
+encoded at the frame's size.
+
+The renditions form a ladder from the largest to the smallest.  A
+viewer starts at the rendition it asked for, steps down the ladder
+when it falls behind and back up once it keeps up again.
+"""
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+Rendition = namedtuple("Rendition", ['name', 'width', 'quality'])
+
+DEFAULT_RENDITIONS = [Rendition('full', 0, 90),
+                      Rendition('medium', 640, 75),
+                      Rendition('thumb', 320, 60)]
+
+
+def parse_renditions(renditions) -> list:
+    """
+    Convert a mapping of names to 'width' and 'quality', e.g.
+    {'thumb': {'width': 320, 'quality': 60}}, into the ladder of
+    Renditions, largest first.
+    """
+    if isinstance(renditions, (list, tuple)):
+        ladder = [Rendition(str(r[0]), max(0, int(r[1])), min(max(1, int(r[2])), 100)) for r in renditions]
+    else:
+        ladder = [Rendition(str(name), max(0, int(r.get('width', 0))), min(max(1, int(r.get('quality', 90))), 100))
+                  for name, r in (renditions or {}).items()]
+    if not ladder:
+        return list(DEFAULT_RENDITIONS)
+    return sorted(ladder, key=lambda r: (r.width or float('inf'), r.quality), reverse=True)
+
+
+def encode(frame: np.array, rendition: Rendition, scaled: dict = None) -> bytes:
+    """
+    JPEG of 'frame' at the size and quality of 'rendition'.
+    :param scaled: frames already scaled for this frame, by width; scaled frames are added
+    """
+    width = rendition.width
+    if width and width < frame.shape[1]:
+        image = scaled.get(width) if scaled is not None else None
+        if image is None:
+            height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+            image = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            if scaled is not None:
+                scaled[width] = image
+    else:
+        image = frame
+    return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, rendition.quality])[1].tobytes()
+
+
+class RenditionSelector:
+    """
+    Chooses the rendition of one viewer.  The frames a viewer missed
+    because it was still busy with an earlier frame are counted over
+    windows of 'window' frames.  A window in which it missed more than
+    'max_missed' of the frames steps it down the ladder.  After 'recover'
+    windows without a missed frame it steps back up, at most to the
+    rendition it asked for.  Each time it has to step down again after
+    stepping up, it waits twice as long before the next step up, so a
+    viewer on a link at the edge of a rendition settles below it.
+    """
+
+    def __init__(self,
+                 ladder: list,
+                 requested: str = None,
+                 window: int = 30,
+                 max_missed: float = 0.3,
+                 recover: int = 3,
+                 on_downgrade=None):
+        """
+        :param ladder: Renditions, largest first
+        :param requested: name of the rendition the viewer asked for, or None for the largest
+        :param on_downgrade: callable called without arguments when the viewer steps down
+        """
+        self._names = [r.name for r in ladder]
+        self._requested = self._names.index(requested) if requested in self._names else 0
+        self._level = self._requested
+        self._window = window
+        self._max_missed = max_missed
+        self._recover = recover
+        self._on_downgrade = on_downgrade
+        self._sent = 0
+        self._missed = 0
+        self._good = 0  # windows in a row without a missed frame
+        self._wait = recover  # windows without a missed frame before stepping up
+        self._stepped_up = False
+
+    @property
+    def rendition(self) -> str:
+        """Name of the rendition to send the viewer"""
+        return self._names[self._level]
+
+    @property
+    def requested(self) -> str:
+        return self._names[self._requested]
+
+    def update(self, missed: int) -> str:
+        """
+        Count a frame sent to the viewer after it missed 'missed' frames.
+        :return: name of the rendition to send next
+        """
+        self._sent += 1
+        self._missed += missed
+        if self._sent + self._missed < self._window:
+            return self.rendition
+
+        if self._missed > self._max_missed * (self._sent + self._missed):
+            self._good = 0
+            if self._level < len(self._names) - 1:
+                self._level += 1
+                if self._stepped_up:
+                    self._wait = min(self._wait * 2, 64 * self._recover)
+                    self._stepped_up = False
+                if self._on_downgrade:
+                    self._on_downgrade()
+        elif self._missed == 0 and self._level > self._requested:
+            self._good += 1
+            if self._good >= self._wait:
+                self._good = 0
+                self._level -= 1
+                self._stepped_up = True
+        else:
+            self._good = 0
+        self._sent = self._missed = 0
+        return self.rendition
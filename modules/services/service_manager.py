@@ -1,62 +1,88 @@
+import time
 import logging
 import numpy as np
-import os
-import yaml
-from multiprocessing import Process
 
 from flask_socketio import SocketIO
 
 from modules.services.monitoring_service import MonitorService
+from modules.services.snapshot_writer import SnapshotWriter
 from modules.services.logging_service import LoggingService
 from modules.services.video_service import VideoService
+from modules.services.broadcast_service import BroadcastService
+from modules.services.video_subscribers import VideoSubscribers
+from modules.services.renditions import RenditionSelector
+from modules.services.inference_service import InferenceService
+from modules.services.rate_controller import DetectionRateController
+from modules.services.frame_pacer import FramePacer
+from modules.services.motion_detector import MotionDetector
+from modules.tracking.object_tracker import ObjectTracker
 from modules.services.service import Service
 from modules.services.config_service import ConfigYAML
+from modules.storage.detection_store import DetectionStore
+from modules.services.metrics import METRICS
 
 logger = logging.getLogger('app')
 
 
 class ServiceManager(object):
     """
-    Handles starting and stopping all required services.
+    Handles starting and stopping all required services of one camera.
     Acts as interface to underlying services.
+    Detection is done by an InferenceService shared by all cameras.
     """
-    def __init__(self, socketio: SocketIO, config_file: os.path = None):
-
-        with open(config_file) as fp:
-            yaml_data = yaml.load(fp, Loader=yaml.BaseLoader)
+    def __init__(self, socketio: SocketIO, config: ConfigYAML, inference: InferenceService):
 
         self.all_running = False
         self.socketio = socketio
-        self._config = ConfigYAML(**yaml_data)
+        self._config = config
+        self._inference = inference
+        self._video_subscribers = VideoSubscribers(socketio, config.NAME, config.VIDEO_MAX_IN_FLIGHT)
+        self._store: DetectionStore = self.get_detection_store()
+        self._snapshot_writer: SnapshotWriter = self.get_snapshot_writer()
         self._monitor_service: MonitorService = self.get_monitor_service()
         self._logging_service: LoggingService = self.get_logging_service()
         self._video_service: VideoService = self.get_video_service()
+        self._broadcast_service: BroadcastService = self.get_broadcast_service()
 
     def get_frame(self) -> (bool, np.array):
+        """Next raw display frame, waiting until it is due"""
+        if not self._video_service:
+            time.sleep(.1)
+            return False, None
         success, image, detections, frame_time = self._video_service.get_next_frame()
 
         if not success:
             return False, None
 
-        if detections:
+        return True, image
 
-            if self._logging_service:
-                self._logging_service.log_detections(detections)
+    def render_frame(self) -> np.array:
+        """The last display frame with its annotations drawn in, or None if the video service is off"""
+        if not self._video_service:
+            return None
+        return self._video_service.render_frame()
 
-            if self._monitor_service:
-                # self._monitor_service.evaluate(image, detections, frame_time)
-                p_mon = Process(target=self._monitor_service.evaluate,
-                                kwargs={'image': image,
-                                        'detections': detections,
-                                        'frame_time': frame_time})
-                p_mon.start()
-                p_mon.join()
+    def get_frame_meta(self) -> dict:
+        """Capture time, size, detections and tracks of the last display frame"""
+        if not self._video_service:
+            return {}
+        return self._video_service.get_frame_meta()
 
-        return True, image
+    def process_detections(self, image: np.array, detections: list, frame_time: float):
+        """
+        Log and monitor the detections of a frame.  Called by the video
+        service for every frame with detections, whether or not the
+        frame is displayed.  'image' is the raw frame without annotations.
+        """
+        if self._logging_service:
+            self._logging_service.log_detections(detections, frame_time)
+
+        if self._monitor_service:
+            self._monitor_service.evaluate(image, detections, frame_time)
 
     def get_monitor_service(self, name=None, detection_rate=None, objects=None, dir_path=None):
         if not name:
-            name = "monitor-service"
+            name = "monitor-service-{}".format(self._config.NAME)
         if not detection_rate:
             detection_rate = self._config.DPM
         if not objects:
@@ -67,44 +93,76 @@ class ServiceManager(object):
         return MonitorService(name=name,
                               detection_rate=detection_rate,
                               objects=objects,
-                              dir_path=dir_path)
+                              dir_path=dir_path,
+                              writer=self._snapshot_writer)
+
+    def get_snapshot_writer(self, snapshot_workers=None, snapshot_queue_size=None) -> SnapshotWriter:
+        """
+        The snapshot writer pool of the camera's monitor services.  Its
+        processes are forked here, once, before any pipeline thread runs,
+        and are kept until close(); monitor services that are added and
+        stopped later share it.
+        """
+        if not snapshot_workers:
+            snapshot_workers = self._config.SNAPSHOT_WORKERS
+        if not snapshot_queue_size:
+            snapshot_queue_size = self._config.SNAPSHOT_QUEUE
+        writer = SnapshotWriter(workers=snapshot_workers, queue_size=snapshot_queue_size)
+        writer.start()
+        METRICS.gauge("snapshot_backlog", "Snapshots waiting to be written", fn=lambda: writer.backlog,
+                      camera=self._config.NAME)
+        METRICS.counter("snapshot_dropped_total", "Snapshots dropped because all slots were busy",
+                        fn=lambda: writer.dropped, camera=self._config.NAME)
+        return writer
+
+    def get_detection_store(self, db_path=None, retention_days=None, import_path=None) -> DetectionStore:
+        """
+        Opens the detection history store and imports the text
+        log of earlier versions, if one exists.
+        """
+        if not db_path:
+            db_path = self._config.LOG_DB_PATH
+        if not retention_days:
+            retention_days = self._config.LOG_RETENTION_DAYS
+        if not import_path:
+            import_path = self._config.LOG_FILEPATH
+
+        store = DetectionStore(db_path=db_path, retention_days=retention_days)
+        store.import_text_log(import_path)
+        return store
 
     def get_logging_service(self,
                             name=None,
                             detection_rate=None,
-                            file_path=None,
+                            store=None,
                             socketio=None):
         if not name:
-            name = "logging-service"
+            name = "logging-service-{}".format(self._config.NAME)
         if not detection_rate:
             detection_rate = self._config.DPM
-        if not file_path:
-            file_path = self._config.LOG_FILEPATH
+        if not store:
+            store = self._store
         if not socketio:
             socketio = self.socketio
 
         return LoggingService(name=name,
+                              camera=self._config.NAME,
                               detection_rate=detection_rate,
-                              file_path=file_path,
+                              store=store,
                               socketio=socketio)
 
     def get_video_service(self, name=None,
-                          detector_name=None,
-                          detector_model=None,
-                          base_delay=None,
+                          camera=None,
                           cam_rate=None,
                           stream=None,
                           display_rate=None,
                           detection_rate=None,
-                          detected_objects=None):
+                          detected_objects=None,
+                          realtime=False):
         if not name:
-            name = "video-service"
-        if not detector_name:
-            detector_name = self._config.DETECTOR_NAME,
-        if not detector_model:
-            detector_model = self._config.DETECTOR_MODEL,
-        if not base_delay:
-            base_delay = self._config.BASE_DELAY,
+            name = "video-service-{}".format(self._config.NAME)
+        if not camera:
+            camera = self._config.NAME
         if not cam_rate:
             cam_rate = self._config.CAM_FPS,
         if not stream:
@@ -117,14 +175,68 @@ class ServiceManager(object):
             detected_objects = self.get_detected_objects()
         # print("SERVICE: Adding '{}'".format(name))
         return VideoService(name=name,
-                            detector_name=detector_name,
-                            detector_model=detector_model,
-                            base_delay=base_delay,
+                            camera=camera,
+                            inference=self._inference,
                             cam_rate=cam_rate,
                             stream=stream,
                             display_rate=display_rate,
                             detection_rate=detection_rate,
-                            detected_objects=detected_objects)
+                            detected_objects=detected_objects,
+                            rate_controller=self.get_rate_controller(detection_rate),
+                            pacer=self.get_frame_pacer(),
+                            tracker=self.get_object_tracker(),
+                            motion_detector=self.get_motion_detector(),
+                            motion_max_idle=self._config.MOTION_MAX_IDLE,
+                            regions=self._config.ROI,
+                            tiles=self._config.TILES,
+                            tile_overlap=self._config.TILE_OVERLAP,
+                            on_detections=self.process_detections,
+                            realtime=realtime,
+                            resolver=self._config.STREAM,
+                            stall_timeout=self._config.STALL_TIMEOUT,
+                            reconnect_max_delay=self._config.RECONNECT_MAX_DELAY,
+                            socketio=self.socketio)
+
+    def get_rate_controller(self, detection_rate=None) -> DetectionRateController:
+        if not detection_rate:
+            detection_rate = self._config.DPM
+        return DetectionRateController(dpm=detection_rate,
+                                       min_dpm=self._config.DPM_MIN,
+                                       max_dpm=self._config.DPM_MAX,
+                                       budget=self._config.DET_BUDGET,
+                                       freshness=self._config.DET_FRESHNESS)
+
+    def get_frame_pacer(self, latency=None, max_lag=None) -> FramePacer:
+        if latency is None:
+            latency = self._config.PACE_LATENCY
+        if max_lag is None:
+            max_lag = self._config.PACE_MAX_LAG
+        return FramePacer(latency=latency, max_lag=max_lag)
+
+    def get_motion_detector(self) -> MotionDetector:
+        """Returns a motion detector to gate detection, or None if gating is off"""
+        if not self._config.MOTION_GATE:
+            return None
+        return MotionDetector(threshold=self._config.MOTION_THRESHOLD,
+                              min_area=self._config.MOTION_AREA)
+
+    def get_object_tracker(self) -> ObjectTracker:
+        """Returns a tracker for the video service, or None if tracking is off"""
+        if not self._config.TRACKING:
+            return None
+        return ObjectTracker(iou_threshold=self._config.TRACK_IOU,
+                             max_age=self._config.TRACK_MAX_AGE)
+
+    def get_broadcast_service(self, name=None):
+        if not name:
+            name = "broadcast-service-{}".format(self._config.NAME)
+        return BroadcastService(name=name,
+                                frame_source=self.get_frame,
+                                render=self.render_frame,
+                                meta_source=self.get_frame_meta,
+                                subscribers=self._video_subscribers,
+                                renditions=self._config.RENDITIONS,
+                                camera=self._config.NAME)
 
     def add_service(self, s: str) -> Service:
 
@@ -137,6 +249,8 @@ class ServiceManager(object):
         elif s == "video":
             added_service = self._video_service = self.get_video_service()
             # return self._video_service
+        elif s == "broadcast":
+            added_service = self._broadcast_service = self.get_broadcast_service()
         else:
             raise Exception("service_manager:add_service(): '{}' service does not exist!".format(s))
 
@@ -144,7 +258,7 @@ class ServiceManager(object):
         return added_service
 
     def add_all_services(self):
-        for s in ("log", "monitor", "video"):
+        for s in ("log", "monitor", "video", "broadcast"):
             self.add_service(s)
 
     def start_service(self, s):
@@ -159,6 +273,8 @@ class ServiceManager(object):
                 self._logging_service.start()
             elif s == "video":
                 self._video_service.start()
+            elif s == "broadcast":
+                self._broadcast_service.start()
 
         elif type(s) == MonitorService:
             self._monitor_service.start()
@@ -166,6 +282,8 @@ class ServiceManager(object):
             self._logging_service.start()
         elif type(s) == VideoService:
             self._video_service.start()
+        elif type(s) == BroadcastService:
+            self._broadcast_service.start()
         else:
             raise Exception("SERVICE: {} > Not Recognized - Nothing started!!".format(s.getName()))
 
@@ -178,7 +296,8 @@ class ServiceManager(object):
         """
         for s in (self._monitor_service,
                   self._logging_service,
-                  self._video_service):
+                  self._video_service,
+                  self._broadcast_service):
             self.start_service(s)
         self.all_running = True
 
@@ -204,6 +323,9 @@ class ServiceManager(object):
             elif s == "video":
                 kill(self._video_service)
                 self._video_service = None
+            elif s == "broadcast":
+                kill(self._broadcast_service)
+                self._broadcast_service = None
         elif type(s) == MonitorService:
             kill(self._monitor_service)
             self._monitor_service = None
@@ -213,6 +335,9 @@ class ServiceManager(object):
         elif type(s) == VideoService:
             kill(self._video_service)
             self._video_service = None
+        elif type(s) == BroadcastService:
+            kill(self._broadcast_service)
+            self._broadcast_service = None
 
         else:
             raise Exception("service_manager:stop_service(): '{}' service does not exist!".format(s))
@@ -228,10 +353,17 @@ class ServiceManager(object):
             self.stop_service(self._logging_service)
         if self._video_service:
             self.stop_service(self._video_service)
+        if self._broadcast_service:
+            self.stop_service(self._broadcast_service)
 
         self.all_running = False
         logger.info("All threads stopped!")
 
+    def close(self):
+        """Stop all services and shut down the snapshot writer, e.g. when the application exits."""
+        self.stop_all_services()
+        self._snapshot_writer.close()
+
     def toggle(self, s: str):
         if s == "monitor" and self._monitor_service:
             self.stop_service(self._monitor_service)
@@ -242,6 +374,9 @@ class ServiceManager(object):
         elif s == "video" and self._video_service:
             self.stop_service(self._video_service)
             return
+        elif s == "broadcast" and self._broadcast_service:
+            self.stop_service(self._broadcast_service)
+            return
 
         self.add_service(s).start()
 
@@ -259,11 +394,78 @@ class ServiceManager(object):
         self.add_all_services()
         self.start_all_services()
 
+    def get_encoded_frame(self, last_seq: int, timeout: float = 1.0, rendition: str = None) -> (int, bytes):
+        """
+        Returns the JPEG encoded display frame of 'rendition' following
+        'last_seq' from the broadcast service.  The frame is not consumed
+        and can be read by any number of viewers.  Waits up to 'timeout'
+        seconds, also while the display is switched off.
+        """
+        if not self._broadcast_service:
+            time.sleep(timeout)
+            return last_seq, None
+        return self._broadcast_service.get_frame(last_seq, timeout, rendition)
+
+    def has_rendition(self, rendition: str) -> bool:
+        return any(r.name == rendition for r in self._config.RENDITIONS)
+
+    def get_rendition_selector(self, rendition: str = None) -> RenditionSelector:
+        """Chooses the rendition of a viewer that asked for 'rendition', stepping down when it falls behind"""
+        if self._broadcast_service:
+            return self._broadcast_service.selector(rendition)
+        return RenditionSelector(self._config.RENDITIONS, rendition)
+
+    def subscribe_video(self, sid: str):
+        """Push the raw display frames and their detections to socket client 'sid'"""
+        self._video_subscribers.subscribe(sid)
+        if self._broadcast_service:
+            self._broadcast_service.wake()
+
+    def unsubscribe_video(self, sid: str):
+        self._video_subscribers.unsubscribe(sid)
+
+    def get_counts(self, start, end, objects: set = None) -> list:
+        """Minute counts from the detection history in the range [start, end)"""
+        return self._store.query(start, end, objects)
+
+    def get_count_series(self, resolution: int, start, end, objects: set = None) -> list:
+        """Counts per object in buckets of 'resolution' minutes in the range [start, end)"""
+        return self._store.series(resolution, start, end, objects)
+
+    def get_count_totals(self, start, end, objects: set = None) -> dict:
+        """Total count of each object from the detection history in the range [start, end)"""
+        return self._store.totals(start, end, objects)
+
+    def get_count_windows(self) -> dict:
+        """Counts of the last minutes by sliding window, e.g. '5m', or empty if logging is off"""
+        if not self._logging_service:
+            return {}
+        return self._logging_service.get_windows()
+
+    @property
+    def camera(self) -> str:
+        return self._config.NAME
+
+    @property
+    def status(self) -> dict:
+        """Readiness of the camera's stream, with the state of its capture; 'stopped' if the video service is off"""
+        if not self._video_service:
+            return {'stream': {'source': str(self._config.CAM_STREAM),
+                               'state': 'stopped',
+                               'fps': None,
+                               'error': None,
+                               'capture': {'state': 'stopped'}}}
+        return {'stream': self._video_service.stream_status}
+
     def get_queue_size(self):
+        if not self._video_service:
+            return 0
         return self._video_service.get_queue_size()
 
     def get_trained_objects(self) -> set:
-        return self._video_service.get_trained_objects()
+        """Objects the detector can detect, or the configured objects while it is loading"""
+        trained = self._video_service.get_trained_objects() if self._video_service else None
+        return trained or self._config.DET_OBJS | self._config.MON_OBJS
 
     def add_mon_obj(self, obj: str):
         self._config.add_mon_obj(obj)
@@ -279,11 +481,13 @@ class ServiceManager(object):
 
     def add_det_obj(self, obj: str):
         self._config.add_det_obj(obj)
-        self._video_service.det_objs = self._config.DET_OBJS
+        if self._video_service:
+            self._video_service.det_objs = self._config.DET_OBJS
 
     def del_det_obj(self, obj: str):
         self._config.del_det_obj(obj)
-        self._video_service.det_objs = self._config.DET_OBJS
+        if self._video_service:
+            self._video_service.det_objs = self._config.DET_OBJS
 
     def is_detected(self, obj: str) -> bool:
         return self._config.is_detected(obj)
@@ -291,11 +495,4 @@ class ServiceManager(object):
     def get_detected_objects(self) -> set:
         return self._config.DET_OBJS
 
-    @property
-    def base_delay(self) -> float:
-        return self._config.BASE_DELAY
-
-    @base_delay.setter
-    def base_delay(self, val: float):
-        self._config.BASE_DELAY = val
 
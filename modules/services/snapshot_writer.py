@@ -0,0 +1,164 @@
+import queue
+import logging
+import multiprocessing as mp
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+import cv2
+
+from modules.services.frame_renderer import draw_annotations
+
+logger = logging.getLogger('app')
+
+
+def _slot_view(buffer, shape: tuple) -> np.array:
+    """View of the start of a slot buffer as a frame of 'shape'"""
+    return np.frombuffer(buffer, dtype=np.uint8, count=int(np.prod(shape))).reshape(shape)
+
+
+def _snapshot_worker(buffers: list, jobs: mp.Queue, free_slots: mp.Queue, pending: mp.Value):
+    """
+    Entry point of a snapshot writer process.  Writes the frame held in
+    a shared memory slot to disk and hands the slot back for reuse.
+    Runs until it receives None.
+    """
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        slot, shape, file_path = job
+        try:
+            cv2.imwrite(file_path, _slot_view(buffers[slot], shape))
+        except Exception as e:
+            logger.error("snapshot writer // {}: {}".format(file_path, e))
+        finally:
+            with pending.get_lock():
+                pending.value -= 1
+            free_slots.put(slot)
+
+
+class SnapshotWriter:
+    """
+    Long-lived pool of processes that write snapshot images to disk.
+
+    Frames are copied into a fixed number of preallocated shared memory
+    slots, so only the slot number, frame shape and file path are sent
+    to the worker processes.  Detections are drawn onto the copy in the
+    slot, so the caller's raw frame is left untouched.  submit() never
+    waits: if all slots are busy the snapshot is dropped and counted.
+
+    Each slot holds a colour frame of up to 'max_pixels' pixels; larger
+    frames are scaled down to fit.  The slots do not depend on the frame shape,
+    so the pool is started once by start(), before the capture threads
+    run, and is never forked again from a pipeline thread.  It is shut
+    down by close() when the application exits.
+    """
+
+    def __init__(self, workers: int = 1, queue_size: int = 8, max_pixels: int = 1920 * 1080):
+        self._num_workers = max(1, int(workers))
+        self._num_slots = max(1, int(queue_size))
+        self._max_pixels = max(1, int(max_pixels))
+        self._buffers = []
+        self._processes = []
+        self._jobs = None
+        self._free_slots = None
+        self._pending = mp.Value('i', 0)
+        self._dropped = 0
+
+    @property
+    def backlog(self) -> int:
+        """Number of snapshots waiting to be written"""
+        return self._pending.value
+
+    @property
+    def dropped(self) -> int:
+        """Number of snapshots dropped because all slots were busy"""
+        return self._dropped
+
+    @property
+    def running(self) -> bool:
+        return bool(self._processes)
+
+    def submit(self, image: np.array, file_path: str, detections: np.array = None) -> bool:
+        """
+        Queue 'image' to be written to 'file_path'.
+        :param detections: detections array drawn on the written image, or None
+        :return: True if queued, False if the snapshot was dropped
+        """
+        jobs, free_slots = self._jobs, self._free_slots
+        if jobs is None:
+            # not started or closed
+            self._dropped += 1
+            return False
+
+        try:
+            slot = free_slots.get_nowait()
+        except queue.Empty:
+            self._dropped += 1
+            return False
+
+        h, w = image.shape[:2]
+        if image.nbytes > len(self._buffers[slot]):
+            scale = (len(self._buffers[slot]) / image.nbytes) ** 0.5
+            size = (max(1, int(w * scale)), max(1, int(h * scale)))
+            frame = _slot_view(self._buffers[slot], (size[1], size[0]) + image.shape[2:])
+            cv2.resize(image, size, dst=frame, interpolation=cv2.INTER_AREA)
+            if detections is not None:
+                detections = detections.copy()
+                detections['box'] = (detections['box'] * (size[0] / w, size[1] / h,
+                                                          size[0] / w, size[1] / h)).round()
+        else:
+            frame = _slot_view(self._buffers[slot], image.shape)
+            np.copyto(frame, image)
+        if detections is not None:
+            draw_annotations(frame, detections)
+        with self._pending.get_lock():
+            self._pending.value += 1
+        jobs.put((slot, frame.shape, file_path))
+        return True
+
+    def start(self):
+        """Start the worker processes, unless they run"""
+        if self._processes:
+            return
+
+        # colour frames of up to max_pixels
+        self._buffers = [RawArray('B', self._max_pixels * 3) for _ in range(self._num_slots)]
+        self._jobs = mp.Queue()
+        self._free_slots = mp.Queue()
+        for slot in range(self._num_slots):
+            self._free_slots.put(slot)
+
+        for _ in range(self._num_workers):
+            p = mp.Process(target=_snapshot_worker,
+                           args=(self._buffers, self._jobs, self._free_slots, self._pending),
+                           daemon=True)
+            p.start()
+            self._processes.append(p)
+
+        logger.info("Snapshot writer: {} process(es), {} slots of {} pixels".format(self._num_workers,
+                                                                                     self._num_slots,
+                                                                                     self._max_pixels))
+
+    def close(self, timeout: float = 5.0):
+        """
+        Let the workers finish queued snapshots and exit.  Workers that
+        have not exited after 'timeout' seconds are terminated.
+        """
+        if not self._processes:
+            return
+        for _ in self._processes:
+            self._jobs.put(None)
+        for p in self._processes:
+            p.join(timeout)
+            if p.is_alive():
+                logger.warning("Snapshot writer: terminating process {}".format(p.pid))
+                p.terminate()
+                p.join(1)
+        self._processes = []
+        for q in (self._jobs, self._free_slots):
+            q.close()
+            q.join_thread()
+        self._jobs = self._free_slots = None
+        with self._pending.get_lock():
+            self._pending.value = 0
@@ -0,0 +1,346 @@
+"""
+Reads a camera stream on its own thread and keeps it connected.
+
+Grabbing a frame only demuxes it; decoding it is most of the cost of
+reading.  The reader grabs every frame of the stream but retrieves
+(decodes) only the frames that are due for display, one in every
+'cam_fps / display_fps', and only while someone waits for a frame.  Live
+streams are grabbed as they arrive, so a slow reader gets the newest
+frame rather than a backlog.  Files and recorded streams are grabbed on
+demand, so no frame is lost to a slow reader.
+
+A grab that does not return within the stall timeout, a failed grab or
+a stream that can not be opened makes the reader reconnect, after a
+delay that doubles with each failed attempt.  Streams are reconnected
+through their StreamResolver, which looks up YouTube stream URLs again
+since expired URLs are a common cause of lost streams.  Local files
+end instead.
+"""
+import os
+import time
+import logging
+import threading
+
+import cv2
+import numpy as np
+
+from modules.services.stream_resolver import StreamResolver
+
+logger = logging.getLogger('app')
+
+
+class StreamReader:
+    """
+    Reader of one camera stream.  The state is 'connecting' until the
+    stream is open, then 'streaming', 'reconnecting' after the stream
+    was lost, 'ended' at the end of a local file, 'failed' if a local
+    file can not be opened, or 'stopped'.
+
+    read() returns the next due frame with its stream timestamp in
+    seconds.  Timestamps are the stream's own where it has them, else
+    the capture clock, and keep increasing across reconnects.
+    """
+
+    def __init__(self,
+                 name: str,
+                 stream=None,
+                 resolver: StreamResolver = None,
+                 frame_step=None,
+                 realtime: bool = False,
+                 stall_timeout: float = 10.0,
+                 min_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 on_state=None):
+        """
+        :param stream: source opened as it is, without a resolver
+        :param resolver: resolves the source; reconnects resolve it again
+        :param frame_step: callable returning the number of stream frames per decoded frame, or None for 1
+        :param realtime: return frames of files no faster than their frame rate
+        :param stall_timeout: seconds a grab may take before the stream is considered lost
+        :param min_delay: seconds before the first reconnect attempt
+        :param max_delay: longest delay between reconnect attempts
+        :param on_state: callable taking the status dictionary, called when the state changes
+        """
+        self._name = name
+        self._stream = stream
+        self._resolver = resolver
+        self._frame_step = frame_step or (lambda: 1.0)
+        self._realtime = realtime
+        self._stall_timeout = stall_timeout
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._on_state = on_state
+
+        self._state = 'stopped'
+        self._error = None
+        self._running = False
+        self._fps = None
+        self._live = False
+        self._connection = 0  # number of the current connection; older readers stop
+        self._grab_start = None  # time the current grab started, or None
+        self._lost = threading.Event()
+        self._lost_reason = None
+        self._thread = None
+
+        # frame hand-off between read() and the grab thread
+        self._cond = threading.Condition()
+        self._request = None  # [buffer] while a reader waits for a frame
+        self._result = None  # (image, pts, stream timestamps used) of the decoded frame
+        self._next_due = 0.0
+        self._last_pts = None
+        self._play_start = None
+
+        # counters
+        self._grabbed = 0
+        self._decoded = 0
+        self._reconnects = 0
+        self._stalls = 0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @property
+    def alive(self) -> bool:
+        """Whether frames may still come"""
+        return self._state not in ('ended', 'failed', 'stopped')
+
+    @property
+    def fps(self) -> float:
+        """Frame rate reported by the open stream, or None"""
+        return self._fps
+
+    @property
+    def grabbed(self) -> int:
+        return self._grabbed
+
+    @property
+    def decoded(self) -> int:
+        return self._decoded
+
+    @property
+    def skipped(self) -> int:
+        """Frames grabbed but never decoded"""
+        return self._grabbed - self._decoded
+
+    @property
+    def reconnects(self) -> int:
+        return self._reconnects
+
+    @property
+    def stalls(self) -> int:
+        """Number of grabs that exceeded the stall timeout"""
+        return self._stalls
+
+    @property
+    def status(self) -> dict:
+        return {'state': self._state,
+                'live': self._live,
+                'reconnects': self._reconnects,
+                'stalls': self._stalls,
+                'grabbed': self._grabbed,
+                'decoded': self._decoded,
+                'error': self._error}
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._set_state('connecting')
+        self._thread = threading.Thread(target=self._run, daemon=True, name="{}-reader".format(self._name))
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._lost.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def read(self, out: np.array = None, timeout: float = 1.0) -> (bool, np.array, float):
+        """
+        Wait for the next due frame and decode it into 'out' if its size
+        matches.  Files read in real time are returned at their own pace.
+        :return: success, image and stream timestamp in seconds
+        """
+        with self._cond:
+            self._request = [out]
+            self._result = None
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._result is not None or not self._running or not self.alive,
+                                timeout=timeout)
+            result, self._result, self._request = self._result, None, None
+        if result is None:
+            return False, None, None
+
+        image, pts, use_pos = result
+        if self._realtime and use_pos:
+            if self._play_start is None:
+                self._play_start = time.monotonic() - pts
+            delay = self._play_start + pts - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return True, image, pts
+
+    def _set_state(self, state: str, error: str = None):
+        self._state = state
+        self._error = error
+        if self._on_state:
+            try:
+                self._on_state(self.status)
+            except Exception as e:
+                logger.error("{} // on_state: {}".format(self._name, e))
+
+    @property
+    def _source(self):
+        return self._resolver.source if self._resolver else self._stream
+
+    def _is_file(self) -> bool:
+        return isinstance(self._source, str) and os.path.isfile(self._source)
+
+    def _open(self, reconnect: bool) -> cv2.VideoCapture:
+        """
+        Open the stream, resolving it again on reconnects.
+        :return: open capture, or None
+        """
+        if not self._resolver:
+            cap = cv2.VideoCapture(self._stream)
+            return cap if cap.isOpened() else None
+
+        if reconnect:
+            self._resolver.start(refresh=True)
+        while self._running and not self._resolver.wait(timeout=1):
+            continue
+        if not self._running or self._resolver.state != 'ready':
+            self._error = self._resolver.error
+            return None
+        cap = self._resolver.take_capture()
+        return cap if cap.isOpened() else None
+
+    def _run(self):
+        """Connect, watch the grab thread for stalls and reconnect when the stream is lost"""
+        delay = self._min_delay
+        reconnect = False
+        while self._running:
+            cap = self._open(reconnect)
+            if not self._running:
+                if cap is not None:
+                    cap.release()
+                break
+            if cap is None:
+                if self._is_file():
+                    self._set_state('failed', self._error or "can't open file")
+                    break
+                self._lost_reason = self._error or "can't open stream"
+            else:
+                connected = time.monotonic()
+                self._connect(cap)
+                while self._running and not self._lost.wait(timeout=1):
+                    grab_start = self._grab_start
+                    if grab_start is not None and time.monotonic() - grab_start > self._stall_timeout:
+                        self._stalls += 1
+                        self._lost_reason = "no frame for {:.0f}s".format(time.monotonic() - grab_start)
+                        break
+                # a stalled grab thread releases its capture when the grab returns
+                self._connection += 1
+                with self._cond:
+                    self._cond.notify_all()
+                if not self._running:
+                    break
+                if self._lost_reason is None and self._is_file():
+                    logger.info("{}: end of stream".format(self._name))
+                    self._set_state('ended')
+                    break
+                # a connection that streamed for a while starts the delays over
+                if time.monotonic() - connected > self._max_delay:
+                    delay = self._min_delay
+
+            self._reconnects += 1
+            logger.warning("{}: stream lost ({}) - reconnecting in {:.0f}s".format(
+                self._name, self._lost_reason or "read failed", delay))
+            self._set_state('reconnecting', self._lost_reason or "read failed")
+            reconnect = True
+            end = time.monotonic() + delay
+            while self._running and time.monotonic() < end:
+                time.sleep(min(0.5, end - time.monotonic()))
+            delay = min(delay * 2, self._max_delay)
+
+        if self._state not in ('ended', 'failed'):
+            self._set_state('stopped')
+        with self._cond:
+            self._cond.notify_all()
+
+    def _connect(self, cap: cv2.VideoCapture):
+        """Start a grab thread for the newly opened 'cap'"""
+        self._fps = cap.get(cv2.CAP_PROP_FPS) or self._fps
+        # files and recorded streams know their length; live streams do not
+        self._live = cap.get(cv2.CAP_PROP_FRAME_COUNT) <= 0
+        self._lost.clear()
+        self._lost_reason = None
+        self._play_start = None
+        self._connection += 1
+        threading.Thread(target=self._grab_frames, args=(cap, self._connection), daemon=True,
+                         name="{}-grab-{}".format(self._name, self._connection)).start()
+        logger.info("{}: streaming ({})".format(self._name, "live" if self._live else "on demand"))
+        self._set_state('streaming')
+
+    def _grab_frames(self, cap: cv2.VideoCapture, connection: int):
+        """
+        Grab thread of one connection.  Grabs frames, live or on demand,
+        and decodes the due frames into the buffer of a waiting reader.
+        """
+        use_pos = not isinstance(self._source, int) and cap.get(cv2.CAP_PROP_POS_MSEC) >= 0
+        pts_offset = None  # keeps timestamps increasing across reconnects
+        grabbed = 0  # frames grabbed on this connection
+        self._next_due = 0.0
+
+        try:
+            while self._running and connection == self._connection:
+                if not self._live:
+                    with self._cond:
+                        self._cond.wait_for(lambda: self._request is not None or not self._running
+                                            or connection != self._connection, timeout=1)
+                        if self._request is None:
+                            continue
+
+                self._grab_start = time.monotonic()
+                success = cap.grab()
+                if connection != self._connection:
+                    break
+                self._grab_start = None
+                if not success:
+                    self._lost.set()
+                    break
+                grabbed += 1
+                self._grabbed += 1
+
+                # only frames that are due and wanted are decoded
+                if grabbed < self._next_due:
+                    continue
+                with self._cond:
+                    if self._request is None:
+                        continue
+                    out = self._request[0]
+                    success, image = cap.retrieve(out) if out is not None else cap.retrieve()
+                    if not success:
+                        continue
+                    self._decoded += 1
+                    self._next_due = max(self._next_due + self._frame_step(), grabbed + 1)
+
+                    if use_pos:
+                        pts = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                        if pts_offset is None:
+                            pts_offset = self._last_pts - pts + 1 / (self._fps or 30) \
+                                if self._last_pts is not None else 0.0
+                        pts += pts_offset
+                        if self._last_pts is not None and pts <= self._last_pts:
+                            # the stream has no usable timestamps
+                            use_pos = False
+                    if not use_pos:
+                        pts = time.monotonic()
+                    self._last_pts = pts
+
+                    self._result = (image, pts, use_pos)
+                    self._request = None
+                    self._cond.notify_all()
+        finally:
+            cap.release()
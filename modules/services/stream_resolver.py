@@ -0,0 +1,252 @@
+"""
+Resolves a configured camera source into a stream that OpenCV can open.
+
+A source is a webcam number, a file or stream URL, or a YouTube video
+id or URL.  YouTube sources are looked up with pafy, which takes several
+seconds, so their stream URL and frame rate are kept in a StreamCache
+file until they expire.  Probing opens the source once and hands the
+open capture to the video service, so a camera is not opened again
+after it was tested.
+"""
+import os
+import json
+import time
+import logging
+import threading
+
+import cv2
+import numpy as np
+import pafy
+
+logger = logging.getLogger('app')
+
+# largest width x height of the YouTube stream chosen
+RES_LIMIT = 350000
+
+
+def is_youtube(cam) -> bool:
+    """Whether 'cam' names a YouTube video rather than a webcam, file or stream URL"""
+    if isinstance(cam, int):
+        return False
+    if 'youtube' in cam or 'youtu.be' in cam:
+        return True
+    return '://' not in cam and not os.path.exists(cam)
+
+
+def youtube_stream(cam: str) -> (str, str):
+    """
+    Look up the URL of the largest stream of a YouTube video below RES_LIMIT pixels.
+    :return: stream URL and resolution
+    """
+    if '/' in cam:  # a full video path was given
+        cam = cam.split('/')[-1].split('=')[-1]
+    try:
+        video_pafy = pafy.new(cam)
+    except Exception:
+        raise Exception("No video stream found: {}".format(cam))
+
+    # use pafy to get the url of the stream
+    # find stream with resolution within RES_LIMIT
+    stream_num = 0
+    for i, stream in enumerate(video_pafy.streams):
+        x, y = np.array(stream.resolution.split('x'), dtype=int)
+        if x * y < RES_LIMIT:
+            stream_num = i
+        else:
+            break
+    stream = video_pafy.streams[stream_num]
+    return stream.url, stream.resolution
+
+
+class StreamCache:
+    """
+    Resolved YouTube streams kept in a JSON file, so that a restart does
+    not look them up again.  Entries expire after 'ttl' seconds, before
+    the signed stream URLs stop working.
+    """
+
+    def __init__(self, path: str, ttl: float = 10800):
+        self._path = path
+        self._ttl = ttl
+        self._lock = threading.Lock()
+
+    def get(self, source: str) -> dict:
+        """:return: dictionary with 'url' and 'fps', or None if the source is not cached or expired"""
+        with self._lock:
+            entry = self._load().get(str(source))
+        if entry is None or entry.get('expires', 0) < time.time():
+            return None
+        return entry
+
+    def put(self, source: str, url: str, fps: float):
+        with self._lock:
+            entries = self._load()
+            now = time.time()
+            entries = {k: v for k, v in entries.items() if v.get('expires', 0) >= now}
+            entries[str(source)] = {'url': url, 'fps': fps, 'expires': now + self._ttl}
+            self._save(entries)
+
+    def remove(self, source: str):
+        with self._lock:
+            entries = self._load()
+            if entries.pop(str(source), None) is not None:
+                self._save(entries)
+
+    def _load(self) -> dict:
+        try:
+            with open(self._path) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries: dict):
+        try:
+            os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+            tmp_path = self._path + '.tmp'
+            with open(tmp_path, 'w') as fp:
+                json.dump(entries, fp, indent=1)
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            logger.warning("stream cache // {}: {}".format(self._path, e))
+
+
+class StreamResolver:
+    """
+    Resolves one camera source in a background thread.
+
+    The state is 'pending' until the source is resolved, then 'ready'
+    with the stream URL and frame rate, or 'failed' with the error.  A
+    cached YouTube stream is ready at once.  Otherwise the source is
+    opened and tested once; the open capture is kept for the first
+    caller of take_capture().
+    """
+
+    def __init__(self, source, cache: StreamCache = None):
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        self._source = source
+        self._cache = cache
+        self._state = 'pending'
+        self._url = None
+        self._fps = None
+        self._error = None
+        self._capture = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @property
+    def url(self):
+        """Stream OpenCV opens, or None until resolved"""
+        return self._url
+
+    @property
+    def fps(self) -> float:
+        """Published frame rate of the stream, or None until resolved"""
+        return self._fps
+
+    @property
+    def error(self) -> str:
+        return self._error
+
+    @property
+    def status(self) -> dict:
+        return {'source': str(self._source),
+                'state': self._state,
+                'fps': self._fps,
+                'error': self._error}
+
+    def start(self, refresh: bool = False):
+        """
+        Resolve the source in the background, unless it is being resolved.
+        :param refresh: ignore the cache, e.g. because the cached stream URL stopped working
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if refresh:
+                if self._cache is not None:
+                    self._cache.remove(self._source)
+                self._release_capture()
+            self._state = 'pending'
+            self._ready.clear()
+
+            entry = None if refresh or self._cache is None else self._cache.get(self._source)
+            if entry is not None:
+                self._set_ready(entry['url'], entry['fps'])
+                logger.info("Video Stream     : {} (cached)".format(self._source))
+                return
+
+            self._thread = threading.Thread(target=self._resolve, daemon=True,
+                                            name="stream-resolver-{}".format(self._source))
+            self._thread.start()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait until the source is resolved or failed.
+        :return: True if the source is ready
+        """
+        self._ready.wait(timeout)
+        return self._state == 'ready'
+
+    def take_capture(self) -> cv2.VideoCapture:
+        """
+        The capture opened while probing, which the caller now owns,
+        or a new capture of the resolved stream.
+        """
+        with self._lock:
+            cap, self._capture = self._capture, None
+        if cap is None or not cap.isOpened():
+            cap = cv2.VideoCapture(self._url)
+        return cap
+
+    def _resolve(self):
+        cam = self._source
+        try:
+            if is_youtube(cam):
+                url, resolution = youtube_stream(cam)
+                logger.info("YouTube Video Stream Detected!")
+                logger.info("Video Resolution : {}".format(resolution))
+            else:
+                url = cam
+
+            cap = cv2.VideoCapture(url)
+            read_pass = cap.grab()
+            logger.info("Video Test       : {}".format("OK" if read_pass else "FAIL - check that streamer is publishing"))
+            if not read_pass:
+                cap.release()
+                raise Exception("Can't acquire video source: {}".format(cam))
+            fps = cap.get(cv2.CAP_PROP_FPS)
+
+            with self._lock:
+                self._release_capture()
+                self._capture = cap
+                if self._cache is not None and is_youtube(cam):
+                    self._cache.put(cam, url, fps)
+                self._set_ready(url, fps)
+
+        except Exception as e:
+            logger.error("Video Stream     : {}".format(e))
+            self._error = str(e)
+            self._state = 'failed'
+            self._ready.set()
+
+    def _set_ready(self, url, fps: float):
+        self._url = url
+        self._fps = fps
+        self._error = None
+        self._state = 'ready'
+        self._ready.set()
+
+    def _release_capture(self):
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
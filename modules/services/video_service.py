@@ -3,109 +3,220 @@ import numpy as np
 import threading
 import queue
 import time
+import json
 import logging
-from collections import namedtuple
 
-from modules.detectors.detector_factory import DetectorFactory
-from modules.detectors.detector import Detector
+from flask_socketio import SocketIO
+
 from modules.timers.elapsed_time import ElapsedTime
 from modules.services.service import Service
+from modules.services.inference_service import InferenceService
+from modules.services.frame_ring import FrameRing
+from modules.services.rate_controller import DetectionRateController
+from modules.services.frame_pacer import FramePacer
+from modules.services.motion_detector import MotionDetector
+from modules.services.metrics import METRICS
+from modules.services.stream_resolver import StreamResolver
+from modules.services.stream_reader import StreamReader
+from modules.services.frame_renderer import FrameRenderer
+from modules.detectors.regions import get_crops
+from modules.detectors.detections import to_dicts
+from modules.tracking.object_tracker import ObjectTracker
 
 logger = logging.getLogger('app')
 
-Frame = namedtuple("Frame", ['num', 'time', 'image', 'queue', 'detections'])
-
-
-def _get_detector(name, model) -> Detector:
-    d = DetectorFactory.get(name, model)
-    logger.info("RETURNING MODEL: {}".format(d))
-    return d
-
-
-def add_overlay(frame: np.array, stats: dict) -> np.array:
-    """
-    Adds overly to current 'frame'.  Uses local variables
-    stats and frame.  'stats' is a dictionary
-    where keys are displayed statistics and values are the
-    respective values.
-    """
-    # HELP MENU
-    cv2.putText(frame, "{}".format("'q' - quit"),
-                (10, frame.shape[0] - 10),
-                fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-                fontScale=0.4,
-                color=(200, 0, 0),
-                thickness=1)
-
-    # STATISTICS
-    # cv2.putText(frame, "{}".format("dpm: {}".format(round(capture_thread.get_dpm(), 1))),
-    for i, (k, v) in enumerate(stats.items()):
-        cv2.putText(frame, "{:14} : {}".format(k, round(v, 3)),
-                    (frame.shape[1] - 180, frame.shape[0] - 10 - (i * 15)),
-                    fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-                    fontScale=0.4,
-                    color=(200, 0, 0),
-                    thickness=1)
-
-    return frame
+# seconds between statistics updates sent over the socket
+STATS_EMIT_INTERVAL = 1.0
 
 
 class VideoService(Service, threading.Thread):
     """
     Thread that will read images from video stream.
-    Places frames in queues depending on whether or not
-    object detection was performed on the frame or not.
-    Arguments are references to the queues where frames
-    are put into.
+    Frames are decoded into the slots of a shared memory FrameRing
+    and handed between the stages by slot number.  The ring is sized
+    with 'buffer_size' slots on the first frame.
+
+    The service is a three stage pipeline:
+      capture   - this thread; takes the frames due for display from a
+                  StreamReader, which grabs the stream on its own thread,
+                  decodes only those frames and reconnects lost streams,
+                  and submits frames that are due for detection to the
+                  inference service without waiting on it.  With a
+                  motion detector, detections are skipped while the
+                  scene is still and run at once when motion starts.
+      inference - the InferenceService shared by all cameras; results
+                  are returned by frame number.  The time between
+                  detections is set by a DetectionRateController from
+                  the measured inference latency.
+      overlay   - a second thread; attaches detections to the frame
+                  with the same number, tracks the detected objects
+                  and attaches their predicted boxes to the frames
+                  between detections, hands frames with detections
+                  to 'on_detections' for logging and monitoring, and
+                  queues the frame for display.  Nothing is drawn into
+                  the frame.
+
+    The display consumer takes the raw frame from get_next_frame() and,
+    if it shows the frame, an annotated copy from render_frame(), drawn
+    by a FrameRenderer from the detections and tracks of the frame.
+
+    Display is optional.  At most 'display_buffer' frames wait for the
+    display consumer; beyond that the oldest waiting frame is dropped,
+    so capture, detection and logging run the same whether or not
+    anyone is watching.
+
+    The display consumer is paced by a FramePacer from the stream
+    timestamps of the frames, so frames are shown at the cadence of the
+    source.  Late frames without detections are dropped to catch up.
     """
     def __init__(self,
                  name: str,
-                 detector_name: str,
-                 detector_model: str,
+                 camera: str,
+                 inference: InferenceService,
                  stream: str,
                  cam_rate: float,
                  display_rate: float,
                  detection_rate: float,
-                 base_delay: float,
-                 buffer_size: int = 256,
-                 detected_objects: set = None):
+                 buffer_size: int = 64,
+                 display_buffer: int = 16,
+                 detected_objects: set = None,
+                 inference_timeout: float = 5.0,
+                 rate_controller: DetectionRateController = None,
+                 pacer: FramePacer = None,
+                 tracker: ObjectTracker = None,
+                 motion_detector: MotionDetector = None,
+                 renderer: FrameRenderer = None,
+                 motion_max_idle: float = 30.0,
+                 regions: list = None,
+                 tiles: tuple = (1, 1),
+                 tile_overlap: float = 0.15,
+                 on_detections=None,
+                 realtime: bool = False,
+                 resolver: StreamResolver = None,
+                 stall_timeout: float = 10.0,
+                 reconnect_max_delay: float = 60.0,
+                 socketio: SocketIO = None):
+        """
+        :param tracker: tracks detected objects between detections, or None
+        :param motion_detector: gates detection on scene changes, or None
+        :param renderer: draws the annotations of display frames; by default
+        with the camera name on every frame
+        :param motion_max_idle: longest time in seconds detection is skipped for lack of motion
+        :param regions: polygons of the frame to detect in, or None for the whole frame
+        :param tiles: (cols, rows) tiles each region, or the frame, is split into for detection
+        :param tile_overlap: fraction of a tile shared with its neighbour
+        :param on_detections: callable taking (image, detections, frame_time),
+        called for every frame with detections whether or not it is displayed.
+        'image' is the raw frame, valid until the callable returns.
+        :param realtime: read video files no faster than their frame rate, as a live camera delivers them
+        :param resolver: resolves 'stream' in the background; capture starts when it is ready.
+        Without a resolver 'stream' is opened as it is.
+        :param stall_timeout: seconds without a frame after which the stream is reconnected
+        :param reconnect_max_delay: longest time in seconds between reconnect attempts
+        """
         Service.__init__(self, name)
         threading.Thread.__init__(self)
         self.setName(name)
         self._elapsed_time = None
-        self._detector_name = detector_name
-        self._detector_model = detector_model
-        self._detector = _get_detector(detector_name, detector_model)
+        self._camera = camera
         self._cam_stream = stream
         self._cam_fps = cam_rate
         self._display_fps = display_rate
-        self._dpm = detection_rate
-        self._base_delay = base_delay
+        self._rate = rate_controller or DetectionRateController(dpm=detection_rate)
+        self._pacer = pacer or FramePacer()
+        self._tracker = tracker
+        self._motion = motion_detector
+        self._renderer = renderer or FrameRenderer(text=[camera])
+        self._motion_max_idle = motion_max_idle
+        self._regions = regions
+        self._tiles = tiles
+        self._tile_overlap = tile_overlap
+        self._crops = None  # tiles of the frame, computed when the frame size is known
+        self._last_detection_time = 0
+        self._last_due_time = 0
+        self._det_skipped = 0
+        self._det_triggers = 0
+        self._resolver = resolver
+        self._reader = StreamReader(name,
+                                    stream=None if resolver else self.cam_stream,
+                                    resolver=resolver,
+                                    frame_step=self._frame_step,
+                                    realtime=realtime,
+                                    stall_timeout=stall_timeout,
+                                    max_delay=reconnect_max_delay,
+                                    on_state=self._on_stream_state)
+        self._frames_captured = 0
+        self._capture_dropped = 0
+        self._socketio = socketio
+        self._last_emit = {}  # event -> time of the last emit
         self._det_objs = detected_objects
 
-        # queues
+        # inference stage
+        self._inference_timeout = inference_timeout
+        self._inference = inference
+        self._inference.register(camera, self._add_detection_result)
+        self._results_cond = threading.Condition()
+        self._det_results = {}  # frame_num -> detections for frames awaiting overlay
+        self._in_flight = {}  # frame_num -> slot of frames submitted and not yet returned
+        self._abandoned = set()  # numbers of in flight frames the overlay stage stopped waiting for
+        self._overlay_thread = None
+        self._on_detections = on_detections
+
+        # frame buffer
         self.buffer_size = buffer_size
-        self._ref_queue = queue.Queue(buffer_size)  # includes frame num and queue to get frame from
-        self._det_queue = queue.Queue(buffer_size)  # includes frames with processed detections
-        self._undet_queue = queue.Queue(buffer_size)  # includes frame without detections
+        self.display_buffer = display_buffer
+        self._ring: FrameRing = None  # allocated when the frame size is known
+        self._capture_queue = queue.Queue(buffer_size)  # (slot, awaiting detection) for the overlay stage
+        self._display_slot = None  # slot held by the display consumer
+
+        self._register_metrics()
+
+    def _register_metrics(self):
+        camera = self._camera
+        self._read_time = METRICS.histogram("video_read_seconds", "Time to grab and decode a frame",
+                                            camera=camera)
+        self._detection_wait = METRICS.histogram("video_detection_wait_seconds",
+                                                 "Time the overlay stage waited for a frame's detections",
+                                                 camera=camera)
+        self._overlay_time = METRICS.histogram("video_overlay_seconds", "Time to track the objects of a frame",
+                                               camera=camera)
+        self._render_time = METRICS.histogram("video_render_seconds", "Time to draw the annotations of a display frame",
+                                              camera=camera)
+        METRICS.counter("video_frames_captured_total", "Frames captured",
+                        fn=lambda: self._frames_captured, camera=camera)
+        METRICS.counter("video_frames_grabbed_total", "Frames grabbed from the stream",
+                        fn=lambda: self._reader.grabbed, camera=camera)
+        METRICS.counter("video_frames_decoded_total", "Frames grabbed and decoded",
+                        fn=lambda: self._reader.decoded, camera=camera)
+        METRICS.counter("video_stream_reconnects_total", "Attempts to reconnect the stream",
+                        fn=lambda: self._reader.reconnects, camera=camera)
+        METRICS.counter("video_stream_stalls_total", "Grabs that took longer than the stall timeout",
+                        fn=lambda: self._reader.stalls, camera=camera)
+        METRICS.counter("video_capture_dropped_total",
+                        "Frames dropped at capture for lack of a free slot or a stalled overlay stage",
+                        fn=lambda: self._capture_dropped, camera=camera)
+        METRICS.counter("video_display_dropped_total", "Frames dropped because the display fell behind",
+                        fn=lambda: self.display_dropped, camera=camera)
+        METRICS.gauge("video_display_queue", "Frames waiting for the display",
+                      fn=self.get_queue_size, camera=camera)
+        METRICS.gauge("video_display_lag_seconds", "Smoothed time frames were shown after they were due",
+                      fn=lambda: self._pacer.lag, camera=camera)
+        METRICS.gauge("video_display_jitter_seconds", "Smoothed display interval jitter",
+                      fn=lambda: self._pacer.jitter, camera=camera)
+        METRICS.gauge("detection_in_flight", "Frames submitted for detection and not yet returned",
+                      fn=lambda: len(self._in_flight), camera=camera)
+        METRICS.gauge("detection_rate_dpm", "Detections per minute set by the rate controller",
+                      fn=lambda: self.dpm, camera=camera)
+        METRICS.counter("detection_skipped_total", "Due detections skipped because the scene was still",
+                        fn=lambda: self._det_skipped, camera=camera)
+        METRICS.counter("detection_triggers_total", "Detections started early by motion",
+                        fn=lambda: self._det_triggers, camera=camera)
 
     # GETTERS AND SETTERS
 
     @property
-    def det_name(self) -> str:
-        return self._detector_name[0]
-
-    @det_name.setter
-    def det_name(self, val: str):
-        self._detector_name = val
-
-    @property
-    def det_model(self) -> str:
-        return self._detector_model[0]
-
-    @det_model.setter
-    def det_model(self, val: str):
-        self._detector_model = val
+    def camera(self) -> str:
+        return self._camera
 
     @property
     def cam_stream(self) -> str:
@@ -133,19 +244,66 @@ class VideoService(Service, threading.Thread):
 
     @property
     def dpm(self) -> float:
-        return self._dpm
+        return self._rate.dpm
 
     @dpm.setter
     def dpm(self, val: float):
-        self._dpm = val
+        self._rate.dpm = val
+
+    @property
+    def rate_controller(self) -> DetectionRateController:
+        return self._rate
+
+    @property
+    def pacer(self) -> FramePacer:
+        return self._pacer
 
     @property
-    def base_delay(self) -> float:
-        return self._base_delay[0]
+    def tracker(self) -> ObjectTracker:
+        return self._tracker
 
-    @base_delay.setter
-    def base_delay(self, val: float):
-        self._base_delay = val
+    @property
+    def renderer(self) -> FrameRenderer:
+        return self._renderer
+
+    @property
+    def det_skipped(self) -> int:
+        """Number of detections skipped because nothing moved"""
+        return self._det_skipped
+
+    @property
+    def det_triggers(self) -> int:
+        """Number of detections run early because motion started"""
+        return self._det_triggers
+
+    @property
+    def frames_captured(self) -> int:
+        return self._frames_captured
+
+    @property
+    def reader(self) -> StreamReader:
+        return self._reader
+
+    @property
+    def stream_status(self) -> dict:
+        """State of the stream's resolver, with the reader's state and counters as 'capture'"""
+        status = self._resolver.status if self._resolver else {'source': str(self.cam_stream),
+                                                               'state': 'ready',
+                                                               'fps': self._reader.fps,
+                                                               'error': None}
+        return dict(status, capture=self._reader.status)
+
+    @property
+    def capture_dropped(self) -> int:
+        """Number of frames dropped at capture because no ring slot was free or the overlay stage stalled"""
+        return self._capture_dropped
+
+    @property
+    def display_dropped(self) -> int:
+        """Number of frames dropped because the display consumer fell behind"""
+        if not self._ring:
+            return 0
+        return self._ring.dropped + self._pacer.dropped
 
     @property
     def det_objs(self) -> set:
@@ -165,107 +323,332 @@ class VideoService(Service, threading.Thread):
     # END GETTERS AND SETTERS
 
     def get_trained_objects(self) -> set:
-        return self._detector.get_trained_objects()
+        return self._inference.get_trained_objects()
 
     def start(self):
         self._running = True
+        self._overlay_thread = threading.Thread(target=self._run_overlay, daemon=True,
+                                                name="{}-overlay".format(self.getName()))
+        self._overlay_thread.start()
         threading.Thread.start(self)
 
-    def get_queue_size(self) -> int:
-        return self._ref_queue.qsize()
+    def stop(self):
+        self._running = False
+        self._reader.stop()
+        self._inference.unregister(self._camera)
+        with self._results_cond:
+            self._results_cond.notify_all()
 
-    def add_frame(self, frame: Frame,) -> None:
-
-        print("ADD FRAME              ", end='\r')
-
-        try:
-            self._ref_queue.put((frame.num, frame.queue), block=True)  # True, timeout=1 / 60)
-            frame.queue.put(frame, block=True)  # True, timeout=1 / 60)
-
-        except queue.Full:
-            pass
+    def get_queue_size(self) -> int:
+        if not self._ring:
+            return 0
+        return self._ring.ready_count
 
     def get_next_frame(self) -> (bool, np.array, list, float):
         """
         Return the next frame image and associated
-        detections, if they exist.
-        :return: frame image, list of detections
+        detections, if they exist.  Waits until the frame is due
+        for display.  Late frames are skipped unless they carry
+        detections or are the last frame waiting.  The image is the
+        raw frame, a view of a ring slot, and stays valid until the
+        next call; render_frame() draws its annotations on a copy.
+        :return: frame image, detections array or None
         """
-        frame_num, frame_queue = self._ref_queue.get()
-        try:
-            frame = frame_queue.get(block=False)
-        except queue.Empty:
+        if self._display_slot is not None:
+            self._ring.release(self._display_slot)
+            self._display_slot = None
+
+        if not self._ring:
+            time.sleep(.1)
             return False, None, None, None
 
-        return True, frame.image, frame.detections, frame.time
+        while True:
+            slot = self._ring.next_ready(timeout=1)
+            if slot is None:
+                return False, None, None, None
 
-    def run(self):
+            detections = self._ring.detections(slot)
+            droppable = (detections is None or not len(detections)) and self._ring.ready_count > 0
+            if self._pacer.pace(self._ring.pts(slot), droppable):
+                break
+            self._ring.release(slot)
+
+        self._emit("update_vid_stats", dict(self._pacer.stats,
+                                            buffer_size=self._ring.ready_count,
+                                            display_dropped=self._ring.dropped,
+                                            elapsed_time=str(self._elapsed_time)))
+
+        self._display_slot = slot
+        return True, self._ring.frame(slot), self._ring.detections(slot), self._ring.time(slot)
+
+    def render_frame(self) -> np.array:
         """
-        Thread stops when capture is closed.
+        Annotated copy of the frame last returned by get_next_frame(),
+        drawn from its detections, or from the tracks predicted for it.
+        The copy is reused and stays valid until the next call.
+        :return: image, or None if no frame is held for display
         """
-        # get detector
-        # detector = DetectorFactory.get(self.det_name, self.det_model)
-        # logger.info("Loaded detector->  {}".format(detector))
-        detector = self._detector
-
-        # initialize loop variables
-        frame_num = 0
+        slot = self._display_slot
+        if slot is None:
+            return None
+        start = time.perf_counter()
+        image = self._renderer.render(self._ring.frame(slot), self._ring.detections(slot), self._ring.tracks(slot))
+        self._render_time.observe(time.perf_counter() - start)
+        return image
+
+    def get_frame_meta(self) -> dict:
+        """
+        Metadata of the frame last returned by get_next_frame(), for
+        clients that draw the annotations themselves: its capture
+        'time', 'width' and 'height', and its 'detections' and predicted
+        'tracks' as ImageAI style dictionaries with boxes in frame pixels.
+        """
+        slot = self._display_slot
+        if slot is None:
+            return {}
+        height, width = self._ring.shape[:2]
+        detections, tracks = self._ring.detections(slot), self._ring.tracks(slot)
+        return {'time': self._ring.time(slot),
+                'width': width,
+                'height': height,
+                'detections': to_dicts(detections) if detections is not None else [],
+                'tracks': to_dicts(tracks) if tracks is not None else []}
+
+    def _add_detection_result(self, frame_num: int, detections: np.array, latency: float):
+        """
+        Callback of the inference stage.  Stores the result until the
+        overlay stage reaches the frame with the same number and feeds
+        the latency to the detection rate controller.  Results of frames
+        the overlay stage gave up on are discarded.  The frame's slot is
+        released by the inference stage here.
+        """
+        with self._results_cond:
+            slot = self._in_flight.pop(frame_num, None)
+            if frame_num in self._abandoned:
+                self._abandoned.discard(frame_num)
+            elif slot is not None:
+                self._det_results[frame_num] = detections
+            queue_depth = len(self._in_flight)
+            self._results_cond.notify_all()
+        if slot is not None:
+            self._ring.release(slot)
+
+        self._rate.update(latency, queue_depth)
+        self._emit("detection_rate", dict(self._rate.state,
+                                          skipped=self._det_skipped,
+                                          triggers=self._det_triggers))
+
+    def _emit(self, event: str, data: dict, throttle: bool = True):
+        """
+        Send statistics of this camera over the socket, at most once per
+        STATS_EMIT_INTERVAL per event unless not 'throttle', e.g. for state changes
+        """
+        if not self._socketio or (throttle and time.time() - self._last_emit.get(event, 0) < STATS_EMIT_INTERVAL):
+            return
+        self._last_emit[event] = time.time()
+        data['camera'] = self._camera
+        self._socketio.emit(event, json.dumps(data), broadcast=True)
 
-        # open cam and start capture
-        logger.info("Starting cam ... ")
-        cap = cv2.VideoCapture(self.cam_stream)
+    def _on_stream_state(self, status: dict):
+        """Callback of the stream reader when its state changes"""
+        self._emit("stream_state", self.stream_status, throttle=False)
 
-        # main loop
-        self._running = True
-        if self._running and cap.isOpened():
-            logger.info("\tCAM STARTED!")
+    def _wait_for_detection(self, frame_num: int) -> np.array:
+        """
+        Wait until the inference result for 'frame_num' arrives.  Gives up
+        after the inference timeout so a stuck detector can not hold up
+        the display; its late result is discarded when it arrives.
+        :return: detections array, or None if detection failed or timed out
+        """
+        with self._results_cond:
+            self._results_cond.wait_for(lambda: frame_num in self._det_results or not self._running,
+                                        timeout=self._inference_timeout)
+            if frame_num in self._in_flight:
+                self._abandoned.add(frame_num)
+            return self._det_results.pop(frame_num, None)
+
+    def _discard_detection(self, frame_num: int):
+        """
+        Forget the detection of a frame that is not displayed.  A result
+        still in flight is discarded when it arrives.
+        """
+        with self._results_cond:
+            if frame_num in self._in_flight:
+                self._abandoned.add(frame_num)
+            self._det_results.pop(frame_num, None)
 
-        # start timer
-        self._elapsed_time = ElapsedTime()
-        last_detection_time = 0
+    def _run_overlay(self):
+        """
+        Overlay stage.  Frames leave this stage in capture order.  Frames
+        submitted for inference are held until their detections arrive,
+        which delays the display by one inference, but never the capture.
+        Detections and predicted tracks are kept in the frame's ring slot;
+        the image is left as it was decoded.
+        """
+        while self._running:
+            try:
+                slot, awaiting_detection = self._capture_queue.get(timeout=1)
+            except queue.Empty:
+                continue
 
-        while cap.isOpened() and self._running:
+            pts = self._ring.pts(slot)
 
-            # loop until display fps reached
-            c = 0
-            while c < self.cam_fps / self.display_fps:
-                c += int(cap.grab())
+            detections = None
+            start = time.perf_counter()
+            if awaiting_detection:
+                detections = self._wait_for_detection(self._ring.num(slot))
+                self._detection_wait.observe(time.perf_counter() - start)
+                start = time.perf_counter()
+                if detections is not None:
+                    if self._tracker:
+                        detections = self._tracker.update(detections, pts)
+                    self._ring.set_detections(slot, detections)
+
+            # frames between detections show the tracked boxes
+            if detections is None and self._tracker:
+                self._ring.set_tracks(slot, self._tracker.predict(pts))
+            self._overlay_time.observe(time.perf_counter() - start)
+
+            if detections is not None and len(detections) and self._on_detections:
+                try:
+                    self._on_detections(self._ring.frame(slot), detections, self._ring.time(slot))
+                except Exception as e:
+                    logger.error("{} // detections: {}".format(self.getName(), e))
 
-            # get next cam frame
-            cur_frame = None
-            while cur_frame is None:
-                _, cur_frame = cap.read()
-            last_pull_time = self._elapsed_time.get()
-            frame_num += 1
+            self._ring.publish(slot)
 
-            stats = {'dpm': round(self.dpm, 1),
-                     'delay': round(self.base_delay, 3),
-                     'buffer_size': self._ref_queue.qsize(),
-                     'elapsed_time': self._elapsed_time}
+    def _detection_due(self, now: float, frame: np.array) -> bool:
+        """
+        Decide whether the frame captured at 'now' is submitted for
+        detection.  Detection runs at the rate controller's interval.
+        With a motion detector, a due detection is skipped while nothing
+        moves, unless none ran for 'motion_max_idle' seconds, and a
+        detection runs at once when motion starts.
+        """
+        since_detection = now - self._last_detection_time
+        due = now - self._last_due_time >= self._rate.interval
+
+        if self._motion:
+            was_moving = self._motion.moving
+            moving = self._motion.update(frame)
+            if moving and not was_moving and not due and since_detection >= self._rate.min_interval:
+                self._det_triggers += 1
+                due = True
+            elif due and not moving and since_detection < self._motion_max_idle:
+                self._last_due_time = now
+                self._det_skipped += 1
+                return False
+
+        if due:
+            self._last_due_time = self._last_detection_time = now
+        return due
+
+    def _frame_step(self) -> float:
+        """Stream frames per displayed frame"""
+        cam_fps = self.cam_fps or self._reader.fps
+        if not cam_fps or not self.display_fps:
+            return 1.0
+        return max(1.0, cam_fps / self.display_fps)
+
+    def _read_frame(self) -> (int, float):
+        """
+        Decode the next due frame straight into a free ring slot.
+        :return: slot number and stream timestamp, or None, None if no
+        slot was free or no frame came
+        """
+        slot = self._ring.acquire(timeout=1)
+        if slot is None:
+            # all slots are in use downstream; drop this frame
+            self._capture_dropped += 1
+            return None, None
 
-            q = self._undet_queue
-            detections = None
-            frame = cur_frame.copy()
+        view = self._ring.frame(slot)
+        success, image, pts = self._reader.read(view)
+        if not success:
+            self._ring.release(slot)
+            return None, None
 
-            # if detection/inference is on, perform detections at detection rate
-            if last_pull_time - last_detection_time >= 60 / self.dpm:
+        # decoder could not write in place (e.g. the stream changed size)
+        if image is not view:
+            np.copyto(view, cv2.resize(image, (view.shape[1], view.shape[0])))
 
-                last_detection_time = last_pull_time
+        return slot, pts
 
-                try:
-                    # run detection on frame
-                    frame, detections = detector.detect(frame=cur_frame.copy(), det_objs=self.det_objs)
-                    q = self._det_queue
+    def run(self):
+        """
+        Capture stage.  Thread stops when the service is stopped or
+        the stream ends.
+        """
+        # initialize loop variables
+        frame_num = 0
 
-                except Exception as e:
-                    logger.error("{} // run() DETECTION: {}".format(self.getName(), e))
+        # open cam and start capture
+        logger.info("Starting cam ... ")
+        self._running = True
+        self._reader.start()
+
+        # size the frame ring from the first frame
+        first_frame = None
+        while first_frame is None and self._running and self._reader.alive:
+            success, first_frame, _ = self._reader.read()
+        if first_frame is None:
+            logger.error("{}: no stream - {}".format(self.getName(), self._reader.status['error']))
+            self._reader.stop()
+            return
+        logger.info("\tCAM STARTED!")
+
+        self._ring = FrameRing(self.buffer_size, first_frame.shape, max_ready=self.display_buffer)
+        if self._regions or self._tiles != (1, 1):
+            self._crops = get_crops(first_frame.shape, self._regions, self._tiles, self._tile_overlap)
+            logger.info("{}: detecting in {} tile(s)".format(self.getName(), len(self._crops)))
+        self._inference.register(self._camera, self._add_detection_result, self._ring, self._crops)
+        self._pacer.reset()
+        if self._tracker:
+            self._tracker.reset()
+        if self._motion:
+            self._motion.reset()
 
-            print("ADD OVERLAY         ", end='\r')
-            frame = add_overlay(frame, stats)
+        # start timer
+        self._elapsed_time = ElapsedTime()
+        self._last_detection_time = self._last_due_time = 0
 
-            frame_tup = Frame(frame_num, time.time(), frame, q, detections)
+        while self._running and self._reader.alive:
 
-            self.add_frame(frame=frame_tup)
+            # get next due cam frame
+            start = time.perf_counter()
+            slot, pts = self._read_frame()
+            if slot is None:
+                continue
+            self._read_time.observe(time.perf_counter() - start)
+            self._frames_captured += 1
+            last_pull_time = self._elapsed_time.get()
+            frame_num += 1
+            self._ring.set_meta(slot, frame_num, time.time(), pts)
+
+            # if detection/inference is on, submit frame at detection rate;
+            # until the detector is ready, frames are displayed without detections
+            awaiting_detection = False
+            if self._inference.ready and self._detection_due(last_pull_time, self._ring.frame(slot)):
+                # the inference stage holds the slot until its result or a drop comes back
+                self._ring.retain(slot)
+                with self._results_cond:
+                    self._in_flight[frame_num] = slot
+                dropped_num = self._inference.submit(self._camera, frame_num, self._ring.frame(slot),
+                                                     self.det_objs, slot)
+                if dropped_num is not None:
+                    # frame was superseded before a worker took it; release it
+                    self._add_detection_result(dropped_num, None, None)
+                awaiting_detection = True
+
+            try:
+                self._capture_queue.put((slot, awaiting_detection), timeout=1)
+            except queue.Full:
+                # the overlay stage is stalled; drop this frame rather than wait holding its slot
+                self._capture_dropped += 1
+                if awaiting_detection:
+                    self._discard_detection(frame_num)
+                self._ring.release(slot)
 
         # release camera upon exit
-        cap.release()
+        self._reader.stop()
+        self._ring.close()
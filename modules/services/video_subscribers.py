@@ -0,0 +1,90 @@
+import threading
+import time
+import logging
+
+from flask_socketio import SocketIO
+
+logger = logging.getLogger('app')
+
+
+class VideoSubscribers:
+    """
+    Socket clients subscribed to the frames of one camera.
+
+    Frames are pushed to each client as a binary 'video_frame' message
+    with the client's acknowledgement requested.  A client may have at
+    most 'max_in_flight' frames that it has not acknowledged; further
+    frames are dropped for that client only, so a slow client or link
+    never holds up the others or the encoder.  Frames not acknowledged
+    within 'ack_timeout' seconds are given up, so a client that lost a
+    message is not stalled forever.
+    """
+
+    def __init__(self, socketio: SocketIO, camera: str, max_in_flight: int = 2, ack_timeout: float = 5.0):
+        self._socketio = socketio
+        self._camera = camera
+        self._max_in_flight = max(1, int(max_in_flight))
+        self._ack_timeout = ack_timeout
+        self._clients = {}  # sid -> {seq: time sent} of the frames it has not acknowledged
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._dropped = 0
+
+    @property
+    def count(self) -> int:
+        """Number of subscribed clients"""
+        return len(self._clients)
+
+    @property
+    def sent(self) -> int:
+        return self._sent
+
+    @property
+    def dropped(self) -> int:
+        """Frames not sent to a client because it had too many unacknowledged frames"""
+        return self._dropped
+
+    def subscribe(self, sid: str):
+        with self._lock:
+            self._clients.setdefault(sid, {})
+        logger.info("{}: socket video client {} subscribed".format(self._camera, sid))
+
+    def unsubscribe(self, sid: str):
+        with self._lock:
+            removed = self._clients.pop(sid, None) is not None
+        if removed:
+            logger.info("{}: socket video client {} unsubscribed".format(self._camera, sid))
+
+    def ack(self, sid: str, seq: int):
+        """Acknowledgement of frame 'seq' by client 'sid'"""
+        with self._lock:
+            in_flight = self._clients.get(sid)
+            if in_flight is not None:
+                in_flight.pop(seq, None)
+
+    def send(self, seq: int, jpeg: bytes, meta: dict):
+        """
+        Push an encoded frame and its metadata to every client that can take it.
+        :param meta: JSON-safe metadata of the frame, e.g. its detections
+        """
+        now = time.monotonic()
+        message = dict(meta, camera=self._camera, seq=seq, image=jpeg)
+        with self._lock:
+            ready = []
+            for sid, in_flight in self._clients.items():
+                for s in [s for s, sent in in_flight.items() if now - sent > self._ack_timeout]:
+                    del in_flight[s]
+                if len(in_flight) < self._max_in_flight:
+                    in_flight[seq] = now
+                    ready.append(sid)
+                else:
+                    self._dropped += 1
+
+        for sid in ready:
+            try:
+                self._socketio.emit('video_frame', message, room=sid,
+                                    callback=lambda *args, sid=sid: self.ack(sid, seq))
+                self._sent += 1
+            except Exception as e:
+                logger.error("{} // socket video client {}: {}".format(self._camera, sid, e))
+                self.unsubscribe(sid)
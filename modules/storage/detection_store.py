@@ -0,0 +1,298 @@
+import os
+import time
+import datetime
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger('app')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counts (
+    minute INTEGER NOT NULL,  -- epoch seconds of the start of the minute
+    object TEXT NOT NULL,
+    count REAL NOT NULL,
+    uniques INTEGER,  -- number of objects first tracked in the minute, NULL without tracking
+    PRIMARY KEY (minute, object)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS counts_object_minute ON counts (object, minute);
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution INTEGER NOT NULL,  -- bucket size in minutes
+    bucket INTEGER NOT NULL,  -- epoch seconds of the start of the bucket
+    object TEXT NOT NULL,
+    count REAL NOT NULL,  -- sum of the minute counts in the bucket
+    minutes INTEGER NOT NULL,  -- number of minute counts in the bucket
+    uniques INTEGER NOT NULL DEFAULT 0,  -- sum of the minute unique counts in the bucket
+    PRIMARY KEY (resolution, bucket, object)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT PRIMARY KEY,  -- absolute path of an imported text log
+    through INTEGER NOT NULL  -- epoch seconds of the last minute imported from it
+);
+"""
+
+# bucket sizes, in minutes, of the pre-aggregated rollups
+ROLLUP_RESOLUTIONS = (15, 60, 1440)
+
+# columns added after the first release: table -> ((column, definition), ...)
+MIGRATIONS = {'counts': (('uniques', 'INTEGER'),),
+              'rollups': (('uniques', 'INTEGER NOT NULL DEFAULT 0'),)}
+
+
+def _to_epoch(dt: datetime.datetime) -> int:
+    """Epoch seconds of the local time minute that includes 'dt'"""
+    return int(time.mktime(dt.replace(second=0, microsecond=0).timetuple()))
+
+
+def _bucket(minute: int, resolution: int) -> int:
+    """Epoch seconds of the start of the local time bucket that includes 'minute'"""
+    dt = datetime.datetime.fromtimestamp(minute)
+    if resolution >= 1440:
+        return _to_epoch(dt.replace(hour=0, minute=0))
+    day_minute = dt.hour * 60 + dt.minute
+    start = day_minute - day_minute % resolution
+    return _to_epoch(dt.replace(hour=start // 60, minute=start % 60))
+
+
+class DetectionStore:
+    """
+    Detection history kept in a local SQLite database.
+
+    Each row is the average count of an object for one minute and, when
+    objects are tracked, the number of objects first seen in it.  Rows are
+    indexed by time and by object and time so that range queries never
+    scan the whole history.  Rows are buffered and written in one
+    transaction every 'flush_minutes' minutes, and rows older than
+    'retention_days' are removed once an hour.
+
+    15 minute, hourly and daily rollups are updated in the same
+    transaction as each new minute row, so long ranges are answered
+    from the rollups without reading minute rows.  Rollups are not
+    subject to the retention period: minutes older than the retention
+    period, e.g. of an imported log, are added to the rollups only.
+    """
+
+    def __init__(self, db_path: str, retention_days: int = 90, flush_minutes: int = 5):
+        self._db_path = db_path
+        self._retention_days = retention_days
+        self._flush_minutes = flush_minutes
+        self._pending = []
+        self._last_flush = time.time()
+        self._last_prune = 0
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    @property
+    def db_path(self) -> str:
+        return self._db_path
+
+    @property
+    def retention_days(self) -> int:
+        return self._retention_days
+
+    @retention_days.setter
+    def retention_days(self, val: int):
+        self._retention_days = val
+
+    def add(self, count_time: datetime.datetime, counts: dict, uniques: dict = None):
+        """
+        Buffer a minute of average counts.  Written on the next flush.
+        :param count_time: time of the count, truncated to the minute
+        :param counts: dictionary of object name to average count
+        :param uniques: dictionary of object name to number of objects first
+        tracked in the minute, or None if objects are not tracked
+        """
+        minute = _to_epoch(count_time)
+        with self._lock:
+            self._pending.extend((minute, k, float(v), None if uniques is None else int(uniques.get(k, 0)))
+                                 for k, v in counts.items())
+
+        if time.time() - self._last_flush >= self._flush_minutes * 60:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows in one transaction and apply retention."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._last_flush = time.time()
+            with self._conn:
+                self._insert(rows, self._cutoff())
+                if self._retention_days and time.time() - self._last_prune > 60 * 60:
+                    self._last_prune = time.time()
+                    self._conn.execute("DELETE FROM counts WHERE minute < ?", (self._cutoff(),))
+
+    def query(self,
+              start: datetime.datetime,
+              end: datetime.datetime,
+              objects: set = None) -> list:
+        """
+        Minute counts in the time range [start, end).
+        :return: list of (datetime, object, count) ordered by time
+        """
+        sql, args = self._range_sql("SELECT minute, object, count FROM counts", start, end, objects)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY minute, object", args).fetchall()
+        return [(datetime.datetime.fromtimestamp(m), o, c) for m, o, c in rows]
+
+    def series(self,
+               resolution: int,
+               start: datetime.datetime,
+               end: datetime.datetime,
+               objects: set = None) -> list:
+        """
+        Counts per object in buckets of 'resolution' minutes over the
+        time range [start, end).  One minute resolution reads the minute
+        rows, other resolutions read the rollups.
+        :param resolution: 1 or one of ROLLUP_RESOLUTIONS
+        :return: list of (datetime, object, count, minutes, uniques) ordered by time
+        """
+        if self._pending:
+            self.flush()
+
+        if resolution == 1:
+            sql, args = self._range_sql("SELECT minute, object, count, 1, COALESCE(uniques, 0) FROM counts",
+                                        start, end, objects)
+            sql += " ORDER BY minute, object"
+        elif resolution in ROLLUP_RESOLUTIONS:
+            sql = "SELECT bucket, object, count, minutes, uniques FROM rollups " \
+                  "WHERE resolution = ? AND bucket >= ? AND bucket < ?"
+            args = [resolution, _bucket(_to_epoch(start), resolution), _to_epoch(end)]
+            if objects:
+                sql += " AND object IN ({})".format(','.join('?' * len(objects)))
+                args += sorted(objects)
+            sql += " ORDER BY bucket, object"
+        else:
+            raise ValueError("Unsupported resolution: {}".format(resolution))
+
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [(datetime.datetime.fromtimestamp(b), o, c, n, u) for b, o, c, n, u in rows]
+
+    def totals(self,
+               start: datetime.datetime,
+               end: datetime.datetime,
+               objects: set = None) -> dict:
+        """
+        Sum of the minute counts of each object in the time range [start, end).
+        :return: dictionary of object name to total count
+        """
+        sql, args = self._range_sql("SELECT object, SUM(count) FROM counts", start, end, objects)
+        with self._lock:
+            rows = self._conn.execute(sql + " GROUP BY object", args).fetchall()
+        return dict(rows)
+
+    def import_text_log(self, file_path: str) -> int:
+        """
+        Load a pipe delimited 'date_time|day_minute|object|count' log file
+        as written by earlier versions.  Rows that already exist are kept,
+        so importing the same file again is harmless.  Minutes older than
+        the retention period are added to the rollups only; the last
+        minute imported from each file is recorded so that they are not
+        added again by a later import.
+        :return: number of rows stored
+        """
+        if not os.path.isfile(file_path):
+            return 0
+
+        rows = []
+        with open(file_path) as fp:
+            for line in fp:
+                parts = line.strip().split('|')
+                if len(parts) != 4 or parts[0] == 'date_time':
+                    continue
+                try:
+                    dt = datetime.datetime.strptime(parts[0], "%Y-%m-%d %H:%M:%S")
+                    rows.append((_to_epoch(dt), parts[2], float(parts[3]), None))
+                except ValueError:
+                    logger.warning("Skipped log line: {}".format(line.strip()))
+
+        path = os.path.abspath(file_path)
+        with self._lock, self._conn:
+            cutoff = self._cutoff()
+            row = self._conn.execute("SELECT through FROM imports WHERE path = ?", (path,)).fetchone()
+            through = row[0] if row else None
+            if through is not None:
+                # minutes before the cutoff leave no minute row to detect a repeated import by
+                new_rows = [r for r in rows if r[0] >= cutoff or r[0] > through]
+            else:
+                new_rows = rows
+            inserted = self._insert(new_rows, cutoff)
+            if rows:
+                last = max(max(r[0] for r in rows), through or 0)
+                self._conn.execute("INSERT OR REPLACE INTO imports (path, through) VALUES (?, ?)", (path, last))
+
+        logger.info("Imported {} of {} log rows from {}".format(inserted, len(rows), file_path))
+        return inserted
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    def _cutoff(self) -> int:
+        """Epoch seconds before which minute rows are past the retention period, or 0 to keep all"""
+        if not self._retention_days:
+            return 0
+        return int(time.time()) - self._retention_days * 24 * 60 * 60
+
+    def _insert(self, rows: list, cutoff: int = 0) -> int:
+        """
+        Insert new minute rows and add them to the rollups.  Minutes that
+        are already stored are skipped so that they are not counted
+        twice.  Minutes before 'cutoff', past the retention period, are
+        added to the rollups only.
+        Must be called with the lock held, inside a transaction.
+        :return: number of rows inserted or added to the rollups
+        """
+        inserted = 0
+        folded = set()  # minutes before the cutoff added to the rollups, as (minute, object)
+        for minute, obj, count, uniques in rows:
+            if minute >= cutoff:
+                cur = self._conn.execute("INSERT OR IGNORE INTO counts (minute, object, count, uniques) "
+                                         "VALUES (?, ?, ?, ?)", (minute, obj, count, uniques))
+                if cur.rowcount == 0:
+                    continue
+                inserted += cur.rowcount
+            else:
+                if (minute, obj) in folded:
+                    continue
+                folded.add((minute, obj))
+                inserted += 1
+
+            uniques = uniques or 0
+            for resolution in ROLLUP_RESOLUTIONS:
+                bucket = _bucket(minute, resolution)
+                cur = self._conn.execute("UPDATE rollups SET count = count + ?, minutes = minutes + 1, "
+                                         "uniques = uniques + ? "
+                                         "WHERE resolution = ? AND bucket = ? AND object = ?",
+                                         (count, uniques, resolution, bucket, obj))
+                if cur.rowcount == 0:
+                    self._conn.execute("INSERT INTO rollups (resolution, bucket, object, count, minutes, uniques) "
+                                       "VALUES (?, ?, ?, ?, 1, ?)", (resolution, bucket, obj, count, uniques))
+        return inserted
+
+    def _migrate(self):
+        """Add columns that databases created by earlier versions lack."""
+        with self._conn:
+            for table, columns in MIGRATIONS.items():
+                existing = {row[1] for row in self._conn.execute("PRAGMA table_info({})".format(table))}
+                for column, definition in columns:
+                    if column not in existing:
+                        self._conn.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, column, definition))
+
+    @staticmethod
+    def _range_sql(select: str, start, end, objects) -> (str, list):
+        sql = select + " WHERE minute >= ? AND minute < ?"
+        args = [_to_epoch(start), _to_epoch(end)]
+        if objects:
+            sql += " AND object IN ({})".format(','.join('?' * len(objects)))
+            args += sorted(objects)
+        return sql, args
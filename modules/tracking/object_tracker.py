@@ -0,0 +1,138 @@
+import itertools
+
+import numpy as np
+
+from modules.detectors import detections as dets
+
+
+class Track:
+    """
+    One tracked object.  The box moves at constant velocity between
+    detections; the velocity of each box corner is smoothed over the
+    detections of the object.
+    """
+
+    def __init__(self, track_id: int, class_id: int, box: np.array, t: float):
+        self.track_id = track_id
+        self.class_id = class_id
+        self.box = np.array(box, dtype=np.float64)
+        self.velocity = np.zeros(4)
+        self.last_time = t
+        self.hits = 1
+
+    def predict(self, t: float) -> np.array:
+        """Box at time 't'"""
+        return self.box + self.velocity * max(0.0, t - self.last_time)
+
+    def correct(self, box: np.array, t: float, smoothing: float = 0.5):
+        """Move the track to a detected box at time 't'"""
+        box = np.array(box, dtype=np.float64)
+        dt = t - self.last_time
+        if dt > 0:
+            velocity = (box - self.box) / dt
+            self.velocity = smoothing * velocity + (1 - smoothing) * self.velocity if self.hits > 1 else velocity
+        self.box = box
+        self.last_time = t
+        self.hits += 1
+
+
+class ObjectTracker:
+    """
+    Tracks detected objects across frames so that detection can run on
+    few frames while every frame shows boxes.
+
+    update() matches the detections of an inference frame to the tracks
+    of the same class.  A detection matches the track whose box,
+    moved to the frame's time, overlaps it most, with an IoU of at least
+    'iou_threshold'.  Objects that moved too far between detections to
+    overlap are matched by centroid distance, up to 'max_distance' times
+    the track box's diagonal.  Unmatched detections start new tracks with
+    new ids.  predict() moves the boxes of all tracks to the time of a
+    frame without detections.  Tracks not detected for 'max_age' seconds
+    are removed.
+
+    Each new track is flagged once, so counting flagged detections
+    counts every object once however many frames it appears in.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_age: float = 2.0, max_distance: float = 1.5):
+        self._iou_threshold = iou_threshold
+        self._max_age = max_age
+        self._max_distance = max_distance
+        self._tracks = []
+        self._ids = itertools.count(1)
+
+    @property
+    def tracks(self) -> list:
+        return self._tracks
+
+    def update(self, detections: np.array, t: float) -> np.array:
+        """
+        Match the detections of a frame to the tracks.
+        :param detections: detections array of the frame
+        :param t: time of the frame in seconds
+        :return: copy of the detections with 'track_id' and 'new_track' set
+        """
+        self._expire(t)
+        tracked = detections.copy()
+        boxes = tracked['box'].astype(np.float64)
+
+        # score every detection-track pair of the same class; overlaps rank above centroid matches
+        matches = {}
+        if len(tracked) and self._tracks:
+            predicted = np.array([track.predict(t) for track in self._tracks])
+            same_class = tracked['class_id'][:, np.newaxis] == [track.class_id for track in self._tracks]
+
+            w = np.minimum(boxes[:, np.newaxis, 2], predicted[:, 2]) - np.maximum(boxes[:, np.newaxis, 0],
+                                                                                  predicted[:, 0])
+            h = np.minimum(boxes[:, np.newaxis, 3], predicted[:, 3]) - np.maximum(boxes[:, np.newaxis, 1],
+                                                                                  predicted[:, 1])
+            inter = np.maximum(0, w) * np.maximum(0, h)
+            union = dets.area(boxes)[:, np.newaxis] + dets.area(predicted) - inter
+            iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+            diagonal = np.hypot(predicted[:, 2] - predicted[:, 0], predicted[:, 3] - predicted[:, 1])
+            centre = (boxes[:, :2] + boxes[:, 2:]) / 2
+            distance = np.hypot(*(centre[:, np.newaxis] - (predicted[:, :2] + predicted[:, 2:]) / 2).T).T
+            near = (diagonal > 0) & (distance <= self._max_distance * diagonal)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                score = np.where(iou >= self._iou_threshold, 1 + iou,
+                                 np.where(near, 1 - distance / diagonal / self._max_distance, -np.inf))
+            score[~same_class] = -np.inf
+
+            matched_tracks = set()
+            pairs = np.argwhere(np.isfinite(score))
+            for i, k in pairs[np.argsort(-score[pairs[:, 0], pairs[:, 1]], kind='stable')]:
+                if i in matches or k in matched_tracks:
+                    continue
+                matches[i] = self._tracks[k]
+                matched_tracks.add(k)
+
+        for i in range(len(tracked)):
+            track = matches.get(i)
+            if track is not None:
+                track.correct(boxes[i], t)
+            else:
+                track = Track(next(self._ids), tracked['class_id'][i], boxes[i], t)
+                self._tracks.append(track)
+            tracked['track_id'][i] = track.track_id
+            tracked['new_track'][i] = track.hits == 1
+
+        return tracked
+
+    def predict(self, t: float) -> np.array:
+        """
+        Boxes of all current tracks at time 't'.
+        :return: detections array with 'class_id', 'box' and 'track_id'
+        """
+        self._expire(t)
+        tracks = dets.create([track.class_id for track in self._tracks], 0,
+                             [track.predict(t) for track in self._tracks])
+        tracks['track_id'] = [track.track_id for track in self._tracks]
+        return tracks
+
+    def reset(self):
+        self._tracks = []
+
+    def _expire(self, t: float):
+        self._tracks = [track for track in self._tracks if t - track.last_time <= self._max_age]
@@ -11,9 +11,12 @@ document.addEventListener('DOMContentLoaded', () => {
 
   setup_buttons();
   setup_log_listing(socket);
-  // setup_vid_stats(socket);
+  setup_vid_stats(socket);
   setup_app_log(socket);
-  setup_base_delay(socket);
+  setup_detection_rate(socket);
+  setup_metrics(socket);
+  setup_stream_state(socket);
+  setup_video_socket(socket);
 
 });
 // ########################  end DOMContentLoaded ########################
@@ -109,13 +112,16 @@ function update_log(log_data) {
   let first_item = true;
   for ( let k in json_data ) {
 
-    if (k==='time_stamp')
+    if (k==='time_stamp' || k==='camera' || k==='unique')
       {continue;}
 
     // define data elements
     let c1_data = "";
     if (first_item === true) {
       c1_data = `${json_data['time_stamp']}`;
+      if (json_data.hasOwnProperty('camera')) {
+        c1_data += ` (${json_data['camera']})`;
+      }
       first_item = false
     }
 
@@ -124,6 +130,9 @@ function update_log(log_data) {
     if (json_data.hasOwnProperty(k)) {
       c2_data = `${k}`;
       c3_data = (Math.round(parseFloat(json_data[k])*10000)/10000).toString();
+      if (json_data.hasOwnProperty('unique')) {
+        c3_data += ` (${json_data['unique'][k] || 0} new)`;
+      }
     } // end if
 
     // create the html row
@@ -171,39 +180,216 @@ function setup_app_log(socket) {
 // END APPLICATION LOG ################################
 
 
+// STREAM STATE ################################
+function setup_stream_state(socket) {
+  socket.on('stream_state', state_data => {
+    update_stream_state(JSON.parse(state_data));
+  });
+
+  // the stream may have been resolved before the page loaded
+  let camera = document.querySelector('#stream_state').dataset.camera;
+  let poll_status = () => {
+    // '/status' answers 503 until everything is ready, with the same body
+    fetch('/status')
+      .then(response => response.json())
+      .then(status => {
+        if (status['cameras'].hasOwnProperty(camera)) {
+          update_stream_state(Object.assign({'camera': camera}, status['cameras'][camera]['stream']));
+        }
+        update_detector_state(status['inference']);
+        // the detector has no event of its own; ask again while it loads
+        if (status['inference']['state'] === 'loading') {
+          setTimeout(poll_status, 2000);
+        }
+      });
+  };
+  poll_status();
+}
+
+function update_detector_state(json_data) {
+  let dselem = document.querySelector('#detector_state');
+
+  if (json_data['state'] === 'ready') {
+    dselem.innerHTML = `${json_data['model']} ready, warm-up ${json_data['warmup_s']} s`;
+  } else if (json_data['state'] === 'failed') {
+    dselem.innerHTML = `failed - ${json_data['error']}`;
+  } else {
+    dselem.innerHTML = `loading ${json_data['model']} ...`;
+  }
+}
+
+function update_stream_state(json_data) {
+  let sselem = document.querySelector('#stream_state');
+
+  // only show the state of the camera on this page
+  if (sselem.dataset.camera !== json_data['camera']) {
+    return;
+  }
+
+  let capture = json_data['capture'] || {};
+  if (capture['state'] === 'reconnecting') {
+    sselem.innerHTML = `reconnecting (${capture['reconnects']}) - ${capture['error']}`;
+  } else if (capture['state'] === 'ended') {
+    sselem.innerHTML = 'ended';
+  } else if (json_data['state'] === 'ready') {
+    sselem.innerHTML = `ready, ${json_data['fps']} fps`;
+  } else if (json_data['state'] === 'failed') {
+    sselem.innerHTML = `failed - ${json_data['error']}`;
+  } else {
+    sselem.innerHTML = 'connecting ...';
+  }
+}
+// END STREAM STATE ################################
+
+
+// SOCKET VIDEO ################################
+function setup_video_socket(socket) {
+  let canvas = document.querySelector('#video_canvas');
+  if (canvas === null) {
+    return;
+  }
+  let camera = canvas.dataset.camera;
+
+  // subscribe again after each reconnect
+  socket.on('connect', () => {
+    socket.emit('video_subscribe', camera);
+  });
+  if (socket.connected) {
+    socket.emit('video_subscribe', camera);
+  }
+
+  socket.on('video_frame', (frame, ack) => {
+    if (frame['camera'] !== camera) {
+      return;
+    }
+    // acknowledge once the frame is drawn, so the server sends no faster than it is shown
+    draw_video_frame(canvas, frame).then(() => {
+      if (ack) {ack(frame['seq']);}
+    });
+  });
+}
+
+function draw_video_frame(canvas, frame) {
+  let url = URL.createObjectURL(new Blob([frame['image']], {type: 'image/jpeg'}));
+  let img = new Image();
+  return new Promise(resolve => {
+    img.onload = () => {
+      if (canvas.width !== frame['width'] || canvas.height !== frame['height']) {
+        canvas.width = frame['width'];
+        canvas.height = frame['height'];
+      }
+      let ctx = canvas.getContext('2d');
+      ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
+      draw_annotations(ctx, frame['detections'] || [], frame['tracks'] || []);
+      URL.revokeObjectURL(url);
+      resolve();
+    };
+    img.onerror = () => {
+      URL.revokeObjectURL(url);
+      resolve();
+    };
+    img.src = url;
+  });
+}
+
+function draw_annotations(ctx, detections, tracks) {
+  // same boxes and labels as the server draws into the MJPEG feed
+  ctx.font = '11px sans-serif';
+  ctx.strokeStyle = ctx.fillStyle = 'rgb(0, 0, 255)';
+  for (let d of detections) {
+    let [x1, y1, x2, y2] = d['box_points'];
+    ctx.lineWidth = 2;
+    ctx.strokeRect(x1, y1, x2 - x1, y2 - y1);
+    ctx.fillText(`${d['name']} : ${d['percentage_probability'].toFixed(1)}`, x1, Math.max(y1 - 5, 10));
+    if (d.hasOwnProperty('track_id')) {
+      ctx.fillText(`#${d['track_id']}`, x1, Math.min(y2 + 12, ctx.canvas.height - 2));
+    }
+  }
+  for (let t of tracks) {
+    let [x1, y1, x2, y2] = t['box_points'];
+    ctx.lineWidth = 1;
+    ctx.strokeRect(x1, y1, x2 - x1, y2 - y1);
+    ctx.fillText(`${t['name']} #${t['track_id']}`, x1, Math.min(y2 + 12, ctx.canvas.height - 2));
+  }
+}
+// END SOCKET VIDEO ################################
+
+
 // VIDEO STATISTICS ################################
-// function setup_vid_stats(socket){
-//   socket.on('update_vid_stats', vid_stats => {
-//     update_vid_stats(vid_stats);
-//   });
-// }
-//
-// function update_vid_stats(vid_stats){
-//   let json_data = JSON.parse(vid_stats);
-//
-//   if (json_data.hasOwnProperty('buffer_size')) {
-//     let bsize = document.querySelector("#buffer_size");
-//     bsize.innerHTML = `${json_data['buffer_size']}`
-//   }
-//
-//   if (json_data.hasOwnProperty('ttl_delay')) {
-//     let bsize = document.querySelector("#ttl_delay");
-//     bsize.innerHTML = `${json_data['ttl_delay']}`
-//   }
-//
-// }
+function setup_vid_stats(socket){
+  socket.on('update_vid_stats', vid_stats => {
+    update_vid_stats(vid_stats);
+  });
+}
+
+function update_vid_stats(vid_stats){
+  let json_data = JSON.parse(vid_stats);
+  let vselem = document.querySelector("#vid_stats");
+
+  // only show the stats of the camera on this page
+  if (vselem.dataset.camera !== json_data['camera']) {
+    return;
+  }
+
+  vselem.innerHTML = `${json_data['fps']} fps, lag ${json_data['lag_ms']} ms, jitter ${json_data['jitter_ms']} ms, dropped ${json_data['dropped']}`;
+  if (json_data['elapsed_time'] !== 'None') {
+    vselem.innerHTML += `, running ${json_data['elapsed_time']}`;
+  }
+
+  if (json_data.hasOwnProperty('buffer_size')) {
+    let bsize = document.querySelector("#buffer_size");
+    bsize.innerHTML = `${json_data['buffer_size']}`
+  }
+
+}
 // END VIDEO STATISTICS ################################
 
 
 // INFO TEXTS ################################
-function setup_base_delay(socket) {
-  socket.on('base_delay_update', val => {
-    update_base_delay(val);
+function setup_detection_rate(socket) {
+  socket.on('detection_rate', rate_data => {
+    update_detection_rate(rate_data);
   });
 }
 
-function update_base_delay(val) {
-  let bdelem = document.querySelector('#base_delay');
-  bdelem.innerHTML = val;
+function update_detection_rate(rate_data) {
+  let json_data = JSON.parse(rate_data);
+  let drelem = document.querySelector('#detection_rate');
+
+  // only show the rate of the camera on this page
+  if (drelem.dataset.camera !== json_data['camera']) {
+    return;
+  }
+
+  drelem.innerHTML = `${json_data['dpm']} dpm (p50 ${json_data['p50']}s, p95 ${json_data['p95']}s, queue ${json_data['queue']}, ${json_data['mode']})`;
+  drelem.innerHTML += `, skipped ${json_data['skipped']}, motion triggers ${json_data['triggers']}`;
+}
+// END INFO TEXTS ################################
+
+
+// METRICS ################################
+function setup_metrics(socket) {
+  socket.on('metrics', metrics_data => {
+    update_metrics(metrics_data);
+  });
+}
+
+function update_metrics(metrics_data) {
+  let json_data = JSON.parse(metrics_data);
+  let melem = document.querySelector('#metrics');
+  let camera = melem.dataset.camera;
+
+  // value of a metric for the camera on this page
+  let value = name => (json_data[name] || {})[camera];
+  let ms = name => {
+    let h = value(name);
+    return h ? `${(h['p50'] * 1000).toFixed(1)}/${(h['p95'] * 1000).toFixed(1)}` : '-';
+  };
+
+  melem.innerHTML = `read ${ms('video_read_seconds')} ms, detect ${ms('inference_seconds')} ms, `;
+  melem.innerHTML += `track ${ms('video_overlay_seconds')} ms, render ${ms('video_render_seconds')} ms, `;
+  melem.innerHTML += `encode ${ms('broadcast_encode_seconds')} ms (p50/p95)`;
+  melem.innerHTML += `, dropped ${value('video_capture_dropped_total')} capture / ${value('video_display_dropped_total')} display`;
+  melem.innerHTML += `, snapshot backlog ${value('snapshot_backlog')}`;
 }
-// END INFO TEXTS ################################
\ No newline at end of file
+// END METRICS ################################
\ No newline at end of file
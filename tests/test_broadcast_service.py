@@ -0,0 +1,65 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from modules.services.broadcast_service import BroadcastService
+from modules.services.renditions import Rendition
+
+
+def next_frame():
+    time.sleep(0.01)
+    return True, np.zeros((48, 64, 3), np.uint8)
+
+
+@pytest.fixture
+def service():
+    service = BroadcastService('broadcast', next_frame, renditions=[Rendition('full', 0, 90),
+                                                                    Rendition('thumb', 32, 60)],
+                               idle_timeout=0.2)
+    service.start()
+    yield service
+    service.stop()
+    service.join(2)
+
+
+def test_frames_are_encoded_for_watched_rendition(service):
+    seq, jpeg = service.get_frame(0, timeout=2, rendition='thumb')
+    assert seq == 1
+    assert jpeg[:2] == b'\xff\xd8'
+    next_seq, _ = service.get_frame(seq, timeout=2, rendition='thumb')
+    assert next_seq > seq
+    assert service.get_frame(0, timeout=2)[0] >= 1
+
+
+def test_new_viewer_waits_for_fresh_frame(service):
+    seq, _ = service.get_frame(0, timeout=2, rendition='thumb')
+    time.sleep(0.5)
+    assert not service.watched
+    idle_seq = service._channels['thumb'].seq
+
+    start = time.monotonic()
+    seq, jpeg = service.get_frame(0, timeout=2, rendition='thumb')
+    assert jpeg is not None
+    assert seq > idle_seq
+    assert time.monotonic() - start < 1
+
+
+def test_viewer_behind_skips_to_newest_frame():
+    service = BroadcastService('broadcast', next_frame)
+    service._running = True
+    for i in range(5):
+        service.publish(bytes([i]))
+    assert service.get_frame(1, timeout=0) == (5, bytes([4]))
+    assert service.skipped == 3
+    assert service.get_frame(5, timeout=0.01) == (5, None)
+
+
+def test_viewer_without_frame_gets_next_published_frame():
+    service = BroadcastService('broadcast', next_frame)
+    service._running = True
+    service.publish(b'old')
+    threading.Timer(0.05, service.publish, args=(b'new',)).start()
+    assert service.get_frame(0, timeout=2) == (2, b'new')
+    assert service.skipped == 0
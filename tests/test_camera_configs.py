@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+try:
+    from modules.services.camera_manager import _camera_configs
+    from modules.services.config_service import DEFAULT_PATHS
+except ImportError as e:
+    # the stream resolver needs pafy and its youtube-dl backend
+    pytest.skip("camera manager not importable: {}".format(e), allow_module_level=True)
+
+
+def test_single_camera_keeps_configuration():
+    assert _camera_configs({'CAM_STREAM': '0', 'DPM': '20'}) == [{'CAM_STREAM': '0', 'DPM': '20'}]
+
+
+def test_cameras_override_top_level_values():
+    configs = _camera_configs({'DPM': '20', 'CAM_STREAMS': [{'NAME': 'north', 'CAM_STREAM': '0'},
+                                                            {'CAM_STREAM': '1', 'DPM': '10'}]})
+    assert [(c['NAME'], c['CAM_STREAM'], c['DPM']) for c in configs] == [('north', '0', '20'), ('cam1', '1', '10')]
+
+
+def test_later_cameras_get_their_own_paths():
+    configs = _camera_configs({'LOG_DB_PATH': 'logs/counts.db',
+                               'CAM_STREAMS': [{'NAME': 'a'}, {'NAME': 'b'}, {'NAME': 'c', 'MON_DIR': 'shots'}]})
+    assert [c['LOG_DB_PATH'] for c in configs] == ['logs/counts.db', 'logs/counts_b.db', 'logs/counts_c.db']
+    assert 'MON_DIR' not in configs[0]
+    root, ext = os.path.splitext(DEFAULT_PATHS['MON_DIR'])
+    assert configs[1]['MON_DIR'] == root + '_b' + ext
+    assert configs[2]['MON_DIR'] == 'shots'
+
+
+def test_default_paths_are_unique_per_camera():
+    configs = _camera_configs({'CAM_STREAMS': [{'NAME': 'a'}, {'NAME': 'b'}]})
+    for key in DEFAULT_PATHS:
+        assert len({c.get(key, DEFAULT_PATHS[key]) for c in configs}) == 2
@@ -0,0 +1,102 @@
+import pytest
+
+from modules.detectors import detections as dets
+from modules.services.count_aggregator import CountAggregator, minute_start
+
+CAR = dets.class_ids(['car'])[0]
+PERSON = dets.class_ids(['person'])[0]
+T0 = 1700000040.0  # start of a minute
+
+
+def frame(*class_ids, tracks=None):
+    detections = dets.create(list(class_ids), 0.9, [[0, 0, 1, 1]] * len(class_ids))
+    if tracks:
+        detections['track_id'] = [abs(t) for t in tracks]
+        detections['new_track'] = [t > 0 for t in tracks]
+    return detections
+
+
+def test_minute_start():
+    assert minute_start(T0) == T0
+    assert minute_start(T0 + 59.9) == T0
+
+
+def test_minute_is_not_flushed_before_it_ends():
+    aggregator = CountAggregator()
+    aggregator.add(frame(CAR), T0 + 1)
+    assert aggregator.flush(now=T0 + 59) == []
+
+
+def test_flush_averages_over_detection_frames():
+    aggregator = CountAggregator()
+    aggregator.add(frame(CAR, CAR, PERSON), T0 + 1)
+    aggregator.add(frame(CAR), T0 + 2)
+    aggregator.add(frame(), T0 + 3)
+    minute, = aggregator.flush(now=T0 + 60)
+    assert minute.time == T0
+    assert minute.frames == 3
+    assert minute.averages == pytest.approx({'car': 1.0, 'person': 1 / 3})
+    assert minute.uniques is None
+    assert aggregator.flush(now=T0 + 120) == []
+
+
+def test_later_detection_closes_minute():
+    aggregator = CountAggregator()
+    aggregator.add(frame(CAR), T0 + 1)
+    aggregator.add(frame(PERSON), T0 + 61)
+    aggregator.add(frame(PERSON), T0 + 185)
+    minutes = aggregator.flush(now=T0 + 185)
+    assert [m.time for m in minutes] == [T0, T0 + 60]
+    assert [m.averages for m in minutes] == [{'car': 1.0}, {'person': 1.0}]
+
+
+def test_final_flush_closes_current_minute():
+    aggregator = CountAggregator()
+    aggregator.add(frame(CAR), T0 + 1)
+    minute, = aggregator.flush(now=T0 + 2, final=True)
+    assert minute.time == T0
+
+
+def test_late_detections_count_in_current_minute():
+    aggregator = CountAggregator()
+    aggregator.add(frame(CAR), T0 + 61)
+    aggregator.add(frame(PERSON), T0 + 1)
+    minute, = aggregator.flush(now=T0 + 120)
+    assert minute.time == T0 + 60
+    assert minute.frames == 2
+
+
+def test_uniques_count_new_tracks():
+    aggregator = CountAggregator()
+    aggregator.add(frame(CAR, PERSON, tracks=[1, 2]), T0 + 1)
+    aggregator.add(frame(CAR, PERSON, CAR, tracks=[-1, -2, 3]), T0 + 2)
+    minute, = aggregator.flush(now=T0 + 60)
+    assert minute.uniques == {'car': 2, 'person': 1}
+    assert minute.averages == {'car': 1.5, 'person': 1.0}
+
+
+def test_sliding_windows():
+    aggregator = CountAggregator()
+    for m in range(20):
+        aggregator.add(frame(*[CAR] * (m + 1)), T0 + m * 60 + 1)
+    now = T0 + 20 * 60 + 1
+    aggregator.flush(now=now)
+
+    summary = aggregator.windows_summary(now=now)
+    assert sorted(summary) == ['15m', '1m', '5m']
+    assert summary['1m']['frames'] == 1
+    assert summary['1m']['averages'] == {'car': 20.0}
+    assert summary['5m']['start'] == T0 + 15 * 60
+    assert summary['5m']['averages'] == {'car': 18.0}
+    assert summary['15m']['frames'] == 15
+    assert summary['15m']['averages'] == {'car': 13.0}
+    assert summary['15m']['uniques'] is None
+
+
+def test_windows_skip_minutes_without_detections():
+    aggregator = CountAggregator()
+    aggregator.add(frame(CAR), T0 + 1)
+    aggregator.flush(now=T0 + 60)
+    assert aggregator.window(1, now=T0 + 61).frames == 1
+    assert aggregator.window(1, now=T0 + 121).frames == 0
+    assert aggregator.window(5, now=T0 + 121).averages == {'car': 1.0}
@@ -0,0 +1,59 @@
+import numpy as np
+
+from modules.detectors import detections as dets
+from modules.detectors.detector_stub import DetectorStub
+from modules.detectors.regions import Crop
+from modules.services.inference_service import InferenceRequest, _detect_batch
+
+
+class RecordingDetector(DetectorStub):
+    """Stub detector that records the objects of each call"""
+
+    def __init__(self):
+        DetectorStub.__init__(self, 'stub', '0')
+        self.calls = []
+
+    def detect_batch(self, frames: list, det_objs: set = None) -> list:
+        self.calls.append((len(frames), det_objs))
+        return DetectorStub.detect_batch(self, frames, det_objs)
+
+
+def request(source, frame_num, det_objs, regions=None):
+    return InferenceRequest(source, frame_num, np.zeros((100, 200, 3), np.uint8), det_objs, None, None, regions)
+
+
+def names(detections):
+    return sorted(dets.count(detections))
+
+
+def test_none_detects_every_object():
+    detector = RecordingDetector()
+    (_, _, detections, latency), = _detect_batch(detector, [request('a', 1, None)])
+    assert detector.calls == [(1, None)]
+    assert names(detections) == ['car', 'person']
+    assert latency is not None
+
+
+def test_empty_set_detects_no_object():
+    detector = RecordingDetector()
+    (_, _, detections, latency), = _detect_batch(detector, [request('a', 1, set())])
+    assert detector.calls == [(1, set())]
+    assert len(detections) == 0
+    assert latency is not None
+
+
+def test_requests_are_grouped_by_objects():
+    detector = RecordingDetector()
+    results = _detect_batch(detector, [request('a', 1, {'car'}), request('b', 1, set()),
+                                       request('c', 1, None), request('a', 2, {'car'})])
+    assert sorted(detector.calls, key=str) == sorted([(2, {'car'}), (1, set()), (1, None)], key=str)
+    assert [(s, n, names(d)) for s, n, d, _ in results] == [('a', 1, ['car']), ('b', 1, []),
+                                                             ('c', 1, ['car', 'person']), ('a', 2, ['car'])]
+
+
+def test_tiles_are_detected_with_the_frames_and_merged():
+    detector = RecordingDetector()
+    tiles = [Crop(0, 0, 100, 100, None), Crop(100, 0, 200, 100, None)]
+    results = _detect_batch(detector, [request('a', 1, None, tiles), request('b', 1, None)])
+    assert detector.calls == [(3, None)]
+    assert [len(d) for _, _, d, _ in results] == [4, 2]
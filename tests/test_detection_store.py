@@ -0,0 +1,122 @@
+import datetime
+
+import pytest
+
+from modules.storage.detection_store import DetectionStore
+
+# a recent hour, well inside the retention period
+HOUR = datetime.datetime.now().replace(minute=0, second=0, microsecond=0) - datetime.timedelta(days=2)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DetectionStore(str(tmp_path / 'detections.db'))
+    yield store
+    store.close()
+
+
+def minutes(start, n):
+    return [start + datetime.timedelta(minutes=m) for m in range(n)]
+
+
+def write_log(path, start, n):
+    with open(str(path), 'w') as fp:
+        fp.write("date_time|day_minute|object|count\n")
+        for t in minutes(start, n):
+            fp.write("{}|{}|car|2.0\n".format(t.strftime("%Y-%m-%d %H:%M:%S"), t.hour * 60 + t.minute))
+    return str(path)
+
+
+def test_rows_are_buffered_until_flush(store):
+    store.add(HOUR, {'car': 1.5})
+    assert store.query(HOUR, HOUR + datetime.timedelta(hours=1)) == []
+    store.flush()
+    assert store.query(HOUR, HOUR + datetime.timedelta(hours=1)) == [(HOUR, 'car', 1.5)]
+
+
+def test_query_filters_range_and_objects(store):
+    for t in minutes(HOUR, 10):
+        store.add(t, {'car': 1.0, 'person': 2.0})
+    store.flush()
+    rows = store.query(HOUR + datetime.timedelta(minutes=2), HOUR + datetime.timedelta(minutes=4), {'person'})
+    assert [(t.minute, o) for t, o, _ in rows] == [(2, 'person'), (3, 'person')]
+    assert store.totals(HOUR, HOUR + datetime.timedelta(hours=1)) == {'car': 10.0, 'person': 20.0}
+
+
+def test_series_reads_rollups(store):
+    for t in minutes(HOUR, 90):
+        store.add(t, {'car': 1.0}, uniques={'car': 1})
+    store.flush()
+    end = HOUR + datetime.timedelta(hours=2)
+
+    quarters = store.series(15, HOUR, end)
+    assert len(quarters) == 6
+    assert quarters[0] == (HOUR, 'car', 15.0, 15, 15)
+
+    hours = store.series(60, HOUR, end)
+    assert [(t, c, n) for t, _, c, n, _ in hours] == [(HOUR, 60.0, 60), (HOUR + datetime.timedelta(hours=1), 30.0, 30)]
+
+    day, = store.series(1440, HOUR, end)
+    assert day[2:] == (90.0, 90, 90)
+    assert len(store.series(1, HOUR, end, {'car'})) == 90
+
+    with pytest.raises(ValueError):
+        store.series(5, HOUR, end)
+
+
+def test_series_flushes_pending_rows(store):
+    store.add(HOUR, {'car': 3.0})
+    assert store.series(60, HOUR, HOUR + datetime.timedelta(hours=1))[0][2] == 3.0
+
+
+def test_rows_are_stored_once(store):
+    store.add(HOUR, {'car': 1.0})
+    store.flush()
+    store.add(HOUR, {'car': 5.0})
+    store.flush()
+    assert store.query(HOUR, HOUR + datetime.timedelta(minutes=1)) == [(HOUR, 'car', 1.0)]
+    assert store.series(60, HOUR, HOUR + datetime.timedelta(hours=1))[0][2:4] == (1.0, 1)
+
+
+def test_retention_keeps_rollups(tmp_path):
+    store = DetectionStore(str(tmp_path / 'detections.db'), retention_days=90)
+    old = HOUR - datetime.timedelta(days=100)
+    store.add(old, {'car': 1.0})
+    store.add(HOUR, {'car': 1.0})
+    store.flush()
+    assert store.query(old, old + datetime.timedelta(minutes=1)) == []
+    assert store.series(60, old, old + datetime.timedelta(hours=1))[0][2:4] == (1.0, 1)
+    assert len(store.query(HOUR, HOUR + datetime.timedelta(minutes=1))) == 1
+    store.close()
+
+
+def test_import_is_idempotent(store, tmp_path):
+    path = write_log(tmp_path / 'camlog.txt', HOUR, 30)
+    assert store.import_text_log(path) == 30
+    assert store.import_text_log(path) == 0
+    assert store.totals(HOUR, HOUR + datetime.timedelta(hours=1)) == {'car': 60.0}
+    assert store.series(60, HOUR, HOUR + datetime.timedelta(hours=1))[0][2:4] == (60.0, 30)
+
+
+def test_import_keeps_history_past_retention(tmp_path):
+    store = DetectionStore(str(tmp_path / 'detections.db'), retention_days=90)
+    old = HOUR - datetime.timedelta(days=100)
+    path = write_log(tmp_path / 'camlog.txt', old, 30)
+    assert store.import_text_log(path) == 30
+    assert store.series(60, old, old + datetime.timedelta(hours=1))[0][2:4] == (60.0, 30)
+
+    assert store.import_text_log(path) == 0
+    assert store.series(60, old, old + datetime.timedelta(hours=1))[0][2:4] == (60.0, 30)
+
+    # minutes appended to the log since are imported
+    write_log(tmp_path / 'camlog.txt', old, 45)
+    assert store.import_text_log(path) == 15
+    assert store.series(60, old, old + datetime.timedelta(hours=1))[0][2:4] == (90.0, 45)
+    store.close()
+
+
+def test_import_skips_bad_lines(store, tmp_path):
+    path = tmp_path / 'camlog.txt'
+    path.write_text("not a row\nbad date|0|car|1\n{}|0|car|1.0\n".format(HOUR.strftime("%Y-%m-%d %H:%M:%S")))
+    assert store.import_text_log(str(path)) == 1
+    assert store.import_text_log(str(tmp_path / 'missing.txt')) == 0
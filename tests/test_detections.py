@@ -0,0 +1,86 @@
+import numpy as np
+
+from modules.detectors import detections as dets
+
+PERSON = dets.class_ids(['person'])[0]
+CAR = dets.class_ids(['car'])[0]
+
+
+def test_coco_class_ids_follow_yolo_order():
+    assert PERSON == 0
+    assert CAR == 2
+    assert dets.class_name(CAR) == 'car'
+
+
+def test_register_classes_appends_new_names_once():
+    ids = dets.register_classes(['person', 'hard_hat'])
+    assert ids[0] == PERSON
+    assert ids[1] == len(dets.COCO_NAMES)
+    assert dets.class_name(ids[1]) == 'hard hat'
+    assert dets.register_classes(['hard hat'])[0] == ids[1]
+
+
+def test_create_fills_fields():
+    detections = dets.create([PERSON, CAR], [0.9, 0.5], [[0, 0, 10, 10], [5, 5, 20, 20]])
+    assert detections.dtype == dets.DETECTION_DTYPE
+    assert detections['class_id'].tolist() == [PERSON, CAR]
+    assert detections['box'][1].tolist() == [5, 5, 20, 20]
+    assert not detections['track_id'].any()
+    assert len(dets.empty()) == 0
+
+
+def test_dicts_round_trip():
+    dicts = [{'name': 'car', 'percentage_probability': 87.5, 'box_points': [1, 2, 3, 4]}]
+    detections = dets.from_dicts(dicts)
+    assert detections['class_id'][0] == CAR
+    assert np.isclose(detections['score'][0], 0.875)
+    assert dets.to_dicts(detections) == dicts
+    assert len(dets.from_dicts([])) == 0
+
+
+def test_to_dicts_adds_track_fields_of_tracked_detections():
+    detections = dets.create([PERSON], [0.5], [[0, 0, 1, 1]])
+    detections['track_id'] = 7
+    detections['new_track'] = True
+    d = dets.to_dicts(detections)[0]
+    assert d['track_id'] == 7 and d['new_track'] is True
+
+
+def test_select_by_score_and_class():
+    detections = dets.create([PERSON, CAR, CAR], [0.9, 0.4, 0.8], np.zeros((3, 4)))
+    assert dets.select(detections, min_score=0.5)['class_id'].tolist() == [PERSON, CAR]
+    assert dets.select(detections, classes={'car'})['score'].tolist() == [np.float32(0.4), np.float32(0.8)]
+    assert len(dets.select(detections, min_score=0.5, classes={'car', 'unknown'})) == 1
+    assert dets.contains(detections, {'person'})
+    assert not dets.contains(detections, {'dog'})
+    assert not dets.contains(dets.empty(), {'person'})
+
+
+def test_clip_and_offset():
+    detections = dets.create([PERSON], [0.5], [[-5, -5, 50, 30]])
+    moved = dets.offset(detections, 10, 20)
+    assert moved['box'][0].tolist() == [5, 15, 60, 50]
+    assert detections['box'][0].tolist() == [-5, -5, 50, 30]
+    dets.clip(moved, (40, 30))
+    assert moved['box'][0].tolist() == [5, 15, 30, 40]
+
+
+def test_iou():
+    boxes = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]])
+    assert np.allclose(dets.iou(boxes[0], boxes), [1, 1 / 3, 0])
+
+
+def test_nms_suppresses_overlaps_within_class_only():
+    detections = dets.create([CAR, CAR, PERSON], [0.6, 0.9, 0.5],
+                             [[0, 0, 10, 10], [1, 0, 11, 10], [0, 0, 10, 10]])
+    kept = dets.nms(detections, 0.5)
+    assert kept['score'].tolist() == [np.float32(0.9), np.float32(0.5)]
+    assert kept['class_id'].tolist() == [CAR, PERSON]
+
+
+def test_count_by_class_and_new_tracks():
+    detections = dets.create([CAR, CAR, PERSON], [0.5] * 3, np.zeros((3, 4)))
+    assert dets.count(detections) == {'person': 1, 'car': 2}
+    detections['new_track'] = [True, False, False]
+    assert dets.count(detections, new_tracks=True) == {'car': 1}
+    assert dets.count(dets.empty()) == {}
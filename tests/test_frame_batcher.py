@@ -0,0 +1,76 @@
+import threading
+import time
+
+from modules.services.inference_service import FrameBatcher
+
+
+def test_put_displaces_oldest_frame_of_full_source():
+    batcher = FrameBatcher(batch_size=2)
+    assert batcher.put('a', 1) is None
+    assert batcher.put('a', 2) is None
+    assert batcher.put('a', 3) == 1
+    assert batcher.pending == 2
+    assert batcher.get_batch(timeout=0) == [2, 3]
+
+
+def test_other_sources_are_not_displaced():
+    batcher = FrameBatcher(batch_size=1)
+    batcher.put('a', 'a1')
+    assert batcher.put('b', 'b1') is None
+    assert batcher.put('a', 'a2') == 'a1'
+    assert batcher.pending == 2
+
+
+def test_batches_are_filled_round_robin():
+    batcher = FrameBatcher(batch_size=2)
+    for item in ('a1', 'a2'):
+        batcher.put('a', item)
+    batcher.put('b', 'b1')
+    assert batcher.get_batch(timeout=0) == ['a1', 'b1']
+    assert batcher.get_batch(timeout=0) == ['a2']
+
+
+def test_next_batch_starts_with_next_source():
+    batcher = FrameBatcher(batch_size=1)
+    batcher.put('a', 'a1')
+    batcher.put('b', 'b1')
+    assert batcher.get_batch(timeout=0) == ['a1']
+    batcher.put('a', 'a2')
+    assert batcher.get_batch(timeout=0) == ['b1']
+    assert batcher.get_batch(timeout=0) == ['a2']
+
+
+def test_get_batch_waits_for_batch_to_fill():
+    batcher = FrameBatcher(batch_size=2, max_wait=1.0)
+    batcher.put('a', 1)
+    threading.Timer(0.05, batcher.put, args=('b', 2)).start()
+    start = time.monotonic()
+    assert batcher.get_batch(timeout=1) == [1, 2]
+    assert time.monotonic() - start < 0.9
+
+
+def test_get_batch_returns_partial_batch_after_max_wait():
+    batcher = FrameBatcher(batch_size=4, max_wait=0.05)
+    batcher.put('a', 1)
+    start = time.monotonic()
+    assert batcher.get_batch(timeout=1) == [1]
+    assert time.monotonic() - start >= 0.04
+
+
+def test_get_batch_times_out_empty():
+    assert FrameBatcher().get_batch(timeout=0.01) == []
+
+
+def test_discard_removes_pending_frames_of_source():
+    batcher = FrameBatcher(batch_size=2)
+    batcher.put('a', 1)
+    batcher.put('b', 2)
+    assert batcher.discard('a') == [1]
+    assert batcher.pending == 1
+    assert batcher.get_batch(timeout=0) == [2]
+
+
+def test_close_wakes_waiting_worker():
+    batcher = FrameBatcher()
+    threading.Timer(0.05, batcher.close).start()
+    assert batcher.get_batch(timeout=5) == []
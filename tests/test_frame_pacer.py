@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from modules.services.frame_pacer import FramePacer
+
+
+def elapsed(pacer, pts, droppable=True):
+    start = time.monotonic()
+    shown = pacer.pace(pts, droppable)
+    return shown, time.monotonic() - start
+
+
+def test_first_frame_is_delayed_by_latency():
+    shown, wait = elapsed(FramePacer(latency=0.05), 10.0)
+    assert shown
+    assert wait >= 0.04
+
+
+def test_frames_leave_at_capture_cadence():
+    pacer = FramePacer(latency=0.0)
+    start = time.monotonic()
+    for i in range(6):
+        assert pacer.pace(i * 0.02)
+    assert time.monotonic() - start == pytest.approx(0.1, abs=0.03)
+    assert pacer.fps == pytest.approx(50)
+    assert pacer.stats['shown'] == 6
+
+
+def test_late_frame_is_dropped_if_allowed():
+    pacer = FramePacer(latency=0.0, max_lag=1.0)
+    pacer.pace(0.0)
+    pacer.pace(0.01)
+    time.sleep(0.05)
+    assert not pacer.pace(0.02)
+    assert pacer.dropped == 1
+    assert pacer.pace(0.03, droppable=False)
+    assert pacer.dropped == 1
+
+
+def test_output_far_behind_resyncs():
+    pacer = FramePacer(latency=0.0, max_lag=0.05)
+    pacer.pace(0.0)
+    pacer.pace(0.01)
+    time.sleep(0.1)
+    assert pacer.pace(0.02)
+    assert pacer.resyncs == 1
+    shown, wait = elapsed(pacer, 0.03)
+    assert shown and wait >= 0.005
+
+
+def test_timestamp_discontinuities_resync():
+    pacer = FramePacer(latency=0.0, max_gap=2.0)
+    pacer.pace(5.0)
+    shown, wait = elapsed(pacer, 100.0)
+    assert shown and wait < 0.05
+    shown, wait = elapsed(pacer, 1.0)
+    assert shown and wait < 0.05
+    assert pacer.resyncs == 2
+
+
+def test_reset_starts_again_without_resync():
+    pacer = FramePacer(latency=0.0)
+    pacer.pace(5.0)
+    pacer.reset()
+    shown, wait = elapsed(pacer, 1.0)
+    assert shown and wait < 0.05
+    assert pacer.resyncs == 0
@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+
+from modules.services.frame_ring import FrameRing
+from modules.services.inference_service import _unmap_rings
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(3, (4, 4, 3), max_ready=2)
+    yield ring
+    ring.close()
+
+
+def test_frames_pass_in_publish_order(ring):
+    for num in (1, 2):
+        slot = ring.acquire(timeout=0)
+        ring.frame(slot)[:] = num
+        ring.set_meta(slot, num, 100.0 + num)
+        ring.publish(slot)
+    slot = ring.next_ready(timeout=0)
+    assert ring.num(slot) == 1
+    assert ring.time(slot) == 101.0
+    assert (ring.frame(slot) == 1).all()
+    ring.release(slot)
+    assert ring.free_count == 2
+
+
+def test_acquire_times_out_when_full(ring):
+    for _ in range(3):
+        assert ring.acquire(timeout=0) is not None
+    assert ring.acquire(timeout=0.01) is None
+
+
+def test_publish_drops_oldest_ready_slot(ring):
+    slots = [ring.acquire(timeout=0) for _ in range(3)]
+    for slot in slots:
+        ring.publish(slot)
+    assert ring.dropped == 1
+    assert ring.ready_count == 2
+    assert ring.next_ready(timeout=0) == slots[1]
+    assert ring.free_count == 1
+
+
+def test_retained_slot_is_freed_by_last_release(ring):
+    slot = ring.acquire(timeout=0)
+    ring.set_detections(slot, np.zeros(1))
+    ring.retain(slot)
+    ring.release(slot)
+    assert ring.free_count == 2
+    assert ring.detections(slot) is not None
+    ring.release(slot)
+    assert ring.free_count == 3
+    assert ring.detections(slot) is None
+
+
+def test_dropped_retained_slot_stays_held(ring):
+    slots = [ring.acquire(timeout=0) for _ in range(3)]
+    ring.retain(slots[0])
+    for slot in slots:
+        ring.publish(slot)
+    assert ring.free_count == 0
+    ring.release(slots[0])
+    assert ring.free_count == 1
+
+
+def test_attach_maps_same_frames(ring):
+    slot = ring.acquire(timeout=0)
+    ring.frame(slot)[:] = 7
+    frames = FrameRing.attach(ring.descriptor)
+    assert (frames[slot] == 7).all()
+
+
+def test_close_removes_file():
+    ring = FrameRing(1, (2, 2, 3))
+    path = ring.descriptor[0]
+    assert os.path.exists(path)
+    ring.close()
+    assert not os.path.exists(path)
+
+
+def test_worker_unmaps_replaced_and_closed_rings():
+    old, new, other = (FrameRing(1, (2, 2, 3)) for _ in range(3))
+    rings = {r.descriptor[0]: FrameRing.attach(r.descriptor) for r in (old, new, other)}
+    source_rings = {'a': new.descriptor[0], 'b': other.descriptor[0]}
+    _unmap_rings(rings, source_rings)
+    assert set(rings) == {new.descriptor[0], other.descriptor[0]}
+
+    other.close()
+    _unmap_rings(rings, source_rings)
+    assert set(rings) == {new.descriptor[0]}
+    assert source_rings == {'a': new.descriptor[0]}
+    old.close()
+    new.close()
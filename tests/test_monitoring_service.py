@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+import pytest
+
+from modules.detectors import detections as dets
+from modules.services.monitoring_service import MonitorService
+from modules.services.snapshot_writer import SnapshotWriter
+
+PERSON = dets.class_ids(['person'])[0]
+CAR = dets.class_ids(['car'])[0]
+
+
+@pytest.fixture
+def writer():
+    writer = SnapshotWriter(workers=1, queue_size=2, max_pixels=64 * 48)
+    writer.start()
+    yield writer
+    writer.close()
+
+
+def wait_written(writer, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while writer.backlog and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_monitored_objects_are_saved_while_running(writer, tmp_path):
+    monitor = MonitorService('monitor', 20, {'person'}, str(tmp_path), writer)
+    image = np.zeros((48, 64, 3), np.uint8)
+    frame_time = time.time()
+    monitor.evaluate(image, dets.create([PERSON], [0.9], [[1, 1, 10, 10]]), frame_time)
+    assert writer.backlog == 0 and not list(tmp_path.iterdir())
+
+    monitor.start()
+    monitor.evaluate(image, dets.create([CAR], [0.9], [[1, 1, 10, 10]]), frame_time)
+    monitor.evaluate(image, dets.create([PERSON], [0.9], [[1, 1, 10, 10]]), frame_time)
+    wait_written(writer)
+    assert [p.suffix for p in tmp_path.iterdir()] == ['.png']
+
+
+def test_stop_keeps_writer_for_next_service(writer, tmp_path):
+    processes = list(writer._processes)
+    monitor = MonitorService('monitor', 20, {'person'}, str(tmp_path), writer)
+    monitor.start()
+    monitor.stop()
+    assert writer.running
+
+    monitor = MonitorService('monitor', 20, {'person'}, str(tmp_path), writer)
+    monitor.start()
+    monitor.evaluate(np.zeros((48, 64, 3), np.uint8), dets.create([PERSON], [0.9], [[1, 1, 10, 10]]), time.time())
+    wait_written(writer)
+    assert writer._processes == processes
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_closed_writer_drops_snapshots(tmp_path):
+    writer = SnapshotWriter(workers=1, queue_size=1)
+    writer.start()
+    writer.close()
+    assert not writer.running
+    assert not writer.submit(np.zeros((4, 4, 3), np.uint8), str(tmp_path / 'a.png'))
+    assert writer.dropped == 1
@@ -0,0 +1,80 @@
+import numpy as np
+
+from modules.detectors import detections as dets
+from modules.tracking.object_tracker import ObjectTracker
+
+CAR = dets.class_ids(['car'])[0]
+PERSON = dets.class_ids(['person'])[0]
+
+
+def frame(*objects):
+    """Detections of (class_id, box) pairs"""
+    return dets.create([o[0] for o in objects], 0.9, [o[1] for o in objects])
+
+
+def test_new_objects_get_new_flagged_tracks():
+    tracker = ObjectTracker()
+    tracked = tracker.update(frame((CAR, [0, 0, 10, 10]), (CAR, [50, 50, 60, 60])), 0.0)
+    assert tracked['track_id'].tolist() == [1, 2]
+    assert tracked['new_track'].all()
+
+
+def test_overlapping_detection_keeps_track_and_is_flagged_once():
+    tracker = ObjectTracker()
+    tracker.update(frame((CAR, [0, 0, 10, 10])), 0.0)
+    tracked = tracker.update(frame((CAR, [2, 0, 12, 10])), 0.1)
+    assert tracked['track_id'].tolist() == [1]
+    assert not tracked['new_track'].any()
+    assert dets.count(tracked, new_tracks=True) == {}
+
+
+def test_distant_object_is_matched_by_centroid():
+    tracker = ObjectTracker(max_distance=1.5)
+    tracker.update(frame((CAR, [0, 0, 10, 10])), 0.0)
+    # no overlap, centroid 15 pixels away: within 1.5 diagonals of 14 pixels
+    assert tracker.update(frame((CAR, [15, 0, 25, 10])), 0.5)['track_id'].tolist() == [1]
+    # far beyond the predicted box
+    assert tracker.update(frame((CAR, [200, 200, 210, 210])), 1.0)['track_id'].tolist() == [2]
+
+
+def test_classes_are_not_matched_to_each_other():
+    tracker = ObjectTracker()
+    tracker.update(frame((CAR, [0, 0, 10, 10])), 0.0)
+    tracked = tracker.update(frame((PERSON, [0, 0, 10, 10])), 0.1)
+    assert tracked['track_id'].tolist() == [2]
+    assert tracked['new_track'].all()
+
+
+def test_each_track_matches_best_detection():
+    tracker = ObjectTracker()
+    tracker.update(frame((CAR, [0, 0, 10, 10]), (CAR, [20, 0, 30, 10])), 0.0)
+    tracked = tracker.update(frame((CAR, [19, 0, 29, 10]), (CAR, [1, 0, 11, 10])), 0.1)
+    assert tracked['track_id'].tolist() == [2, 1]
+
+
+def test_predict_moves_boxes_at_constant_velocity():
+    tracker = ObjectTracker()
+    tracker.update(frame((CAR, [0, 0, 10, 10])), 0.0)
+    tracker.update(frame((CAR, [10, 0, 20, 10])), 1.0)
+    predicted = tracker.predict(1.5)
+    assert predicted['track_id'].tolist() == [1]
+    assert np.array_equal(predicted['box'][0], [15, 0, 25, 10])
+    # the velocity carries the track to a detection it no longer overlaps unmoved
+    assert tracker.update(frame((CAR, [20, 0, 30, 10])), 2.0)['track_id'].tolist() == [1]
+
+
+def test_tracks_expire_after_max_age():
+    tracker = ObjectTracker(max_age=2.0)
+    tracker.update(frame((CAR, [0, 0, 10, 10])), 0.0)
+    assert len(tracker.predict(2.0)) == 1
+    assert len(tracker.predict(2.1)) == 0
+    tracked = tracker.update(frame((CAR, [0, 0, 10, 10])), 2.2)
+    assert tracked['track_id'].tolist() == [2]
+
+
+def test_reset_forgets_tracks():
+    tracker = ObjectTracker()
+    tracker.update(frame((CAR, [0, 0, 10, 10])), 0.0)
+    tracker.reset()
+    assert tracker.tracks == []
+    assert tracker.update(frame((CAR, [0, 0, 10, 10])), 0.1)['new_track'].all()
@@ -0,0 +1,66 @@
+import pytest
+
+from modules.services.rate_controller import DetectionRateController
+
+
+def converge(controller, latency, queue_depth=0, n=100):
+    for _ in range(n):
+        controller.update(latency, queue_depth)
+    return controller.interval
+
+
+def test_initial_rate_is_clamped():
+    assert DetectionRateController(dpm=30).interval == 2.0
+    assert DetectionRateController(dpm=600, max_dpm=120).dpm == 120
+    assert DetectionRateController(dpm=0.1, min_dpm=1).interval == 60
+
+
+def test_budget_mode_targets_share_of_worker_time():
+    controller = DetectionRateController(dpm=30, max_dpm=600, budget=0.5)
+    assert controller.mode == 'budget'
+    assert converge(controller, 0.2) == pytest.approx(0.4)
+    assert controller.p50 == pytest.approx(0.2)
+
+
+def test_freshness_mode_targets_detection_age():
+    controller = DetectionRateController(dpm=30, freshness=1.0)
+    assert controller.mode == 'freshness'
+    assert converge(controller, 0.2) == pytest.approx(0.8)
+    # a detector slower than half the freshness runs back to back
+    controller = DetectionRateController(dpm=30, freshness=1.0)
+    assert converge(controller, 0.7) == pytest.approx(0.7)
+
+
+def test_interval_moves_gradually():
+    controller = DetectionRateController(dpm=30, budget=0.5, gain=0.3)
+    controller.update(0.2, 0)
+    assert controller.interval == pytest.approx(2.0 + 0.3 * (0.4 - 2.0))
+
+
+def test_queued_frames_back_off():
+    controller = DetectionRateController(dpm=60, budget=0.5)
+    controller.update(0.1, 3)
+    assert controller.interval == pytest.approx(1.0 + 0.3 * (1.5 - 1.0))
+    assert controller.queue_depth == 3
+    assert converge(controller, 0.1, queue_depth=3) == 60
+
+
+def test_interval_is_kept_within_limits():
+    controller = DetectionRateController(dpm=30, min_dpm=6, max_dpm=60)
+    assert converge(controller, 0.01) == 1.0
+    assert converge(controller, 100) == 10.0
+
+
+def test_failed_detections_only_update_queue_depth():
+    controller = DetectionRateController(dpm=30)
+    controller.update(None, 2)
+    assert controller.interval == 2.0
+    assert controller.queue_depth == 2
+
+
+def test_setting_dpm_restarts_from_rate():
+    controller = DetectionRateController(dpm=30)
+    converge(controller, 0.2)
+    controller.dpm = 10
+    assert controller.interval == 6.0
+    assert controller.state['dpm'] == 10
@@ -0,0 +1,79 @@
+import numpy as np
+
+from modules.detectors import detections as dets
+from modules.detectors import regions
+
+CAR = dets.class_ids(['car'])[0]
+PERSON = dets.class_ids(['person'])[0]
+
+
+def test_parse_tiles():
+    assert regions.parse_tiles('2x1') == (2, 1)
+    assert regions.parse_tiles('3X2') == (3, 2)
+    assert regions.parse_tiles('0x1') == (1, 1)
+
+
+def test_single_tile_covers_frame():
+    assert regions.get_crops((480, 640, 3)) == [regions.Crop(0, 0, 640, 480, None)]
+
+
+def test_tiles_overlap_and_cover_frame():
+    crops = regions.get_crops((100, 200), tiles=(2, 1), overlap=0.2)
+    assert len(crops) == 2
+    left, right = crops
+    assert (left.x1, left.y1, left.y2) == (0, 0, 100)
+    assert right.x2 == 200
+    assert right.x1 < left.x2
+    assert (left.x2 - right.x1) / (left.x2 - left.x1) > 0.15
+
+
+def test_polygon_limits_crops_and_masks_pixels():
+    polygon = regions.parse_polygons([[[0, 0], [0.5, 0], [0.5, 0.5], [0, 0.5]]])
+    crops = regions.get_crops((100, 200), polygons=polygon, tiles=(2, 2))
+    assert all(c.x2 <= 101 and c.y2 <= 51 for c in crops)
+
+    triangle = regions.parse_polygons([[[0, 0], [100, 0], [0, 100]]])
+    crop, = regions.get_crops((100, 100), polygons=triangle)
+    assert crop.polygon is not None
+    image = regions.crop_frame(np.full((100, 100, 3), 255, np.uint8), crop)
+    assert image[5, 5].all()
+    assert not image[95, 95].any()
+
+
+def test_crops_outside_polygon_are_skipped():
+    polygon = regions.parse_polygons([[[0, 0], [40, 0], [40, 40], [0, 40]]])
+    crops = regions.get_crops((100, 200), polygons=polygon, tiles=(1, 1))
+    assert crops == [regions.Crop(0, 0, 41, 41, None)]
+
+
+def test_merge_maps_tiles_to_frame_coordinates():
+    crops = [regions.Crop(0, 0, 60, 100, None), regions.Crop(40, 0, 100, 100, None)]
+    tiles = [dets.create([CAR], [0.8], [[0, 0, 10, 10]]),
+             dets.create([PERSON], [0.7], [[10, 10, 20, 20]])]
+    merged = regions.merge_detections(tiles, crops)
+    assert merged['box'].tolist() == [[0, 0, 10, 10], [50, 10, 60, 20]]
+
+
+def test_merge_joins_object_cut_by_tile_border():
+    crops = [regions.Crop(0, 0, 60, 100, None), regions.Crop(40, 0, 100, 100, None)]
+    # the car lies in the overlap of the tiles, cut at 40 in the right tile
+    tiles = [dets.create([CAR], [0.6], [[36, 10, 58, 40]]),
+             dets.create([CAR], [0.9], [[0, 12, 20, 40]])]
+    merged = regions.merge_detections(tiles, crops)
+    assert len(merged) == 1
+    assert np.isclose(merged['score'][0], 0.9)
+    assert merged['box'][0].tolist() == [36, 10, 60, 40]
+
+
+def test_merge_keeps_overlapping_objects_of_other_classes():
+    crops = [regions.Crop(0, 0, 60, 100, None), regions.Crop(40, 0, 100, 100, None)]
+    tiles = [dets.create([CAR], [0.6], [[40, 10, 60, 40]]),
+             dets.create([PERSON], [0.9], [[0, 10, 20, 40]])]
+    assert len(regions.merge_detections(tiles, crops)) == 2
+
+
+def test_merge_skips_failed_tiles():
+    crops = [regions.Crop(0, 0, 60, 100, None), regions.Crop(40, 0, 100, 100, None)]
+    merged = regions.merge_detections([None, dets.create([CAR], [0.5], [[0, 0, 5, 5]])], crops)
+    assert merged['box'].tolist() == [[40, 0, 45, 5]]
+    assert len(regions.merge_detections([None, None], crops)) == 0
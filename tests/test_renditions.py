@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+
+from modules.services import renditions
+from modules.services.renditions import Rendition, RenditionSelector
+
+LADDER = renditions.DEFAULT_RENDITIONS
+
+
+def test_parse_renditions_sorts_largest_first():
+    ladder = renditions.parse_renditions({'thumb': {'width': 320, 'quality': 60},
+                                          'full': {'quality': 95},
+                                          'medium': {'width': 640, 'quality': 150}})
+    assert ladder == [Rendition('full', 0, 95), Rendition('medium', 640, 100), Rendition('thumb', 320, 60)]
+    assert renditions.parse_renditions(None) == LADDER
+    assert renditions.parse_renditions([('small', 160, 50)]) == [Rendition('small', 160, 50)]
+
+
+def test_encode_scales_down_only():
+    frame = np.zeros((480, 640, 3), np.uint8)
+    scaled = {}
+    image = cv2.imdecode(np.frombuffer(renditions.encode(frame, Rendition('thumb', 320, 60), scaled), np.uint8),
+                         cv2.IMREAD_COLOR)
+    assert image.shape == (240, 320, 3)
+    assert scaled[320].shape == (240, 320, 3)
+    image = cv2.imdecode(np.frombuffer(renditions.encode(frame, Rendition('big', 1920, 60)), np.uint8),
+                         cv2.IMREAD_COLOR)
+    assert image.shape == (480, 640, 3)
+
+
+def test_selector_starts_at_requested_rendition():
+    assert RenditionSelector(LADDER).rendition == 'full'
+    assert RenditionSelector(LADDER, 'medium').rendition == 'medium'
+    assert RenditionSelector(LADDER, 'unknown').requested == 'full'
+
+
+def test_selector_steps_down_when_viewer_falls_behind():
+    downgrades = []
+    selector = RenditionSelector(LADDER, window=10, on_downgrade=lambda: downgrades.append(1))
+    names = [selector.update(missed=1) for _ in range(10)]
+    assert names[:4] == ['full'] * 4
+    assert names[4] == 'medium'
+    assert names[-1] == 'thumb'
+    assert len(downgrades) == 2
+    # the bottom of the ladder is kept
+    for _ in range(10):
+        assert selector.update(missed=1) == 'thumb'
+
+
+def test_selector_keeps_rendition_with_few_missed_frames():
+    selector = RenditionSelector(LADDER, window=10, max_missed=0.3)
+    for i in range(100):
+        assert selector.update(missed=1 if i % 4 == 0 else 0) == 'full'
+
+
+def test_selector_recovers_up_to_requested_rendition():
+    selector = RenditionSelector(LADDER, 'medium', window=10, recover=3)
+    for _ in range(5):
+        selector.update(missed=1)
+    assert selector.rendition == 'thumb'
+    names = [selector.update(missed=0) for _ in range(60)]
+    assert names[28] == 'thumb'
+    assert names[29] == 'medium'
+    assert names[-1] == 'medium'
+
+
+def test_selector_waits_longer_after_failed_step_up():
+    selector = RenditionSelector(LADDER, window=10, recover=1)
+    for _ in range(5):
+        selector.update(missed=1)
+    assert selector.rendition == 'medium'
+    for _ in range(10):
+        selector.update(missed=0)
+    assert selector.rendition == 'full'
+    for _ in range(5):
+        selector.update(missed=1)
+    assert selector.rendition == 'medium'
+    for _ in range(10):
+        selector.update(missed=0)
+    assert selector.rendition == 'medium'
+    for _ in range(10):
+        selector.update(missed=0)
+    assert selector.rendition == 'full'
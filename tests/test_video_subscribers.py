@@ -0,0 +1,92 @@
+import time
+
+from modules.services.video_subscribers import VideoSubscribers
+
+
+class FakeSocketIO:
+    """Records emitted messages and their acknowledgement callbacks"""
+
+    def __init__(self, fail=()):
+        self.emitted = []
+        self.fail = set(fail)
+
+    def emit(self, event, message, room=None, callback=None):
+        if room in self.fail:
+            raise IOError("disconnected")
+        self.emitted.append((event, message, room, callback))
+
+    def rooms(self):
+        return [room for _, _, room, _ in self.emitted]
+
+
+def test_send_pushes_frame_to_each_client():
+    socketio = FakeSocketIO()
+    subscribers = VideoSubscribers(socketio, 'cam')
+    subscribers.subscribe('a')
+    subscribers.subscribe('b')
+    subscribers.send(1, b'jpeg', {'objects': []})
+    assert sorted(socketio.rooms()) == ['a', 'b']
+    event, message, _, _ = socketio.emitted[0]
+    assert event == 'video_frame'
+    assert message == {'objects': [], 'camera': 'cam', 'seq': 1, 'image': b'jpeg'}
+    assert subscribers.count == 2
+    assert subscribers.sent == 2
+
+
+def test_slow_client_is_dropped_without_holding_up_others():
+    socketio = FakeSocketIO()
+    subscribers = VideoSubscribers(socketio, 'cam', max_in_flight=2)
+    subscribers.subscribe('slow')
+    subscribers.subscribe('fast')
+    for seq in range(1, 6):
+        subscribers.send(seq, b'', {})
+        for _, message, room, callback in socketio.emitted:
+            if room == 'fast' and message['seq'] == seq:
+                callback()
+    assert socketio.rooms().count('fast') == 5
+    assert socketio.rooms().count('slow') == 2
+    assert subscribers.dropped == 3
+
+
+def test_ack_frees_slot():
+    socketio = FakeSocketIO()
+    subscribers = VideoSubscribers(socketio, 'cam', max_in_flight=1)
+    subscribers.subscribe('a')
+    subscribers.send(1, b'', {})
+    subscribers.send(2, b'', {})
+    subscribers.ack('a', 1)
+    subscribers.send(3, b'', {})
+    assert [m['seq'] for _, m, _, _ in socketio.emitted] == [1, 3]
+    assert subscribers.dropped == 1
+
+
+def test_unacknowledged_frames_time_out():
+    socketio = FakeSocketIO()
+    subscribers = VideoSubscribers(socketio, 'cam', max_in_flight=1, ack_timeout=0.01)
+    subscribers.subscribe('a')
+    subscribers.send(1, b'', {})
+    time.sleep(0.02)
+    subscribers.send(2, b'', {})
+    assert [m['seq'] for _, m, _, _ in socketio.emitted] == [1, 2]
+
+
+def test_failed_client_is_unsubscribed():
+    socketio = FakeSocketIO(fail=['gone'])
+    subscribers = VideoSubscribers(socketio, 'cam')
+    subscribers.subscribe('gone')
+    subscribers.subscribe('a')
+    subscribers.send(1, b'', {})
+    assert subscribers.count == 1
+    assert socketio.rooms() == ['a']
+
+
+def test_unsubscribe_stops_frames():
+    socketio = FakeSocketIO()
+    subscribers = VideoSubscribers(socketio, 'cam')
+    subscribers.subscribe('a')
+    subscribers.unsubscribe('a')
+    subscribers.unsubscribe('a')
+    subscribers.ack('a', 1)
+    subscribers.send(1, b'', {})
+    assert socketio.emitted == []
+    assert subscribers.count == 0
@@ -1,14 +1,16 @@
 #!/usr/bin/env python
 import os
-import time
+import atexit
+import json
+import datetime
 import logging
 
-from flask import Flask, render_template, Response
+from flask import Flask, render_template, Response, request, jsonify, abort
 from flask_socketio import SocketIO
-import cv2
 
+from modules.services.camera_manager import CameraManager
 from modules.services.service_manager import ServiceManager
-from modules.timers.elapsed_time import ElapsedTime
+from modules.services.metrics import METRICS
 
 
 logger = logging.getLogger('app')
@@ -27,9 +29,23 @@ if not os.getenv("FLASK_APP"):
 
 socketio = SocketIO(app)
 
-# setup a service manager
+# setup a service manager for each camera
 config_file = os.getenv("CONFIG_FILE")
-sm = ServiceManager(socketio, config_file)
+cm = CameraManager(socketio, config_file)
+atexit.register(cm.close)  # let the snapshot writers finish their queued images
+
+
+def get_sm(camera: str = None) -> ServiceManager:
+    """
+    Returns the ServiceManager of the camera named in the argument or the
+    'cam' query argument.  The first camera is used if none is named.
+    """
+    if camera is None:
+        camera = request.args.get('cam')
+    sm = cm.get(camera)
+    if sm is None:
+        abort(404)
+    return sm
 
 
 @app.route('/')
@@ -37,87 +53,92 @@ def index():
     """
     Video streaming home page.
     """
-    if not sm.all_running:
-        sm.start_all_services()
+    if not cm.all_running:
+        cm.start_all_services()
+    sm = get_sm()
     return render_template('index.html',
+                           camera=sm.camera,
+                           cameras=cm.cameras,
+                           transport=request.args.get('transport', 'mjpeg'),
+                           quality=request.args.get('quality'),
                            trained_objs=sm.get_trained_objects(),
                            mon_objs=sm.get_monitored_objects(),
-                           det_objs=sm.get_detected_objects(),
-                           base_delay=sm.base_delay)
+                           det_objs=sm.get_detected_objects())
 
 
-def gen():
-    """Video streaming generator function."""
+def gen(sm: ServiceManager, rendition: str = None):
+    """
+    Video streaming generator function.
+    Frames are encoded once per rendition by the broadcast service and
+    shared with all viewers.  A viewer that falls behind skips to the
+    newest frame, and is switched to a smaller rendition if it keeps
+    falling behind.
+    """
 
     logger.info("Started display loop!")
-    elapsed_time = ElapsedTime()
+    selector = sm.get_rendition_selector(rendition)
+    rendition = selector.rendition
+    seq = 0
 
     while sm.all_running:
 
-        # micro-nap until the display rate is reached
-        sleep_time = sm.base_delay
-        print("SLEEPING {:04} {}              ".format(sleep_time, sm.get_queue_size()), end='\r')
-        time.sleep(sleep_time)
-        # print("DONE SLEEPING               ", end='\r')
+        last_seq = seq
+        seq, frame = sm.get_encoded_frame(seq, rendition=rendition)
 
-        success, frame = sm.get_frame()
-
-        # if queue was empty, skip
-        if not success:
-            print("EMPTY QUEUE               ", end='\r')
+        # no new frame before the timeout, check again
+        if frame is None:
             continue
 
-        # convert to jpeg
-        print("CONVERT TO JPEG         ", end='\r')
-        frame = cv2.imencode('.jpg', frame)[1].tobytes()
+        # frames of the rendition published since the last one were missed
+        if selector.update(seq - last_seq - 1 if last_seq else 0) != rendition:
+            logger.info("{}: video feed switched from '{}' to '{}'".format(sm.camera, rendition,
+                                                                         selector.rendition))
+            rendition = selector.rendition
+            seq = 0
 
-        print("YIELD              ", end='\r')
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        print("YIELDED              ", end='\r')
 
 
 @app.route('/video_feed')
-def video_feed():
-    """Video streaming route. Put this in the src attribute of an img tag."""
-    return Response(gen(),
+@app.route('/video_feed/<cam>')
+def video_feed(cam: str = None):
+    """
+    Video streaming route. Put this in the src attribute of an img tag.
+    Optional query arguments:
+        quality    - name of a rendition, e.g. 'thumb'. Default is the largest.
+    """
+    sm = get_sm(cam)
+    quality = request.args.get('quality')
+    if quality is not None and not sm.has_rendition(quality):
+        abort(404)
+    return Response(gen(sm, quality),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
 @app.route('/toggle_stream')
 def toggle_stream():
     """
-    Toggle the streaming display.  Logging and monitoring should continue.
+    Toggle the streaming display.  Capture, detection, logging and
+    monitoring continue.
     :return: None
     """
-    sm.toggle_all()
+    sm = get_sm()
+    sm.toggle("broadcast")
     return '', 204
 
 
 @app.route('/toggle_thread/<thread>')
 def toggle_thread(thread: str):
     """Toggle running status of thread name from argument"""
+    sm = get_sm()
     sm.toggle(thread)
     return '', 204
 
 
-@app.route('/change_delay/<direction>')
-def change_delay(direction: str):
-
-    if direction == 'increase':
-        sm.base_delay += .002
-        logger.info(f"new delay: {sm.base_delay}")
-
-    if direction == 'decrease':
-        sm.base_delay = max(0.0, sm.base_delay - .002)
-        logger.info(f"new delay: {sm.base_delay}")
-
-    socketio.emit('base_delay_update', sm.base_delay)
-    return '', 204
-
-
 @app.route('/toggle_monitem/<log_object>')
 def toggle_monitem(log_object: str):
+    sm = get_sm()
     logger.info("MONITOR LOGITEM UPDATE: {}".format(log_object))
     if sm.is_monitored(log_object):
         sm.del_mon_obj(log_object)
@@ -128,6 +149,7 @@ def toggle_monitem(log_object: str):
 
 @app.route('/toggle_detitem/<log_object>')
 def toggle_detitem(log_object: str):
+    sm = get_sm()
     logger.info("DETECTION LOGITEM UPDATE: {}".format(log_object))
     if sm.is_detected(log_object):
         sm.del_det_obj(log_object)
@@ -136,6 +158,103 @@ def toggle_detitem(log_object: str):
     return '', 204
 
 
+# resolution name -> (bucket size in minutes, default range)
+STATS_RESOLUTIONS = {'1m': (1, datetime.timedelta(hours=1)),
+                     '15m': (15, datetime.timedelta(days=1)),
+                     '1h': (60, datetime.timedelta(days=7)),
+                     '1d': (1440, datetime.timedelta(days=30))}
+
+
+@app.route('/stats/live')
+def stats_live():
+    """
+    Counts per object over the last minutes, from the running counts of
+    the logging service.  Each window, e.g. '5m', covers that many whole
+    minutes before the current one.
+    Optional query arguments:
+        cam        - camera name. Default is the first camera.
+    """
+    sm = get_sm()
+    windows = {name: dict(w, start=datetime.datetime.fromtimestamp(w['start']).strftime("%Y-%m-%d %H:%M"))
+               for name, w in sm.get_count_windows().items()}
+    return jsonify(camera=sm.camera, windows=windows)
+
+
+@app.route('/stats/<resolution>')
+def stats(resolution: str):
+    """
+    Counts per object over a time range.
+    Resolution is one of '1m', '15m', '1h' or '1d'.
+    Optional query arguments:
+        start, end - ISO format local times, e.g. 2020-01-30T14:00. Default
+                     is a range that ends now and suits the resolution.
+        objects    - comma separated object names. Default is all objects.
+        cam        - camera name. Default is the first camera.
+    """
+    sm = get_sm()
+    if resolution not in STATS_RESOLUTIONS:
+        return jsonify(error="resolution must be one of: {}".format(', '.join(STATS_RESOLUTIONS))), 400
+    minutes, default_range = STATS_RESOLUTIONS[resolution]
+
+    try:
+        end = request.args.get('end')
+        end = datetime.datetime.strptime(end, "%Y-%m-%dT%H:%M") if end else datetime.datetime.now()
+        start = request.args.get('start')
+        start = datetime.datetime.strptime(start, "%Y-%m-%dT%H:%M") if start else end - default_range
+    except ValueError:
+        return jsonify(error="start and end must have the format YYYY-MM-DDTHH:MM"), 400
+
+    objects = request.args.get('objects')
+    objects = set(objects.split(',')) if objects else None
+
+    series = [{'time': t.strftime("%Y-%m-%d %H:%M"), 'object': o, 'count': round(c, 6), 'minutes': n,
+               'uniques': u}
+              for t, o, c, n, u in sm.get_count_series(minutes, start, end, objects)]
+
+    return jsonify(resolution=resolution,
+                   start=start.strftime("%Y-%m-%d %H:%M"),
+                   end=end.strftime("%Y-%m-%d %H:%M"),
+                   series=series)
+
+
+@app.route('/status')
+def status():
+    """
+    Readiness of the detector and of each camera.  The detector is
+    'loading' while it is loaded and warmed up, a camera's stream is
+    'pending' while it is resolved and tested, then either is 'ready'
+    or 'failed'.  The stream's 'capture' is 'streaming' while frames
+    come and 'reconnecting' after it was lost.  Answers 503 unless the
+    detector is ready and all cameras are streaming, for health checks.
+    """
+    cameras = cm.status
+    inference = cm.inference.status
+    ready = inference['state'] == 'ready' and all(c['stream']['state'] == 'ready' and
+                                                  c['stream']['capture']['state'] == 'streaming'
+                                                  for c in cameras.values())
+    return jsonify(ready=ready, inference=inference, cameras=cameras), 200 if ready else 503
+
+
+@app.route('/metrics')
+def metrics():
+    """
+    Counters, gauges and histograms of the pipeline stages of all cameras
+    in the Prometheus text format.
+    """
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+
+# seconds between metrics updates sent over the socket
+METRICS_EMIT_INTERVAL = 5
+
+
+def emit_metrics():
+    """Send a snapshot of all metrics over the socket every METRICS_EMIT_INTERVAL seconds"""
+    while True:
+        socketio.sleep(METRICS_EMIT_INTERVAL)
+        socketio.emit('metrics', json.dumps(METRICS.snapshot()), broadcast=True)
+
+
 @socketio.on('connect')
 def handle_startup():
     logger.info("Socket connection is established on server!")
@@ -146,7 +265,34 @@ def handle_message(info):
     logger.info("Web page available at: " + info)
 
 
+@socketio.on('video_subscribe')
+def video_subscribe(camera: str = None):
+    """
+    Push the raw frames of a camera, or of the first camera, to this
+    client as binary 'video_frame' messages with their detections.  The
+    client acknowledges each frame once it is drawn.
+    """
+    sm = cm.get(camera)
+    if sm is not None:
+        sm.subscribe_video(request.sid)
+
+
+@socketio.on('video_unsubscribe')
+def video_unsubscribe(camera: str = None):
+    sm = cm.get(camera)
+    if sm is not None:
+        sm.unsubscribe_video(request.sid)
+
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    for camera in cm.cameras:
+        cm.get(camera).unsubscribe_video(request.sid)
+
+
 if __name__ == '__main__':
-    sm.stop_all_services()  # stop all in case of flask restart
-    sm.add_all_services()  # services are added here and started when page is loaded
+    cm.stop_all_services()  # stop all in case of flask restart
+    cm.add_all_services()
+    cm.start_all_services()  # run headless; the display starts when a page is loaded
+    socketio.start_background_task(emit_metrics)
     socketio.run(app, host='0.0.0.0', port=5000)